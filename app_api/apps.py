@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AppApiConfig(AppConfig):
     name = 'app_api'
+
+    def ready(self):
+        # connects the signal receiver that stores the payloads of newly uploaded data sets
+        import app_api.materialize  # noqa: F401
+
+        if getattr(settings, 'GEOGRAPHY_PRELOAD', False):
+            # (after hda_privileged has loaded the geography they are built from)
+            from app_api.util import search
+            search.preload_search_indexes()
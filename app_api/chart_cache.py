@@ -0,0 +1,122 @@
+# Server-side cache of chart series payloads.
+#
+# Every overview page asks for the percentiles and points of each important indicator, so the
+# same few series (popular states, recent data sets) are built over and over. This keeps built
+# payloads in a Django cache, keyed by data set and location. Any cache backend works, including
+# the default local-memory cache and the file-based cache, so no separate cache server is needed.
+#
+# Payload keys include the data set's version, which has its modified_at time in it. Saving a
+# data set (which every upload does once its points are saved) changes modified_at, so payloads
+# built before the change are never read again, in any process, whatever the backend; they just
+# expire. A deleted data set has no version, so its payloads are never read again either.
+#
+# Hits and misses can be counted, to size the cache (CHART_CACHE_COUNT_HITS). Counting costs a
+# cache round trip per request, so it is off unless the setting turns it on, and with a
+# per-process backend (local memory) each process has its own counters.
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+# how long payloads are kept (in seconds), if the settings don't say otherwise
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+# cache keys for the hit and miss counters
+HITS_KEY = 'chart:hits'
+MISSES_KEY = 'chart:misses'
+
+
+def get_cache():
+    """
+    Returns the cache chart payloads are kept in, from the CHART_CACHE_ALIAS setting
+    """
+    return caches[getattr(settings, 'CHART_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    """
+    Returns how long chart payloads are kept, from the CHART_CACHE_TIMEOUT setting
+    """
+    return getattr(settings, 'CHART_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def counts_hits():
+    """
+    Whether hits and misses are counted, from the CHART_CACHE_COUNT_HITS setting
+    """
+    return getattr(settings, 'CHART_CACHE_COUNT_HITS', False)
+
+
+def _count(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the counter doesn't exist yet (or was evicted)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def payload_key(kind, data_set_id, version, location=''):
+    """
+    Builds the cache key for one chart payload
+
+    :param kind: which series, e.g. 'percentiles'
+    :param data_set_id: primary key of the data set
+    :param version: version (e.g. ETag) of the data set, which changes whenever it is saved
+    :param location: normalized query, e.g. 'state=AL'  (Default value = '')
+
+    """
+    # hashed, so any location and version make a short key that every backend accepts
+    digest = hashlib.sha1(f'{version}|{location}'.encode('utf-8')).hexdigest()
+    return f'chart:{kind}:{data_set_id}:{digest}'
+
+
+def get_or_build(kind, data_set_id, version, location, build):
+    """
+    Returns a cached chart payload, or builds and caches it if there isn't one
+
+    :param kind: which series, e.g. 'percentiles'
+    :param data_set_id: primary key of the data set
+    :param version: version (e.g. ETag) of the data set
+    :param location: normalized query, e.g. 'state=AL'
+    :param build: function () -> payload, called on a miss; exceptions are not cached
+
+    """
+    cache = get_cache()
+    key = payload_key(kind, data_set_id, version, location)
+    payload = cache.get(key)
+    if payload is not None:
+        if counts_hits():
+            _count(cache, HITS_KEY)
+        return payload
+
+    if counts_hits():
+        _count(cache, MISSES_KEY)
+    payload = build()
+    cache.set(key, payload, timeout=get_timeout())
+    return payload
+
+
+def get_stats():
+    """
+    Returns the number of cache hits and misses so far, for sizing the cache (both 0 unless
+    CHART_CACHE_COUNT_HITS is on)
+    """
+    cache = get_cache()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'counting': counts_hits(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else None,
+    }
+
+
+def reset_stats():
+    """
+    Sets the hit and miss counters back to zero
+    """
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
@@ -0,0 +1,74 @@
+import gzip
+import json
+import timeit
+
+from django.core.management import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import RequestFactory
+
+from app_api.views.chart import PercentileSeries, PointSeries
+from hda_privileged.models import Data_Set
+
+
+def build_payload(view_class, data_set_id, query):
+    # builds a series the way the endpoint does, minus the caching
+    view = view_class()
+    view.request = RequestFactory().get('/', query)
+    view.args = ()
+    view.kwargs = {}
+    return view.build_data(data_set_id)
+
+
+def serialize(payload):
+    # the same encoding JsonResponse uses
+    return json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = '''Compares the size and build/serialization time of the full and compact chart series
+    for one state (by default the state with the most counties).'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('-d', '--data-set', type=int, default=None,
+                            help='Data set ID (default: the most recent data set)')
+        parser.add_argument('-s', '--state', default='TX')
+        parser.add_argument('--digits', type=int, default=None,
+                            help='Decimal places for compact series (default: the setting)')
+        parser.add_argument('-r', '--repeat', type=int, default=5,
+                            help='Take the best of this many runs')
+
+    def best_time(self, func, repeat):
+        return min(timeit.Timer(func).repeat(repeat=repeat, number=1))
+
+    def handle(self, *args, **options):
+        data_set = (Data_Set.objects.filter(pk=options['data_set']).first() if options['data_set']
+                    else Data_Set.objects.order_by('-id').first())
+        if data_set is None:
+            raise CommandError('No data set to benchmark; try load_random_data_set first')
+
+        repeat = options['repeat']
+        compact = {'format': 'compact'}
+        if options['digits'] is not None:
+            compact['digits'] = options['digits']
+
+        cases = [
+            ('percentiles', PercentileSeries, {}),
+            ('points', PointSeries, {'state': options['state']}),
+        ]
+
+        self.stdout.write(f"Data set {data_set.id}, state {options['state']}, best of {repeat}")
+        self.stdout.write(f"{'series':<12} {'format':<8} {'bytes':>9} {'gzipped':>9} "
+                          f"{'build (ms)':>11} {'json (ms)':>10}")
+        for (name, view_class, query) in cases:
+            for (label, extra) in (('full', {}), ('compact', compact)):
+                params = dict(query, **extra)
+                payload = build_payload(view_class, data_set.id, params)
+                body = serialize(payload)
+
+                build = self.best_time(lambda: build_payload(view_class, data_set.id, params), repeat)
+                dump = self.best_time(lambda: serialize(payload), repeat)
+
+                self.stdout.write(
+                    f"{name:<12} {label:<8} {len(body):>9} {len(gzip.compress(body)):>9} "
+                    f"{build * 1000:>11.2f} {dump * 1000:>10.2f}"
+                )
@@ -0,0 +1,57 @@
+import timeit
+
+from django.core.management import BaseCommand
+
+from app_api.util import search
+from app_api.util.fuzzy_index import FuzzyIndex
+from hda_privileged.geography import get_geography
+from hda_privileged.models import US_County
+
+DEFAULT_QUERIES = ['c', 'mont', 'montgomery', 'montgommery', 'fairfax va', 'fairfx county va',
+                   'saint louis', 'st lou', 'zzzz']
+
+
+def database_search(query, limit):
+    # how the search results page used to find counties: a substring scan of the whole table
+    matches = US_County.objects.filter(search_str__icontains=query).order_by('state', 'name')
+    return list(matches.iterator())[:limit]
+
+
+class Command(BaseCommand):
+    help = '''Compares the latency of searching the full county list with the database
+    (substring match) and with the in-memory typo-tolerant index.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES,
+                            help='Queries to time (default: a mix of prefixes and misspellings)')
+        parser.add_argument('-l', '--limit', type=int, default=100,
+                            help='Results per query (default: 100, one search results page)')
+        parser.add_argument('-r', '--repeat', type=int, default=5,
+                            help='Take the best of this many runs')
+
+    def best_time(self, func, repeat, number=1):
+        return min(timeit.Timer(func).repeat(repeat=repeat, number=number)) / number
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        limit = options['limit']
+
+        get_geography()
+        build = self.best_time(lambda: FuzzyIndex(get_geography().counties, lambda c: c.search_str),
+                               repeat)
+        (counties, _) = search.get_search_indexes()
+        self.stdout.write(f"{len(counties)} counties, index built in {build * 1000:.1f} ms, "
+                          f"best of {repeat}")
+
+        self.stdout.write(f"{'query':<20} {'db (ms)':>9} {'found':>6} {'index (ms)':>11} {'found':>6}"
+                          f"  best match")
+        for query in options['queries']:
+            found_db = database_search(query, limit)
+            found = counties.search(query, limit)
+
+            db_time = self.best_time(lambda q=query: database_search(q, limit), repeat)
+            index_time = self.best_time(lambda q=query: counties.search(q, limit), repeat, number=10)
+
+            best = found[0].search_str if found else '-'
+            self.stdout.write(f"{query:<20} {db_time * 1000:>9.3f} {len(found_db):>6} "
+                              f"{index_time * 1000:>11.3f} {len(found):>6}  {best}")
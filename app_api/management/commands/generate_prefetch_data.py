@@ -1,58 +1,118 @@
-import argparse
+import gzip
+import hashlib
 import json
+import os
 
 from pathlib import Path
 
+from django.conf import settings
 from django.core.management import BaseCommand, CommandError
 
-from app_api.util import search
+from app_api.util import prefetch, search
 from hda_privileged.models import US_County, US_State
 
-def pathtype(value):
-    path = Path(value)
-    if not path.parent.exists():
-        raise argparse.ArgumentTypeError(f"Folder")
+# how many hex digits of the content hash go in bundle file names
+HASH_LENGTH = 12
+
+# the suffixes of the compressed copies written next to each bundle
+COMPRESSED_SUFFIXES = ['.gz']
+
 
 def county_data():
-    query = US_County.objects.all().order_by('state', 'name')
+    query = US_County.objects.all().order_by(*search.COUNTY_PREFETCH_ORDER)
     data = [search.datum_for_county(obj) for obj in query.iterator()]
     return data
 
+
 def state_data():
     query = US_State.objects.all().order_by('full')
     data = [search.datum_for_state(obj) for obj in query.iterator()]
     return data
 
+
 def indent_level(is_pretty):
     return 2 if is_pretty else None
 
+
 def separators(is_pretty):
     return (',', ': ') if is_pretty else (',', ':')
 
+
+def encode(data, is_pretty):
+    return json.dumps(
+        data,
+        indent=indent_level(is_pretty),
+        separators=separators(is_pretty),
+        sort_keys=is_pretty
+    ).encode('utf-8')
+
+
+def compress(body):
+    # fixed mtime, so the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def write_atomically(path, content):
+    # written to a temporary file first, so a half-written file is never served
+    temporary = path.with_name(path.name + '.tmp')
+    temporary.write_bytes(content)
+    os.replace(str(temporary), str(path))
+
+
 class Command(BaseCommand):
+    help = '''Writes the county and state prefetch bundles for the search box, named by the hash
+    of their content, with gzip compressed copies and a manifest. Bundles whose data hasn't
+    changed are left as they are.'''
 
     def add_arguments(self, parser):
         parser.add_argument(
-            'type',
-            choices=['county', 'state'],
-            help='Choose between generating prefetch data for counties or states'
+            'types',
+            nargs='*',
+            help='Bundles to generate: county and/or state (default: both)'
         )
         parser.add_argument(
-            '-o', '--output-path',
-            type=pathtype,
-            default=Path.cwd() / 'prefetch.json',
-            help='File path to save prefetch data to'
+            '-d', '--output-dir',
+            type=Path,
+            default=Path(settings.ROOT_PATH) / 'static' / 'prefetch',
+            help='Folder to save the bundles and manifest to (default: static/prefetch)'
         )
         parser.add_argument(
             '-p', '--pretty',
             action='store_true',
             help='Formats JSON for readability instead of compactness'
         )
+        parser.add_argument(
+            '-f', '--force',
+            action='store_true',
+            help='Writes bundles even if their data has not changed'
+        )
 
-
+    def read_manifest(self, output_dir):
+        path = output_dir / 'manifest.json'
+        if not path.exists():
+            return {}
+        with path.open(encoding='utf-8') as fp:
+            return json.load(fp)
+
+    def is_current(self, output_dir, entry, digest, suffixes):
+        # whether the bundle in the manifest has this content, and every file of it still exists
+        if entry is None or entry['hash'] != digest:
+            return False
+        if not set(suffixes) <= set(entry['encodings']):
+            return False
+        names = [entry['file']] + [entry['file'] + suffix for suffix in entry['encodings']]
+        return all((output_dir / name).exists() for name in names)
+
+    def remove_stale(self, output_dir, name, keep):
+        # older bundles of the same name (the unhashed name from before bundles were hashed too),
+        # other than the files of the bundles in keep
+        for path in output_dir.glob(f'{name}.*json*'):
+            if not any(path.name.startswith(file_name) for file_name in keep):
+                path.unlink()
 
     def handle(self, *args, **options):
-        output_path = options['output_path']
+        output_dir = options['output_dir']
+        output_dir.mkdir(parents=True, exist_ok=True)
         is_pretty = options.get('pretty', False)
 
         type_map = {
@@ -60,13 +120,50 @@ class Command(BaseCommand):
             'county': county_data
         }
 
-        data = type_map[options['type']]()
-
-        with output_path.open(mode='w') as fp:
-            json.dump(
-                data,
-                fp,
-                indent=indent_level(is_pretty),
-                separators=separators(is_pretty),
-                sort_keys=is_pretty
-            )
+        names = options['types'] or prefetch.BUNDLES
+        unknown = [name for name in names if name not in type_map]
+        if unknown:
+            raise CommandError(
+                f"Unknown bundles: {', '.join(unknown)} (choose from county, state)")
+
+        suffixes = COMPRESSED_SUFFIXES
+        manifest = self.read_manifest(output_dir)
+        written = {}
+        for name in names:
+            # the data is read and hashed every time, but only compressed and written if it changed
+            body = encode(type_map[name](), is_pretty)
+            digest = hashlib.sha256(body).hexdigest()
+            file_name = f'{name}.{digest[:HASH_LENGTH]}.json'
+
+            is_current = self.is_current(output_dir, manifest.get(name), digest, suffixes)
+            if not options['force'] and is_current:
+                self.stdout.write(f'{name}: unchanged ({file_name})')
+                continue
+
+            write_atomically(output_dir / file_name, body)
+            sizes = [f'{len(body)} bytes']
+            for suffix in suffixes:
+                content = compress(body)
+                write_atomically(output_dir / (file_name + suffix), content)
+                sizes.append(f'{suffix} {len(content)}')
+
+            # the bundle this replaces is kept until the next one replaces this, since pages loaded
+            # (and processes started) before it was written still link to it
+            entry = manifest.get(name, {})
+            previous = entry.get('file')
+            if previous == file_name:
+                # written again (--force), so the one before it is still the previous bundle
+                previous = entry.get('previous')
+            manifest[name] = {'file': file_name, 'hash': digest, 'encodings': suffixes}
+            if previous is not None:
+                manifest[name]['previous'] = previous
+            written[name] = [file_name] if previous is None else [file_name, previous]
+            self.stdout.write(f"{name}: wrote {file_name} ({', '.join(sizes)})")
+
+        if not written:
+            return
+        # after the bundles, so the manifest never names one that hasn't been written yet,
+        # and before removing the old ones, so it never names one that has been removed
+        write_atomically(output_dir / 'manifest.json', encode(manifest, True))
+        for (name, keep) in written.items():
+            self.remove_stale(output_dir, name, keep)
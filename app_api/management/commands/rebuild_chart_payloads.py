@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from app_api.materialize import build_payloads, save_payloads
+from hda_privileged.models import Data_Set
+
+
+def _build(data_set_id):
+    # each worker thread gets its own database connection, which has to be closed by that thread
+    try:
+        return build_payloads(data_set_id)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = '''Stores the percentile and per-state point series of data sets, so the chart API can
+    send them without building them. Data sets uploaded since this existed are stored when they
+    are uploaded; run this once for older ones (after build_data_set_columns).'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('data_sets', nargs='*', type=int,
+                            help='IDs of the data sets to rebuild (default: every data set)')
+        parser.add_argument('-w', '--workers', type=int, default=4,
+                            help='Number of data sets to build at once')
+        parser.add_argument('--missing', action='store_true',
+                            help='Only build data sets that have no stored series')
+
+    def handle(self, *args, **options):
+        data_sets = Data_Set.objects.order_by('id')
+        if options['data_sets']:
+            data_sets = data_sets.filter(id__in=options['data_sets'])
+        if options['missing']:
+            data_sets = data_sets.filter(chart_payloads__isnull=True)
+        data_set_ids = list(data_sets.values_list('id', flat=True).distinct())
+
+        # payloads are built in parallel (that's the slow part, and only reads), then saved one
+        # data set at a time from this thread, so workers never wait on each other's writes
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                built = executor.map(_build, data_set_ids)
+                self.save_all(data_set_ids, built)
+        else:
+            self.save_all(data_set_ids, map(build_payloads, data_set_ids))
+
+        self.stdout.write(f"Stored chart series for {len(data_set_ids)} data sets")
+
+    def save_all(self, data_set_ids, built):
+        for (data_set_id, payloads) in zip(data_set_ids, built):
+            save_payloads(data_set_id, payloads)
+            self.stdout.write(f"Data set {data_set_id}: {len(payloads)} series")
@@ -0,0 +1,128 @@
+# Chart series stored ahead of time.
+#
+# The public site mostly shows state-level charts, and every one of them needs the same two
+# series of a data set: its percentile curve, and its points in the state. Data sets don't change
+# once they are uploaded, so those series are built once, when the upload finishes, and stored
+# gzipped as Chart_Payloads (one for the percentiles, one per state). A request for one of them is
+# then a single lookup, and the stored body is sent as it is, without building or encoding JSON.
+#
+# They are built after the upload's transaction commits, so the upload doesn't hold its
+# transaction open while dozens of payloads are built, and a failure to build them doesn't undo the
+# upload. A data set without stored payloads still works (its series are built on request), and
+# `rebuild_chart_payloads --missing` stores any that are missing.
+#
+# Only the default (full) encoding is stored; compact series, downsampled curves and county
+# lists are still built on request (and kept in the chart cache, see chart_cache.py).
+
+import gzip
+import json
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.dispatch import receiver
+
+from app_api.views.chart import (
+    column_points,
+    county_tuples,
+    percentile_series_config,
+    point_payload,
+    point_series_config
+)
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Chart_Payload, Data_Set, Data_Set_Columns
+from hda_privileged.signals import data_set_ready
+
+logger = logging.getLogger(__name__)
+
+
+def compress_payload(payload):
+    """
+    Encodes a payload the way JsonResponse would, then gzips it
+
+    :param payload: dict to encode
+    :returns: bytes
+
+    """
+    body = json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+    # fixed mtime, so the same payload always compresses to the same bytes
+    return gzip.compress(body, mtime=0)
+
+
+def build_payloads(data_set_id):
+    """
+    Builds (but does not save) the stored chart payloads for a data set. Only reads the
+    database, so several data sets can be built at once.
+
+    :param data_set_id: primary key of the data set
+    :returns: list of unsaved Chart_Payload
+
+    """
+    packed = Data_Set.objects.values_list('percentile_values', flat=True).get(pk=data_set_id)  # THROWS
+    payloads = [Chart_Payload(
+        data_set_id=data_set_id,
+        kind=Chart_Payload.PERCENTILES,
+        body=compress_payload({'config': percentile_series_config(packed)}),
+    )]
+
+    # data sets uploaded before columns existed don't get state payloads; they are built on request
+    columns = Data_Set_Columns.objects.filter(data_set_id=data_set_id).first()
+    if columns is None:
+        return payloads
+
+    geography = get_geography()
+    for state in geography.states:
+        counties = county_tuples(geography.get_counties(state.short))
+        (points, _, unmatched) = column_points(columns, counties, state_fips=state.fips)
+        config = point_series_config([{'x': x, 'y': y, 'name': name} for (_, x, y, name) in points])
+        payloads.append(Chart_Payload(
+            data_set_id=data_set_id,
+            kind=Chart_Payload.POINTS,
+            state=state.short,
+            body=compress_payload(point_payload(config, [], unmatched)),
+        ))
+    return payloads
+
+
+def save_payloads(data_set_id, payloads):
+    """
+    Replaces a data set's stored chart payloads
+
+    :param data_set_id: primary key of the data set
+    :param payloads: list of unsaved Chart_Payload, from build_payloads
+
+    """
+    with transaction.atomic():
+        Chart_Payload.objects.filter(data_set_id=data_set_id).delete()
+        Chart_Payload.objects.bulk_create(payloads)
+
+
+def materialize(data_set_id):
+    """
+    Builds and saves the stored chart payloads for a data set
+
+    :param data_set_id: primary key of the data set
+
+    """
+    save_payloads(data_set_id, build_payloads(data_set_id))
+
+
+def materialize_or_log(data_set_id):
+    """
+    Builds and saves the stored chart payloads for a data set, logging (rather than raising)
+    any error, since the data set is already saved and works without them
+
+    :param data_set_id: primary key of the data set
+
+    """
+    try:
+        materialize(data_set_id)
+    except Exception:
+        logger.exception('Could not store the chart payloads of data set %s; '
+                         'run rebuild_chart_payloads --missing to store them', data_set_id)
+
+
+@receiver(data_set_ready)
+def materialize_data_set(sender, data_set, **kwargs):
+    data_set_id = data_set.pk
+    transaction.on_commit(lambda: materialize_or_log(data_set_id))
@@ -1,3 +1,732 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from app_api import chart_cache
+from app_api.util import prefetch, search
+from app_api.util.downsample import lttb_indices
+from app_api.util.fuzzy_index import FuzzyIndex, prefix_distance
+from app_api.util.prefix_index import PrefixIndex
+from hda_privileged.geography import get_geography, reload as reload_geography
+from hda_privileged.ingest import ValueColumn, save_value_column
+from hda_privileged.models import Chart_Payload, Data_Set, Data_Set_Columns, Health_Indicator, US_County, US_State
+
+
+class LTTBTestCase(TestCase):
+
+    def test_keeps_first_and_last(self):
+        x = list(range(100))
+        indices = lttb_indices(x, [v * v for v in x], 10).tolist()
+        self.assertEqual(len(indices), 10)
+        self.assertEqual((indices[0], indices[-1]), (0, 99))
+        self.assertEqual(indices, sorted(set(indices)))
+
+    def test_keeps_spike(self):
+        y = [0.0] * 100
+        y[37] = 50.0
+        self.assertIn(37, lttb_indices(range(100), y, 5).tolist())
+
+    def test_small_threshold_keeps_everything(self):
+        self.assertEqual(lttb_indices(range(5), range(5), 10).tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(lttb_indices(range(5), range(5), 2).tolist(), [0, 1, 2, 3, 4])
+
+
+class PrefixIndexTestCase(TestCase):
+
+    def setUp(self):
+        names = ['Montgomery County VA', 'Monty County TX', 'Clay County GA', 'Clayton County GA',
+                 'Montgomery County AL']
+        self.index = PrefixIndex(names, str)
+
+    def test_token_prefixes(self):
+        self.assertEqual(self.index.search('clay', 5), ['Clay County GA', 'Clayton County GA'])
+        self.assertEqual(self.index.search('MONTGOMERY va', 5), ['Montgomery County VA'])
+        self.assertEqual(self.index.search('ounty', 5), [])
+        self.assertEqual(self.index.search('  ', 5), [])
+
+    def test_ranked_by_length(self):
+        # shortest first, then in the order given
+        self.assertEqual(self.index.search('mont', 5),
+                         ['Monty County TX', 'Montgomery County VA', 'Montgomery County AL'])
+        self.assertEqual(self.index.search('county', 2), ['Clay County GA', 'Monty County TX'])
+
+    def test_punctuation_separates_tokens(self):
+        index = PrefixIndex(['Miami-Dade County FL', 'St. Louis city MO', "O'Brien County IA"], str)
+        for query in ('dade', 'miami-dade', 'miami dade', 'miamidade'):
+            self.assertEqual(index.search(query, 5), ['Miami-Dade County FL'], query)
+        for query in ('louis', 'st louis', 'st. lou'):
+            self.assertEqual(index.search(query, 5), ['St. Louis city MO'], query)
+        for query in ('brien', "o'brien", 'obrien'):
+            self.assertEqual(index.search(query, 5), ["O'Brien County IA"], query)
+
+
+class FuzzyIndexTestCase(TestCase):
+
+    def setUp(self):
+        names = ['Montgomery County VA', 'Monty County TX', 'Clay County GA', 'Clayton County GA',
+                 'Montgomery County AL', 'Fairfax County VA', 'Fairfax city VA']
+        self.index = FuzzyIndex(names, str)
+
+    def test_prefix_distance(self):
+        self.assertEqual(prefix_distance('montgomery', 'montgomery', 2), 0)
+        self.assertEqual(prefix_distance('montgommery', 'montgomery', 2), 1)
+        self.assertEqual(prefix_distance('fairfx', 'fairfax', 1), 1)
+        self.assertIsNone(prefix_distance('clayten', 'montgomery', 1))
+
+    def test_misspellings(self):
+        self.assertEqual(self.index.search('Montgommery', 5),
+                         ['Montgomery County VA', 'Montgomery County AL'])
+        self.assertEqual(self.index.search('fairfx county va', 5), ['Fairfax County VA'])
+        # short tokens have to match exactly
+        self.assertEqual(self.index.search('clat', 5), [])
+
+    def test_exact_matches_first(self):
+        # 'clayt' starts 'Clayton', and is one letter more than 'Clay'
+        self.assertEqual(self.index.search('clayt', 5), ['Clayton County GA', 'Clay County GA'])
+        self.assertEqual(self.index.search('mont', 5),
+                         ['Monty County TX', 'Montgomery County VA', 'Montgomery County AL'])
+
+    def test_paging(self):
+        everything = self.index.search('county', 10)
+        self.assertEqual(len(everything), 6)
+        self.assertEqual(self.index.search('county', 4), everything[:4])
+        self.assertEqual(self.index.search('county', 4, offset=4), everything[4:])
+        self.assertEqual(self.index.search('county', 4, offset=6), [])
+
+
+class SuggestionsTestCase(TestCase):
+
+    def setUp(self):
+        # built once per process, not counted here
+        search.get_suggestion_indexes()
+
+    def suggest(self, kind, query):
+        with self.assertNumQueries(0):
+            return self.client.get(reverse(f'api:suggest_{kind}', args=[query])).json()
+
+    def test_counties(self):
+        suggestions = self.suggest('county', 'fairfax va')
+        county = US_County.objects.select_related('state').get(fips5='51059')
+        self.assertIn(search.datum_for_county(county), suggestions)
+        self.assertTrue(all(s['value'].endswith(' VA') for s in suggestions))
+        self.assertEqual(len(self.suggest('county', 'c')), 5)
+
+    def test_part_of_hyphenated_name(self):
+        self.assertIn('Miami-Dade County FL', [s['value'] for s in self.suggest('county', 'dade')])
+
+    def test_states(self):
+        self.assertEqual(self.suggest('state', 'new y'), ['New York'])
+        self.assertEqual(self.suggest('state', 'carolina'), ['North Carolina', 'South Carolina'])
+
+
+class ListEndpointTestCase(TestCase):
+
+    def get_list(self, url, query=None):
+        response = self.client.get(url, query or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_every_county(self):
+        values = self.get_list('/api/county/list/')['values']
+        self.assertEqual(len(values), US_County.objects.count())
+        self.assertEqual(set(values[0]), {'name', 'fips5', 'state', 'search'})
+        fips = [county['fips5'] for county in values]
+        self.assertEqual(fips, sorted(fips))
+
+    def test_fields(self):
+        values = self.get_list('/api/state/list/', {'fields': 'usps,name'})['values']
+        self.assertEqual(list(values[0]), ['usps', 'name'])
+        self.assertEqual(self.client.get('/api/state/list/', {'fields': 'usps,population'}).status_code, 400)
+
+    def test_pages(self):
+        every = self.get_list('/api/county/list/', {'fields': 'fips5'})['values']
+        paged = []
+        query = {'fields': 'fips5', 'limit': 1000}
+        while True:
+            page = self.get_list('/api/county/list/', query)
+            paged.extend(page['values'])
+            if page['next'] is None:
+                break
+            self.assertEqual(len(page['values']), 1000)
+            query['after'] = page['next']
+        self.assertEqual(paged, every)
+
+    def test_limit(self):
+        self.assertEqual(self.client.get('/api/county/list/', {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/county/list/', {'limit': 'x'}).status_code, 400)
+        page = self.get_list('/api/state/list/', {'limit': 2})
+        self.assertEqual(page['next'], page['values'][1]['fips'])
+
+
+class PercentileResolutionTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        column = ValueColumn()
+        for (i, county) in enumerate(US_County.objects.filter(state='AL')):
+            column.append(county.id, (i % 11) ** 2)
+        save_value_column(cls.data_set, column)
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        self.url = f'/api/chart/percentiles/{self.data_set.id}/'
+
+    def get_curve(self, query):
+        return self.client.get(self.url, query).json()['config']['data']
+
+    def test_full_curve_by_default(self):
+        self.assertEqual(len(self.get_curve({})), 999)
+
+    def test_resolution(self):
+        full = self.get_curve({})
+        curve = self.get_curve({'resolution': 100})
+        self.assertEqual(len(curve), 100)
+        # a subset of the full curve, including both ends
+        self.assertTrue(all(point in full for point in curve))
+        self.assertEqual((curve[0], curve[-1]), (full[0], full[-1]))
+
+    def test_resolution_limits(self):
+        self.assertEqual(len(self.get_curve({'resolution': 1})), 3)
+        self.assertEqual(len(self.get_curve({'resolution': 5000})), 999)
+        self.assertEqual(len(self.get_curve({'resolution': 'x'})), 999)
+
+
+class PointSeriesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        # every Alabama county but one has a value
+        counties = list(US_County.objects.filter(state='AL').order_by('id'))[1:]
+        column = ValueColumn()
+        for (i, county) in enumerate(counties):
+            column.append(county.id, float(i))
+        save_value_column(cls.data_set, column)
+        # so that state series are built on request, rather than read from the stored payloads
+        Chart_Payload.objects.filter(data_set=cls.data_set).delete()
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        # states and counties are read once per process, not counted here
+        get_geography()
+
+    def get_series(self, query):
+        response = self.client.get(f'/api/chart/points/{self.data_set.id}', query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def get_both_series(self, query):
+        # once from the columns, and once from the Data_Points
+        from_columns = self.get_series(query)
+        Data_Set_Columns.objects.filter(data_set=self.data_set).delete()
+        from_points = self.get_series(query)
+        return (from_columns, from_points)
+
+    def assertSameSeries(self, from_columns, from_points):
+        def by_name(series):
+            return sorted(series['config']['data'], key=lambda p: p['name'])
+        self.assertEqual(by_name(from_columns), by_name(from_points))
+        self.assertEqual(from_columns['errors'], from_points['errors'])
+
+    def test_state(self):
+        (from_columns, from_points) = self.get_both_series({'state': 'al'})
+        self.assertEqual(len(from_columns['config']['data']), US_County.objects.filter(state='AL').count() - 1)
+        self.assertIn('no_fips', from_columns['errors'])
+        self.assertSameSeries(from_columns, from_points)
+
+    def test_counties(self):
+        fips = ','.join(US_County.objects.filter(state='AL').values_list('fips5', flat=True)[:5])
+        (from_columns, from_points) = self.get_both_series({'county': fips + ',99999'})
+        self.assertEqual(from_columns['errors']['no_county'], '99999')
+        self.assertSameSeries(from_columns, from_points)
+
+    def test_state_query_count(self):
+        Data_Set_Columns.objects.filter(data_set=self.data_set).delete()
+        # version, stored payload (none), data set, columns (none), and all of the points
+        with self.assertNumQueries(5):
+            self.get_series({'state': 'AL'})
+
+    def test_counties_query_count(self):
+        Data_Set_Columns.objects.filter(data_set=self.data_set).delete()
+        fips = ','.join(US_County.objects.filter(state='AL').values_list('fips5', flat=True)[:20])
+        # version, data set, columns (none), and all of the points
+        with self.assertNumQueries(4):
+            self.get_series({'county': fips + ',99999'})
+
+    def test_columns_query_count(self):
+        # version, stored payload (none), data set, and columns
+        with self.assertNumQueries(4):
+            self.get_series({'state': 'AL'})
+
+
+class StoredPayloadTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        counties = list(US_County.objects.filter(state='AL').order_by('id'))[2:]
+        column = ValueColumn()
+        for (i, county) in enumerate(counties):
+            column.append(county.id, float(i % 7))
+        cls.column = column
+        # on_commit callbacks never run inside a TestCase, so they are run as they are registered
+        with mock.patch.object(transaction, 'on_commit', lambda func: func()):
+            save_value_column(cls.data_set, column)
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+
+    def upload_another(self):
+        data_set = Data_Set.objects.create(indicator=self.data_set.indicator, year=2901)
+        save_value_column(data_set, self.column)
+        return data_set
+
+    def get(self, series, query, **headers):
+        url = reverse(f'api:chart_{series}', args=[self.data_set.id])
+        response = self.client.get(url, query, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def get_stored_and_built(self, series, query):
+        stored = self.get(series, query).json()
+        Chart_Payload.objects.filter(data_set=self.data_set).delete()
+        return (stored, self.get(series, query).json())
+
+    def test_stored_on_upload(self):
+        payloads = Chart_Payload.objects.filter(data_set=self.data_set)
+        self.assertTrue(payloads.filter(kind=Chart_Payload.PERCENTILES, state='').exists())
+        self.assertTrue(payloads.filter(kind=Chart_Payload.POINTS, state='AL').exists())
+
+    def test_built_after_the_upload_commits(self):
+        with mock.patch.object(transaction, 'on_commit') as on_commit:
+            data_set = self.upload_another()
+        self.assertFalse(Chart_Payload.objects.filter(data_set=data_set).exists())
+
+        on_commit.call_args[0][0]()
+        self.assertTrue(Chart_Payload.objects.filter(data_set=data_set, state='AL').exists())
+
+    def test_build_errors_do_not_fail_the_upload(self):
+        with mock.patch.object(transaction, 'on_commit', lambda func: func()), \
+                mock.patch('app_api.materialize.build_payloads', side_effect=ValueError('broken')), \
+                self.assertLogs('app_api.materialize', 'ERROR'):
+            data_set = self.upload_another()
+        self.assertTrue(Data_Set_Columns.objects.filter(data_set=data_set).exists())
+        self.assertFalse(Chart_Payload.objects.filter(data_set=data_set).exists())
+
+    def test_state_matches_built(self):
+        (stored, built) = self.get_stored_and_built('points', {'state': 'AL'})
+        self.assertEqual(stored, built)
+        self.assertIn('no_fips', stored['errors'])
+
+    def test_percentiles_match_built(self):
+        (stored, built) = self.get_stored_and_built('percentiles', {})
+        self.assertEqual(stored, built)
+
+    def test_state_query_count(self):
+        # version, and the stored payload
+        with self.assertNumQueries(2):
+            self.get('points', {'state': 'al'})
+
+    def test_sent_gzipped(self):
+        response = self.get('points', {'state': 'AL'}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), self.get('points', {'state': 'AL'}).content)
+
+    def test_other_representations_are_built(self):
+        compact = self.get('points', {'state': 'AL', 'format': 'compact'}).json()
+        self.assertEqual(compact['config']['format'], 'compact')
+        curve = self.get('percentiles', {'resolution': 50}).json()['config']['data']
+        self.assertEqual(len(curve), 50)
+
+    def test_rebuild_command(self):
+        Chart_Payload.objects.filter(data_set=self.data_set).delete()
+        # one worker builds in this thread, which can see the test's transaction
+        call_command('rebuild_chart_payloads', '--workers', '1', '--missing', stdout=open(os.devnull, 'w'))
+        self.assertTrue(Chart_Payload.objects.filter(data_set=self.data_set, state='AL').exists())
+
+
+class PrefetchBundleTestCase(TestCase):
+
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.output_dir = Path(temporary.name)
+
+    def generate(self, *args):
+        out = StringIO()
+        call_command('generate_prefetch_data', *args, '--output-dir', str(self.output_dir), stdout=out)
+        return out.getvalue()
+
+    def read_manifest(self):
+        return json.loads((self.output_dir / 'manifest.json').read_text())
+
+    def test_hashed_and_compressed(self):
+        self.generate()
+        manifest = self.read_manifest()
+        self.assertEqual(set(manifest), {'county', 'state'})
+
+        entry = manifest['state']
+        self.assertRegex(entry['file'], r'^state\.[0-9a-f]{12}\.json$')
+        self.assertTrue(entry['hash'].startswith(entry['file'][len('state.'):-len('.json')]))
+        self.assertIn('.gz', entry['encodings'])
+        body = (self.output_dir / entry['file']).read_bytes()
+        self.assertEqual(gzip.decompress((self.output_dir / (entry['file'] + '.gz')).read_bytes()), body)
+        self.assertIn('Virginia', json.loads(body.decode('utf-8')))
+
+    def test_unchanged_rows_are_skipped(self):
+        self.generate()
+        files = {path.name: path.stat().st_mtime_ns for path in self.output_dir.iterdir()}
+        output = self.generate()
+        self.assertIn('county: unchanged', output)
+        self.assertIn('state: unchanged', output)
+        self.assertEqual({path.name: path.stat().st_mtime_ns for path in self.output_dir.iterdir()}, files)
+
+    def test_changed_rows_replace_the_bundle(self):
+        self.generate('state')
+        old = self.read_manifest()['state']['file']
+
+        US_State.objects.filter(short='VA').update(full='Old Dominion')
+        self.assertIn('state: wrote', self.generate('state'))
+        new = self.read_manifest()['state']['file']
+        self.assertNotEqual(new, old)
+        self.assertIn('Old Dominion', (self.output_dir / new).read_text())
+        # pages loaded before the change still link to the old bundle
+        self.assertEqual(self.read_manifest()['state']['previous'], old)
+        self.assertTrue((self.output_dir / old).exists())
+        self.assertTrue((self.output_dir / (old + '.gz')).exists())
+
+        # until the one after it replaces the new bundle
+        US_State.objects.filter(short='VA').update(full='Commonwealth of Virginia')
+        self.generate('state')
+        self.assertEqual(self.read_manifest()['state']['previous'], new)
+        self.assertFalse((self.output_dir / old).exists())
+        self.assertFalse((self.output_dir / (old + '.gz')).exists())
+        self.assertTrue((self.output_dir / new).exists())
+
+    def test_forced_rewrite_keeps_the_previous_bundle(self):
+        self.generate('state')
+        old = self.read_manifest()['state']['file']
+        US_State.objects.filter(short='VA').update(full='Old Dominion')
+        self.generate('state')
+        self.generate('state', '--force')
+        self.assertEqual(self.read_manifest()['state']['previous'], old)
+        self.assertTrue((self.output_dir / old).exists())
+
+    def test_committed_county_bundle_is_in_compact_series_order(self):
+        # compact series name counties by their position in the bundle that is served, which was
+        # generated with another database (and maybe another collation) than the one answering
+        with open(finders.find(prefetch.prefetch_path('county')), encoding='utf-8') as fp:
+            bundle_fips = [datum['id'] for datum in json.load(fp)]
+        self.assertEqual(bundle_fips, sorted(bundle_fips))
+
+        positions = search.county_prefetch_positions()
+        fips = [None] * len(positions)
+        for county in US_County.objects.all():
+            fips[positions[county.id]] = county.fips5
+        self.assertEqual(fips, bundle_fips)
+
+    def test_pages_link_to_the_manifest_bundles(self):
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, prefetch.prefetch_url('county'))
+        self.assertContains(response, prefetch.prefetch_url('state'))
+        self.assertRegex(prefetch.prefetch_url('state'), r'prefetch/state\.[0-9a-f]{12}\.json$')
+
+
+@override_settings(CHART_CACHE_MAX_AGE=3600)
+class ConditionalGetTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        column = ValueColumn()
+        for (i, county) in enumerate(US_County.objects.filter(state='AL')):
+            column.append(county.id, float(i))
+        save_value_column(cls.data_set, column)
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+
+    def urls(self):
+        return [
+            f'/api/chart/percentiles/{self.data_set.id}/',
+            f'/api/chart/points/{self.data_set.id}?state=AL',
+        ]
+
+    def test_validators_and_cache_control(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.has_header('ETag'))
+                self.assertTrue(response.has_header('Last-Modified'))
+                self.assertIn('max-age=3600', response['Cache-Control'])
+                self.assertIn('public', response['Cache-Control'])
+
+    def test_matching_etag_is_not_modified(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                # only the version is looked up; the series is not rebuilt
+                with self.assertNumQueries(1):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        url = self.urls()[0]
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_version_after_change(self):
+        url = self.urls()[0]
+        etag = self.client.get(url)['ETag']
+        Data_Set.objects.get(pk=self.data_set.pk).save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_data_set(self):
+        response = self.client.get('/api/chart/percentiles/999999/')
+        self.assertEqual(response.status_code, 500)
+
+
+@override_settings(CHART_CACHE_COUNT_HITS=True)
+class ChartCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        column = ValueColumn()
+        for (i, county) in enumerate(US_County.objects.filter(state='AL')):
+            column.append(county.id, float(i))
+        save_value_column(cls.data_set, column)
+
+        Chart_Payload.objects.filter(data_set=cls.data_set).delete()
+        cls.staff = get_user_model().objects.create_user(username='staff', password='12345', is_staff=True)
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        self.url = f'/api/chart/points/{self.data_set.id}?state=AL'
+
+    def get_stats(self):
+        self.client.force_login(self.staff)
+        stats = self.client.get('/api/chart/cache/stats/').json()
+        self.client.logout()
+        return stats
+
+    def test_second_request_is_a_hit(self):
+        first = self.client.get(self.url).json()
+        # only the data set's version (and that there is no stored payload) is read from the database
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url).json()
+
+        self.assertEqual(first, second)
+        stats = self.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_locations_are_cached_separately(self):
+        self.client.get(self.url)
+        self.client.get(self.url.replace('AL', 'AK'))
+        self.assertEqual(self.get_stats()['misses'], 2)
+
+    def test_saving_data_set_invalidates(self):
+        self.client.get(self.url)
+        # a new modified_at, so a new version and key
+        Data_Set.objects.get(pk=self.data_set.id).save()
+        self.client.get(self.url)
+        self.assertEqual(self.get_stats()['misses'], 2)
+
+    def test_deleted_data_set_is_not_served(self):
+        self.client.get(self.url)
+        Data_Set.objects.get(pk=self.data_set.id).delete()
+        # no version any more, so the cached payload is never read
+        self.assertEqual(self.client.get(self.url).status_code, 500)
+
+    def test_errors_are_not_cached(self):
+        self.client.get(f'/api/chart/points/{self.data_set.id}?state=XX')
+        self.client.get(f'/api/chart/points/{self.data_set.id}?state=XX')
+        self.assertEqual(self.get_stats()['misses'], 2)
+
+    @override_settings(CHART_CACHE_COUNT_HITS=False)
+    def test_not_counted_unless_enabled(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        stats = self.get_stats()
+        self.assertEqual((stats['counting'], stats['hits'], stats['misses']), (False, 0, 0))
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get('/api/chart/cache/stats/').status_code, 302)
+        get_user_model().objects.create_user(username='user', password='12345')
+        self.client.login(username='user', password='12345')
+        self.assertEqual(self.client.get('/api/chart/cache/stats/').status_code, 302)
+
+
+class OverviewSeriesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.counties = list(US_County.objects.filter(state='AL').order_by('id'))
+        cls.latest = dict()
+        for name in ('Obesity', 'Smoking', 'Uninsured'):
+            hi = Health_Indicator.objects.create(name=name, important=True)
+            for year in (2016, 2018):
+                cls.latest[name] = cls.make_data_set(hi, year)
+        # not important, so not charted
+        cls.make_data_set(Health_Indicator.objects.create(name='Other'), 2018)
+
+    @classmethod
+    def make_data_set(cls, indicator, year):
+        data_set = Data_Set.objects.create(indicator=indicator, year=year)
+        column = ValueColumn()
+        for (i, county) in enumerate(cls.counties):
+            column.append(county.id, float(i))
+        save_value_column(data_set, column)
+        return data_set
+
+    def get_overview(self, query):
+        response = self.client.get('/api/chart/overview/', query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['charts']
+
+    def test_latest_data_set_of_each_important_indicator(self):
+        charts = self.get_overview({'state': 'AL'})
+        self.assertEqual({c['indicator']: c['data_set_id'] for c in charts},
+                         {name: ds.id for (name, ds) in self.latest.items()})
+        for chart in charts:
+            # small charts get downsampled percentile curves
+            self.assertEqual(len(chart['percentiles']['data']), 100)
+            self.assertEqual(len(chart['points']['data']), len(self.counties))
+
+    def test_county(self):
+        county = self.counties[3]
+        charts = self.get_overview({'county': county.fips5})
+        self.assertEqual(len(charts), 3)
+        for chart in charts:
+            self.assertEqual([(p['name'], p['y']) for p in chart['points']['data']], [(county.name, 3.0)])
+
+    def test_same_series_as_single_endpoints(self):
+        data_set = self.latest['Smoking']
+        chart = [c for c in self.get_overview({'state': 'AL'}) if c['data_set_id'] == data_set.id][0]
+        percentiles = self.client.get(f'/api/chart/percentiles/{data_set.id}/', {'resolution': 100}).json()['config']
+        points = self.client.get(f'/api/chart/points/{data_set.id}', {'state': 'AL'}).json()['config']
+        self.assertEqual(chart['percentiles'], percentiles)
+        self.assertEqual(chart['points'], points)
+
+    def test_query_count(self):
+        # states and counties are read once per process, not counted here
+        get_geography()
+        # latest data sets, their percentiles, and their columns
+        with self.assertNumQueries(3):
+            self.get_overview({'state': 'AL'})
+
+        # data sets without columns add one query for all of their points
+        Data_Set_Columns.objects.filter(data_set=self.latest['Obesity']).delete()
+        with self.assertNumQueries(4):
+            charts = self.get_overview({'state': 'AL'})
+        self.assertTrue(all(len(c['points']['data']) == len(self.counties) for c in charts))
+
+    def test_unknown_county(self):
+        response = self.client.get('/api/chart/overview/', {'county': '99999'})
+        self.assertEqual(response.status_code, 500)
+
+
+class CompactSeriesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        column = ValueColumn()
+        for (i, county) in enumerate(US_County.objects.filter(state='AL')):
+            column.append(county.id, i / 7)
+        save_value_column(cls.data_set, column)
+
+    def setUp(self):
+        chart_cache.get_cache().clear()
+        self.percentiles_url = f'/api/chart/percentiles/{self.data_set.id}/'
+        self.points_url = f'/api/chart/points/{self.data_set.id}'
+
+    def test_compact_percentiles(self):
+        full = self.client.get(self.percentiles_url).json()['config']
+        compact = self.client.get(self.percentiles_url, {'format': 'compact', 'digits': 2}).json()['config']
+
+        self.assertEqual(compact['format'], 'compact')
+        self.assertNotIn('data', compact['options'])
+        self.assertEqual(compact['x'], [x for (x, _) in full['data']])
+        self.assertEqual(compact['y'], [round(y, 2) for (_, y) in full['data']])
+
+    def test_compact_points_name_counties_by_prefetch_position(self):
+        full = self.client.get(self.points_url, {'state': 'AL'}).json()['config']
+        compact = self.client.get(self.points_url, {'state': 'AL', 'format': 'compact'}).json()['config']
+
+        # named from the bundle the browser would load
+        with open(finders.find(prefetch.prefetch_path('county')), encoding='utf-8') as fp:
+            prefetch_names = [datum['name'] for datum in json.load(fp)]
+        expanded = [
+            {'x': x, 'y': y, 'name': prefetch_names[position]}
+            for (x, y, position) in zip(compact['x'], compact['y'], compact['county'])
+        ]
+        self.assertEqual(expanded, [dict(p, y=round(p['y'], 3)) for p in full['data']])
+        self.assertEqual(compact['county_list'], prefetch.prefetch_url('county'))
+        self.assertRegex(compact['county_list'], r'prefetch/county\.[0-9a-f]{12}\.json$')
+
+    def test_county_missing_from_bundle_is_named_in_full(self):
+        bundle = prefetch.read_bundle(prefetch.prefetch_path('county'))
+        without_autauga = [datum for datum in bundle if datum['id'] != '01001']
+        # positions are found again (from the bundle) whenever the geography is reloaded
+        self.addCleanup(reload_geography)
+        with mock.patch.object(prefetch, 'read_bundle', return_value=without_autauga):
+            reload_geography()
+            compact = self.client.get(self.points_url, {'state': 'AL', 'format': 'compact'}).json()
+        self.assertNotEqual(compact['config'].get('format'), 'compact')
+        self.assertIn('Autauga County', {point['name'] for point in compact['config']['data']})
+
+    def test_bundle_is_part_of_the_compact_version(self):
+        compact = self.client.get(self.points_url, {'state': 'AL', 'format': 'compact'})
+        with mock.patch('app_api.views.chart.bundle_hash', return_value='0123456789ab'):
+            other = self.client.get(self.points_url, {'state': 'AL', 'format': 'compact'},
+                                    HTTP_IF_NONE_MATCH=compact['ETag'])
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other['ETag'], compact['ETag'])
+
+    def test_accept_header(self):
+        response = self.client.get(self.percentiles_url, HTTP_ACCEPT='application/vnd.hda.compact+json')
+        self.assertEqual(response.json()['config']['format'], 'compact')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_compact_resolution(self):
+        compact = self.client.get(self.percentiles_url, {'format': 'compact', 'resolution': 50}).json()['config']
+        self.assertEqual((len(compact['x']), len(compact['y'])), (50, 50))
+
+    def test_formats_have_different_versions(self):
+        full = self.client.get(self.percentiles_url)
+        compact = self.client.get(self.percentiles_url, {'format': 'compact'})
+        self.assertNotEqual(full['ETag'], compact['ETag'])
+
+        response = self.client.get(self.percentiles_url, {'format': 'compact'}, HTTP_IF_NONE_MATCH=full['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_gzipped(self):
+        response = self.client.get(self.points_url, {'state': 'AL'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
@@ -1,10 +1,13 @@
+from django.contrib.auth.decorators import user_passes_test
 from django.urls import path
+from django.views.decorators.gzip import gzip_page
 
 import app_api.views.county as county
 import app_api.views.state as state
 
 from app_api.views.search import StateSuggestions, CountySuggestions
-from app_api.views.chart import PercentileSeries, PointSeries
+from app_api.views.chart import ChartCacheStats, PercentileSeries, PointSeries
+from app_api.views.overview import OverviewSeries
 
 
 app_name = 'api'
@@ -14,8 +17,16 @@ urlpatterns = [
     path('state/list/', state.ListAll.as_view()),
     # search suggestions
     path('search/suggestions/state/<str:query>', StateSuggestions.as_view(), name='suggest_state'),
-    path('search/suggestions/county/<str:query>', CountySuggestions.as_view(), name='suggest_county'),
-    # async chart series
-    path('chart/percentiles/<int:data_set_id>/', PercentileSeries.as_view(), name='chart_percentiles'),
-    path('chart/points/<int:data_set_id>', PointSeries.as_view(), name='chart_points'),
-]
\ No newline at end of file
+    path('search/suggestions/county/<str:query>', CountySuggestions.as_view(),
+         name='suggest_county'),
+    # async chart series (gzipped for clients that accept it; a state's points are large)
+    path('chart/percentiles/<int:data_set_id>/', gzip_page(PercentileSeries.as_view()),
+         name='chart_percentiles'),
+    path('chart/points/<int:data_set_id>', gzip_page(PointSeries.as_view()), name='chart_points'),
+    # for sizing the chart cache; staff only, since anyone could otherwise read (and load) it
+    path('chart/cache/stats/',
+         user_passes_test(lambda user: user.is_staff)(ChartCacheStats.as_view()),
+         name='chart_cache_stats'),
+    # every series for a location's overview page at once
+    path('chart/overview/', gzip_page(OverviewSeries.as_view()), name='chart_overview'),
+]
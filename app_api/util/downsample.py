@@ -0,0 +1,56 @@
+# Downsampling for chart lines.
+#
+# A percentile curve has 999 points, but a small chart is only a few hundred pixels wide, so most
+# of those points are never seen. Largest-triangle-three-buckets (LTTB) picks a subset of the
+# points that keeps the shape of the line: the first and last points, plus one point from each
+# of a number of equal-sized buckets in between, chosen to make the largest triangle with the
+# point chosen from the previous bucket and the average of the next bucket.
+# See: Sveinn Steinarsson, "Downsampling Time Series for Visual Representation" (2013)
+# https://skemman.is/handle/1946/15343
+
+from math import floor
+
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Chooses which points of a line to keep, with largest-triangle-three-buckets
+
+    :param x: x values of the line's points, in increasing order
+    :param y: y values of the line's points
+    :param threshold: number of points to keep; every point is kept if this is less than 3 or
+        at least the number of points
+    :returns: numpy array of the (increasing) indices of the points to keep
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # the first and last points are always kept, the rest are split into buckets
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.intp)
+    indices[0] = 0
+    a = 0
+
+    for i in range(threshold - 2):
+        # the average point of the next bucket (the last point, for the last bucket)
+        next_start = int(floor((i + 1) * bucket_size)) + 1
+        next_end = min(int(floor((i + 2) * bucket_size)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # the point in this bucket making the largest triangle with the last point kept
+        # and the next bucket's average (the doubled area is enough to compare them)
+        start = int(floor(i * bucket_size)) + 1
+        end = next_start
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) -
+                       (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    indices[-1] = n - 1
+    return indices
@@ -0,0 +1,158 @@
+# A typo-tolerant token index for the search results page.
+#
+# This extends the token-prefix index (see prefix_index.py), so a query still matches an item if
+# each query token is the start of one of the item's tokens. It also forgives misspellings: a
+# query token can be a few edits (insertions, deletions or substitutions) away from the start of
+# an item's token, so "montgommery" finds Montgomery County. Longer words are allowed more typos.
+#
+# Comparing a query token to every distinct token would be slow, so the distinct tokens are also
+# indexed by their trigrams (three-character substrings, padded at the start so the first letters
+# count too). Each edit changes at most three of a word's trigrams, so a token within k edits of
+# the query token shares at least (number of query trigrams - 3k) of them. Only tokens that pass
+# that count are compared, with an edit distance that stops early once it is over the limit.
+#
+# Matches are ranked by their total number of typos, then by the length of their text like the
+# prefix index (shortest first), then by the order the items were given.
+
+import heapq
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from app_api.util.prefix_index import _AFTER_PREFIX, PrefixIndex, tokenize
+
+# start-of-token padding for trigrams, so that 'mo' -> '$$m', '$mo'
+_PADDING = '$$'
+
+
+def allowed_typos(token):
+    """
+    Returns how many edits a query token can be from the tokens it matches
+
+    :param token: str, a query token
+    """
+    if len(token) < 5:
+        return 0
+    if len(token) < 9:
+        return 1
+    return 2
+
+
+def trigrams(token):
+    """
+    Returns the set of trigrams of a token, padded at the start
+
+    :param token: str
+    """
+    padded = _PADDING + token
+    return {padded[i:i + 3] for i in range(len(token))}
+
+
+def prefix_distance(query, token, limit):
+    """
+    Returns the edit distance between a query token and the closest prefix of a token, or None if
+    that is more than a limit
+
+    :param query: str, a query token
+    :param token: str, a token that may start with (something like) the query
+    :param limit: the largest distance of interest
+    """
+    # the distance from each prefix of the query to the prefix of the token read so far
+    previous = list(range(len(query) + 1))
+    best = previous[-1]
+    for (j, char) in enumerate(token, 1):
+        current = [j]
+        for (i, query_char) in enumerate(query, 1):
+            current.append(min(previous[i] + 1,
+                               current[i - 1] + 1,
+                               previous[i - 1] + (query_char != char)))
+        best = min(best, current[-1])
+        if min(current) > limit:
+            # every longer prefix is at least this far away
+            break
+        previous = current
+    return best if best <= limit else None
+
+
+class FuzzyIndex(PrefixIndex):
+    """
+    An immutable index of items by the tokens of their text, that tolerates misspelled queries
+    """
+
+    def __init__(self, items, text):
+        """
+        :param items: the items that can be returned, in the order ties are broken
+        :param text: function item -> the text the item is searched and ranked by
+
+        """
+        super().__init__(items, text)
+
+        # the distinct tokens (sorted), and where the run of each one's ranks starts in self.ranks
+        vocabulary = []
+        starts = []
+        for (position, token) in enumerate(self.tokens):
+            if not vocabulary or token != vocabulary[-1]:
+                vocabulary.append(token)
+                starts.append(position)
+        starts.append(len(self.tokens))
+        self.vocabulary = vocabulary
+        self.starts = starts
+
+        postings = defaultdict(list)
+        for (token_id, token) in enumerate(vocabulary):
+            for gram in trigrams(token):
+                postings[gram].append(token_id)
+        self.postings = {gram: tuple(token_ids) for (gram, token_ids) in postings.items()}
+
+    def _costs_with_prefix(self, prefix):
+        # {rank: typos} for every item with a token that (nearly) starts with the prefix
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + _AFTER_PREFIX, start)
+        costs = dict.fromkeys(self.ranks[self.starts[start]:self.starts[end]], 0)
+
+        typos = allowed_typos(prefix)
+        if not typos:
+            return costs
+
+        grams = trigrams(prefix)
+        needed = len(grams) - 3 * typos
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        for (token_id, count) in shared.items():
+            if count < needed or start <= token_id < end:
+                continue
+            distance = prefix_distance(prefix, self.vocabulary[token_id], typos)
+            if distance is None:
+                continue
+            for rank in self.ranks[self.starts[token_id]:self.starts[token_id + 1]]:
+                if costs.get(rank, typos + 1) > distance:
+                    costs[rank] = distance
+        return costs
+
+    def search(self, query, limit, offset=0):
+        """
+        Returns the best-ranked items matching every token of a query, allowing for typos
+
+        :param query: text typed by the user
+        :param limit: largest number of items to return
+        :param offset: number of best-ranked items to skip, for paging  (Default value = 0)
+        :returns: list of items, best first
+
+        """
+        prefixes = tokenize(query)
+        if not prefixes or limit < 1:
+            return []
+
+        # start from the prefix with the fewest matches, so the dictionaries stay small
+        matches = sorted((self._costs_with_prefix(prefix) for prefix in set(prefixes)), key=len)
+        costs = matches[0]
+        for other in matches[1:]:
+            costs = {rank: typos + other[rank] for (rank, typos) in costs.items() if rank in other}
+            if not costs:
+                break
+
+        # ordered by (typos, rank), as one number so the heap compares ints
+        size = len(self.items)
+        best = heapq.nsmallest(offset + limit, (typos * size + rank for (rank, typos) in costs.items()))
+        return [self.items[score % size] for score in best[offset:]]
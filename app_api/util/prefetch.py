@@ -0,0 +1,78 @@
+# Prefetch bundles: the county and state lists that the search box (Bloodhound.js) downloads,
+# and that compact chart series name their points from.
+#
+# generate_prefetch_data writes each bundle to a file named with a hash of its content (e.g.
+# prefetch/county.3f2a9c1e04b7.json), next to a gzip compressed copy for static file servers
+# that can send one, and records the current file names in prefetch/manifest.json. A bundle's URL
+# changes whenever its content does, so browsers can cache bundles forever, and pages always link
+# to the current ones. The bundles they replaced are kept (until they are replaced in turn), for
+# pages loaded before the change.
+
+import json
+from functools import lru_cache
+
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+MANIFEST_PATH = 'prefetch/manifest.json'
+
+# the names of the bundles
+BUNDLES = ('county', 'state')
+
+
+@lru_cache(maxsize=1)
+def read_manifest():
+    '''Returns the prefetch manifest, {bundle name: {'file': ..., 'hash': ..., 'encodings': [...]}}
+    where encodings are the suffixes of the compressed copies (e.g. '.gz'), or an empty dictionary
+    if there isn't one. Entries may also name the 'previous' file, which is kept for pages that
+    still link to it. Bundles only change when the site is deployed, so
+    this is only read once per process.
+    '''
+    path = finders.find(MANIFEST_PATH)
+    if path is None:
+        return {}
+    with open(path, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def prefetch_path(name):
+    '''Returns the static file path of the current bundle, e.g. 'prefetch/county.3f2a9c1e04b7.json'
+    (or 'prefetch/county.json', if there is no manifest)
+
+    :param name: 'county' or 'state'
+    '''
+    entry = read_manifest().get(name, None)
+    if entry is None:
+        return f'prefetch/{name}.json'
+    return f"prefetch/{entry['file']}"
+
+
+def prefetch_url(name):
+    '''Returns the URL of the current bundle
+
+    :param name: 'county' or 'state'
+    '''
+    return static(prefetch_path(name))
+
+
+def bundle_hash(name):
+    '''Returns the content hash of the current bundle, as in its file name (or an empty string,
+    if there is no manifest)
+
+    :param name: 'county' or 'state'
+    '''
+    return read_manifest().get(name, {}).get('file', f'{name}.json')[len(name) + 1:-len('.json')]
+
+
+@lru_cache(maxsize=len(BUNDLES))
+def read_bundle(path):
+    '''Returns the data in a bundle, or None if there is no such static file. Bundles with the
+    same path always have the same content, so each is only read once per process.
+
+    :param path: static file path of the bundle, from prefetch_path
+    '''
+    found = finders.find(path)
+    if found is None:
+        return None
+    with open(found, encoding='utf-8') as fp:
+        return json.load(fp)
@@ -0,0 +1,118 @@
+# A token-prefix index for search suggestions.
+#
+# Typeahead asks for suggestions on every keystroke, and searching the database for them means a
+# substring scan of the whole table each time. This index is built once, in memory: every word
+# (token) of every item's text, lower-cased, in one sorted list. The tokens starting with a
+# prefix are then a contiguous run of that list, found with two binary searches.
+#
+# Matching works the way Bloodhound.js matches its prefetched data in the browser: an item matches
+# if each query token is the start of one of its tokens (so "mont va" matches "Montgomery County
+# VA"). Hyphens, periods and apostrophes separate tokens as well as whitespace, so "dade" matches
+# "Miami-Dade County FL"; an item is also indexed by its words as they are, and without their
+# punctuation, so "miami-dade" (as the browser sends it) and "obrien" match too.
+#
+# Matches are ranked like the suggestion views always have: by how much longer the item's text
+# is than the query, shortest first (for "Mont", "Monty" before "Montgomery"). The query is the
+# same length for every item, so that is just ordering by the item's text length; items are
+# numbered in that order when the index is built, so the best k matches are the k lowest numbers.
+
+import heapq
+import re
+from bisect import bisect_left
+
+# sorts after any character a token can contain, to find the end of a run of tokens
+_AFTER_PREFIX = '\U0010ffff'
+
+# punctuation that separates the parts of a word, as in "Miami-Dade", "St. Louis" and "O'Brien"
+_PUNCTUATION = re.compile(r"[-.']+")
+
+
+def tokenize(text):
+    """
+    Splits text into lower-cased tokens on whitespace, hyphens, periods and apostrophes
+
+    :param text: str
+
+    """
+    return _PUNCTUATION.sub(' ', text.lower()).split()
+
+
+def item_tokens(text):
+    """
+    Returns the tokens an item's text is indexed by: each of its words (split on whitespace, as
+    Bloodhound.tokenizers.whitespace does), and for words with punctuation, also their parts and
+    the word without it. Keeps the text's case, and the order the tokens are found in.
+
+    :param text: str
+
+    """
+    tokens = []
+    for word in text.split():
+        tokens.append(word)
+        if _PUNCTUATION.search(word):
+            tokens.extend(_PUNCTUATION.split(word))
+            tokens.append(_PUNCTUATION.sub('', word))
+    # without repeats, or empty parts (e.g. of "St.")
+    return [token for (i, token) in enumerate(tokens) if token and token not in tokens[:i]]
+
+
+class PrefixIndex():
+    """
+    An immutable index of items by the tokens of their text
+    """
+
+    def __init__(self, items, text):
+        """
+        :param items: the items that can be returned (e.g. suggestion datums), in the order ties
+            are broken
+        :param text: function item -> the text the item is searched and ranked by
+
+        """
+        items = list(items)
+        texts = [text(item) for item in items]
+        # item numbers, in rank order: shortest text first, then the order they were given
+        order = sorted(range(len(items)), key=lambda i: len(texts[i]))
+        self.items = tuple(items[i] for i in order)
+
+        entries = sorted(
+            (token, rank)
+            for (rank, i) in enumerate(order)
+            for token in set(item_tokens(texts[i].lower()))
+        )
+        self.tokens = [token for (token, _) in entries]
+        self.ranks = [rank for (_, rank) in entries]
+
+    def __len__(self):
+        return len(self.items)
+
+    def _ranks_with_prefix(self, prefix):
+        # the ranks of every item with a token that starts with the prefix (maybe repeated)
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + _AFTER_PREFIX, start)
+        return self.ranks[start:end]
+
+    def search(self, query, limit):
+        """
+        Returns the best-ranked items matching every token of a query
+
+        :param query: text typed by the user
+        :param limit: largest number of items to return
+        :returns: list of items, best first
+
+        """
+        prefixes = tokenize(query)
+        if not prefixes or limit < 1:
+            return []
+
+        if len(prefixes) == 1:
+            ranks = set(self._ranks_with_prefix(prefixes[0]))
+        else:
+            # start from the prefix with the fewest matches, so the sets stay small
+            runs = sorted((self._ranks_with_prefix(prefix) for prefix in set(prefixes)), key=len)
+            ranks = set(runs[0])
+            for run in runs[1:]:
+                ranks.intersection_update(run)
+                if not ranks:
+                    break
+
+        return [self.items[rank] for rank in heapq.nsmallest(limit, ranks)]
@@ -1,3 +1,15 @@
+from django.db import DatabaseError
+
+from app_api.util import prefetch
+from app_api.util.fuzzy_index import FuzzyIndex
+from app_api.util.prefix_index import PrefixIndex, item_tokens
+from hda_privileged.geography import get_geography
+
+# The order of counties in the county prefetch data (see generate_prefetch_data). FIPS codes are
+# unique and all digits, so the order doesn't depend on the database's collation (which orders
+# names differently in SQLite and Postgres).
+COUNTY_PREFETCH_ORDER = ('fips5',)
+
 
 def datum_for_county(county):
     '''Given a US_County instance, returns a dictionary that can be
@@ -6,10 +18,91 @@ def datum_for_county(county):
     return {
         'id': county.fips5,
         'value': county.search_str,
-        'tokens': county.search_str.split(' '),
+        # split like the server's index, so the browser finds "Miami-Dade" by "dade" too
+        'tokens': item_tokens(county.search_str),
         'name': county.name,
         'state': county.state.full,
     }
 
 def datum_for_state(state):
     return state.full
+
+
+# (geography, bundle path, positions): the positions of counties in the county prefetch bundle,
+# and the geography and bundle they were found from, so that they are found again whenever either
+# changes
+_prefetch_positions = (None, None, None)
+
+
+def county_prefetch_positions():
+    '''Returns a dictionary of county ID -> position of that county in the county prefetch bundle
+    that pages link to (see prefetch.py). Compact chart series refer to counties by these
+    positions, rather than repeating their names. Counties that aren't in the bundle (e.g. ones
+    added since it was generated) are left out.
+    '''
+    global _prefetch_positions
+    geography = get_geography()
+    path = prefetch.prefetch_path('county')
+    (built_from, built_path, positions) = _prefetch_positions
+    if built_from is not geography or built_path != path:
+        bundle = prefetch.read_bundle(path) or []
+        by_fips = {datum['id']: position for (position, datum) in enumerate(bundle)}
+        positions = {
+            county.id: by_fips[county.fips5]
+            for county in geography.counties if county.fips5 in by_fips
+        }
+        _prefetch_positions = (geography, path, positions)
+    return positions
+
+
+# (geography, county index, state index): the suggestion indexes, and the geography they were
+# built from, so that they are rebuilt whenever the geography is reloaded
+_suggestion_indexes = (None, None, None)
+
+
+def get_suggestion_indexes():
+    '''Returns the (county, state) PrefixIndexes of suggestion datums, building them from the
+    in-memory geography the first time (and whenever the geography has been reloaded since).
+    County datums are searched and ranked by their 'value', states by their full name.
+    '''
+    global _suggestion_indexes
+    geography = get_geography()
+    (built_from, counties, states) = _suggestion_indexes
+    if built_from is not geography:
+        county_datums = [datum_for_county(c) for c in geography.counties]
+        counties = PrefixIndex(county_datums, lambda d: d['value'])
+        states = PrefixIndex([datum_for_state(s) for s in geography.states], str)
+        _suggestion_indexes = (geography, counties, states)
+    return (counties, states)
+
+
+# (geography, county index, state index): the same for the search results page
+_search_indexes = (None, None, None)
+
+
+def state_search_text(state):
+    return f'{state.full} {state.short}'
+
+
+def get_search_indexes():
+    '''Returns the (county, state) FuzzyIndexes of US_County and US_State instances for the
+    search results page, building them from the in-memory geography like the suggestion indexes.
+    Counties are searched and ranked by their search_str, states by their name and USPS code.
+    '''
+    global _search_indexes
+    geography = get_geography()
+    (built_from, counties, states) = _search_indexes
+    if built_from is not geography:
+        counties = FuzzyIndex(geography.counties, lambda c: c.search_str)
+        states = FuzzyIndex(geography.states, state_search_text)
+        _search_indexes = (geography, counties, states)
+    return (counties, states)
+
+
+def preload_search_indexes():
+    '''Builds the suggestion and search indexes now, if the database has the tables for them'''
+    try:
+        get_suggestion_indexes()
+        get_search_indexes()
+    except DatabaseError:
+        pass
@@ -1,109 +1,449 @@
-import json
+import gzip
+import re
 
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from app_api import chart_cache
+from app_api.util.downsample import lttb_indices
+from app_api.util.prefetch import bundle_hash, prefetch_url
+from app_api.util.search import county_prefetch_positions
 from app_api.views.get_json import GetJSON
-from hda_privileged.models import Data_Set, US_County, US_State
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Chart_Payload, Data_Point, Data_Set, Data_Set_Columns
+from hda_privileged.percentile import PERCENTILE_RANKS, unpack_percentile_values
 
+# Clients can ask for compact series with ?format=compact, or by accepting this media type
+COMPACT_MEDIA_TYPE = 'application/vnd.hda.compact+json'
 
-class PercentileSeries(GetJSON):
+# decimal places values are rounded to in compact series, if neither the request (?digits=)
+# nor the CHART_COMPACT_DIGITS setting says otherwise
+DEFAULT_COMPACT_DIGITS = 3
 
-    def get_data(self, data_set_id):
+# matches Accept-Encoding headers that allow gzip (the same test GZipMiddleware uses)
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+# percentile ranks as shown on the charts' x axes (0.1 - 99.9)
+PERCENTILE_AXIS = [round(p * 100, 2) for p in PERCENTILE_RANKS]
+
+
+def percentile_curve(packed, resolution=None):
+    """
+    Returns the points of a data set's percentile curve, optionally downsampled
+
+    :param packed: the data set's packed percentile_values (or None)
+    :param resolution: number of points to keep, chosen so the curve keeps its shape
+        (see downsample.py); None to keep all of them  (Default value = None)
+    :returns: (list of x values, list of y values)
+
+    """
+    if packed is None:
+        return ([], [])
+    values = unpack_percentile_values(packed)
+    if resolution is None or resolution >= len(values):
+        return (PERCENTILE_AXIS, values.tolist())
+    keep = lttb_indices(PERCENTILE_AXIS, values, resolution)
+    return ([PERCENTILE_AXIS[i] for i in keep], np.asarray(values)[keep].tolist())
+
+
+def percentile_series_config(packed, resolution=None):
+    """
+    Builds the Highcharts series for a data set's percentiles
+
+    :param packed: the data set's packed percentile_values (or None)
+    :param resolution: number of points to draw the curve with  (Default value = None)
+
+    """
+    (x, y) = percentile_curve(packed, resolution)
+    spline_points = list(zip(x, y))
+    return {
+        'name': 'Percentiles',
+        'type': 'spline',
+        'color': 'gray',
+        'enableMouseTracking': False,
+        'marker': {
+            'enabled': False,
+        },
+        'zIndex': -1,
+        'data': spline_points,
+    }
+
+
+def point_series_config(points):
+    """
+    Builds the Highcharts series for some of a data set's points
+
+    :param points: list of {'x': percentile rank (0-100), 'y': value, 'name': county name}
+
+    """
+    return {
+        'name': 'Values',
+        'type': 'scatter',
+        'color': 'darkred',
+        'enableMouseTracking': True,
+        'marker': {
+            'radius': 3,
+            'symbol': 'circle',
+        },
+        'tooltip': {
+            'pointFormat': r'{point.name}<br/>p: <b>{point.x}%</b><br/>v: <b>{point.y}</b><br/>',
+            'valueDecimals': 1,
+        },
+        'data': points
+    }
+
+
+def compact_series(config, x, y, digits, **arrays):
+    """
+    Converts a Highcharts series into the compact format: the series options without any data,
+    and the data as parallel arrays (x, y and any others given), with values rounded.
+    The chart script (highcharts_single.js) expands these back into normal series.
+
+    :param config: series options, e.g. from percentile_series_config (any data is dropped)
+    :param x: x values of each point
+    :param y: y values of each point, rounded to the given number of decimal places
+    :param digits: decimal places to round y values to
+    :param arrays: any other per-point arrays to include
+
+    """
+    options = {key: value for (key, value) in config.items() if key != 'data'}
+    rounded = np.round(np.asarray(y, dtype=np.float64), digits).tolist()
+    return dict({'format': 'compact', 'options': options, 'x': list(x), 'y': rounded}, **arrays)
+
+
+def row_to_dict(row, name):
+    """
+    Converts a point read from a data set's columns into a point for point_series_config
+
+    :param row: ColumnRow
+    :param name: the name of the point's county
+
+    """
+    return {'x': round(row.rank * 100, 2), 'y': row.value, 'name': name}
+
+
+def column_points(columns, counties, state_fips=None, requested_fips=None):
+    """
+    Reads the points for a state, or a list of counties, from a data set's columns
+
+    :param columns: the data set's Data_Set_Columns
+    :param counties: (id, name, state USPS code, 5-digit FIPS code) of every county in the state,
+        or of each requested county that exists
+    :param state_fips: 2-digit FIPS code of the state  (Default value = None)
+    :param requested_fips: FIPS codes of the requested counties, if there is no state
+        (Default value = None)
+    :returns: (points, unmatched FIPS codes, unmatched counties), where points are
+        (county ID, x, y, county name) tuples and unmatched counties are 'name, state' strings
+
+    """
+    counties = list(counties)
+    if requested_fips is None:
+        rows = columns.get_rows(state_fips)
+        unmatched_fips = []
+    else:
+        found = {fips for (_, _, _, fips) in counties}
+        rows = columns.get_rows_for_counties([fips for fips in requested_fips if fips in found])
+        unmatched_fips = [fips for fips in requested_fips if fips not in found]
+
+    names = {county_id: name for (county_id, name, _, _) in counties}
+    points = [(row.county_id, round(row.rank * 100, 2), row.value, names[row.county_id]) for row in rows]
+    with_points = {row.county_id for row in rows}
+    unmatched_counties = [f"{name}, {state_id}" for (county_id, name, state_id, _) in counties
+                          if county_id not in with_points]
+    return (points, unmatched_fips, unmatched_counties)
+
+
+def county_tuples(counties):
+    """
+    Converts counties into the (id, name, state USPS code, 5-digit FIPS code) tuples
+    column_points takes
+
+    :param counties: US_County instances
+
+    """
+    return [(county.id, county.name, county.state_id, county.fips5) for county in counties]
+
+
+def point_payload(config, unmatched_fips, unmatched_counties):
+    """
+    Builds the response for a point series, reporting any counties that have no point
+
+    :param config: the series, e.g. from point_series_config
+    :param unmatched_fips: requested FIPS codes that don't match a county
+    :param unmatched_counties: 'name, state' of requested counties that have no point
+
+    """
+    errors = dict()
+
+    if len(unmatched_fips) > 0:
+        errors['no_county'] = '; '.join(unmatched_fips)
+
+    if len(unmatched_counties) > 0:
+        errors['no_fips'] = '; '.join(unmatched_counties)
+
+    return {
+        'config': config,
+        'errors': errors,
+    }
+
+
+def stored_response(request, body):
+    """
+    Sends a stored chart payload (see materialize.py): as it is, if the client accepts gzip,
+    otherwise decompressed
+
+    :param request: the request being answered
+    :param body: the payload's gzipped JSON
+
+    """
+    body = bytes(body)
+    if ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(body, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(body), content_type='application/json')
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+class DataSetSeries(GetJSON):
+    """
+    A chart series for a single data set. Data sets don't change once they are uploaded, so the
+    series is versioned by the data set's modified_at time: clients that already have the current
+    version get a 304, and responses can be cached for a long time. Built series are also kept
+    in a server-side cache (see chart_cache.py), so each one is only built once. The most common
+    series are stored when the data set is uploaded (see materialize.py) and sent as they are.
+
+    MUST BE SUBCLASSED, implementing build_data
+    """
+
+    # change this whenever the JSON for a series changes shape, so cached copies are not reused
+    payload_version = 1
+
+    # name of the series in server-side cache keys, and its Chart_Payload kind
+    cache_kind = None
+
+    @property
+    def cache_max_age(self):
+        return getattr(settings, 'CHART_CACHE_MAX_AGE', None)
+
+    def is_compact(self):
+        return (self.request.GET.get('format', None) == 'compact' or
+                COMPACT_MEDIA_TYPE in self.request.META.get('HTTP_ACCEPT', ''))
+
+    def get_digits(self):
+        # decimal places to round values to in compact series, between 0 and 15
+        default = getattr(settings, 'CHART_COMPACT_DIGITS', DEFAULT_COMPACT_DIGITS)
+        try:
+            digits = int(self.request.GET.get('digits', default))
+        except ValueError:
+            digits = default
+        return min(max(digits, 0), 15)
+
+    def get_representation(self):
+        # which encoding of the series is returned; part of the version and cache key (compact
+        # series name counties by their positions in the county bundle, so that is part of it too)
+        if self.is_compact():
+            return f"compact{self.get_digits()}-{bundle_hash('county')}"
+        return 'full'
+
+    def get_version(self, data_set_id):
         # THROWS
-        data_set = Data_Set.objects.get(pk=data_set_id)
-        percentiles = data_set.percentiles.all().order_by('rank')
-        spline_points = [(round(p.rank * 100, 2), p.value) for p in percentiles]
-        config = {
-            'name': 'Percentiles',
-            'type': 'spline',
-            'color': 'gray',
-            'enableMouseTracking': False,
-            'marker': {
-                'enabled': False,
-            },
-            'zIndex': -1,
-            'data': spline_points,
-        }
-        return {'config': config}
-
-class PointSeries(GetJSON):
-
-    def try_get_county(self, fips_code):
+        modified_at = Data_Set.objects.values_list('modified_at', flat=True).get(pk=data_set_id)
+        etag = (f"{type(self).__name__}-{data_set_id}-{modified_at.timestamp():.6f}"
+                f"-v{self.payload_version}-{self.get_representation()}")
+        self.version = etag
+        return (etag, modified_at)
+
+    def set_validators(self, response, etag, last_modified):
+        super().set_validators(response, etag, last_modified)
+        # the same URL has a different (compact) body for clients that Accept one
+        patch_vary_headers(response, ['Accept'])
+
+    def get_location(self):
+        # the part of the request, other than the data set, that the series depends on
+        return ''
+
+    def get_stored_state(self):
+        # the state of the stored Chart_Payload that answers this request ('' for a series that
+        # isn't per-state), or None if the series has to be built
+        return None
+
+    def build_data(self, data_set_id):
+        pass
+
+    def get_response(self, data_set_id):
+        state = self.get_stored_state()
+        if state is not None:
+            body = (Chart_Payload.objects
+                    .filter(data_set_id=data_set_id, kind=self.cache_kind, state=state)
+                    .values_list('body', flat=True)
+                    .first())
+            if body is not None:
+                return stored_response(self.request, body)
+        return super().get_response(data_set_id)
+
+    def get_data(self, data_set_id):
+        return chart_cache.get_or_build(
+            self.cache_kind, data_set_id, self.version,
+            f'{self.get_location()}|{self.get_representation()}',
+            lambda: self.build_data(data_set_id)
+        )
+
+
+class PercentileSeries(DataSetSeries):
+
+    cache_kind = 'percentiles'
+
+    def get_resolution(self):
+        # ?resolution=N draws the curve with N (at least 3) of its points, for small charts
         try:
-            return US_County.objects.get(fips5=fips_code)
-        except US_County.DoesNotExist:
+            resolution = int(self.request.GET['resolution'])
+        except (KeyError, ValueError):
+            return None
+        return min(max(resolution, 3), len(PERCENTILE_RANKS))
+
+    def get_location(self):
+        return f'resolution={self.get_resolution()}'
+
+    def get_stored_state(self):
+        # only the whole curve, in the full encoding, is stored
+        if self.is_compact() or self.get_resolution() is not None:
+            return None
+        return ''
+
+    def build_data(self, data_set_id):
+        # only read the packed percentile column  THROWS
+        packed = Data_Set.objects.values_list('percentile_values', flat=True).get(pk=data_set_id)
+        if self.is_compact():
+            (x, y) = percentile_curve(packed, self.get_resolution())
+            return {'config': compact_series(percentile_series_config(None), x, y, self.get_digits())}
+        return {'config': percentile_series_config(packed, self.get_resolution())}
+
+
+class PointSeries(DataSetSeries):
+
+    cache_kind = 'points'
+
+    def get_location(self):
+        requested_state = self.request.GET.get('state', None)
+        if requested_state:
+            return f'state={requested_state.upper()}'
+        return f"county={self.request.GET.get('county', '')}"
+
+    def get_stored_state(self):
+        # states' points are stored in the full encoding; lists of counties are always built
+        requested_state = self.request.GET.get('state', None)
+        if self.is_compact() or not requested_state:
             return None
+        return requested_state.upper()
 
-    def try_get_point(self, data_set, county):
-        return data_set.data_points.filter(county=county).first()
+    def get_requested_state(self, requested_state):
+        state = get_geography().get_state(requested_state)
+        if state is None:
+            raise Exception(f"No state matches {requested_state}")
+        return state
 
     def get_requested_counties(self):
+        # counties come from the in-memory geography, with their states attached
+        geography = get_geography()
         requested_state = self.request.GET.get('state', None)
         if requested_state:
-            state = US_State.objects.get(pk=requested_state.upper())  # THROWS
-            return ([county for county in state.counties.all().iterator()], [])
+            state = self.get_requested_state(requested_state)  # THROWS
+            return (list(geography.get_counties(state.short)), [])
         else:
             requested_fips = self.request.GET.get('county', None)
 
             if requested_fips is None:
                 raise Exception('Endpoint must be called with a state or county query string')
 
-            fips_list = requested_fips.split(',')
-            query_results = [(fips, self.try_get_county(fips)) for fips in fips_list]
-            matched = [county for (_, county) in query_results if county]
-            unmatched = [fips for (fips, county) in query_results if not county]
-            return (matched, unmatched)
-
+            return geography.get_counties_for_fips(requested_fips.split(','))
 
     def get_requested_points(self, data_set, counties):
-        query_results = [(county, self.try_get_point(data_set, county)) for county in counties]
-        points = [point for (_, point) in query_results if point]
-        unmatched = [county for (county, point) in query_results if not point]
+        # one query for every requested point, joined to its county and state,
+        # selecting only the columns that go in the chart
+        # (not data_set.data_points, which would also load each point's deferred data_set_id)
+        query = (Data_Point.objects
+                 .filter(data_set=data_set, county__in=counties)
+                 .select_related('county__state')
+                 .only('value', 'rank', 'county__name', 'county__state__short')
+                 .order_by('pk'))
+        points_by_county = dict()
+        for point in query:
+            # if a county has more than one point, use the first
+            points_by_county.setdefault(point.county_id, point)
+
+        points = []
+        unmatched = []
+        for county in counties:
+            point = points_by_county.get(county.id, None)
+            if point is None:
+                unmatched.append(county)
+            else:
+                points.append(point)
         return (points, unmatched)
 
-    def point_to_dict(self, point):
-        return {
-            'x': round(point.rank * 100, 2),
-            'y': point.value,
-            'name': point.county.name,
-        }
+    def get_column_points(self, columns):
+        # the same as get_requested_counties + get_requested_points, but reading the data set's
+        # packed columns instead of a Data_Point per county
+        (counties, _) = self.get_requested_counties()  # THROWS
+        requested_state = self.request.GET.get('state', None)
+        if requested_state:
+            state = self.get_requested_state(requested_state)
+            return column_points(columns, county_tuples(counties), state_fips=state.fips)
 
-    def get_data(self, data_set_id):
-
-        data_set = Data_Set.objects.get(pk=data_set_id)  # THROWS
+        requested_fips = self.request.GET['county'].split(',')
+        return column_points(columns, county_tuples(counties), requested_fips=requested_fips)
 
+    def get_model_points(self, data_set):
         (counties, unmatched_fips) = self.get_requested_counties()  # THROWS
 
         (points, unmatched_counties) = self.get_requested_points(data_set, counties)
 
-        config = {
-            'name': 'Values',
-            'type': 'scatter',
-            'color': 'darkred',
-            'enableMouseTracking': True,
-            'marker': {
-                'radius': 3,
-                'symbol': 'circle',
-            },
-            'tooltip': {
-                'pointFormat': r'{point.name}<br/>p: <b>{point.x}%</b><br/>v: <b>{point.y}</b><br/>',
-                'valueDecimals': 1,
-            },
-            'data': [self.point_to_dict(p) for p in points]
-        }
+        return (
+            [(p.county_id, round(p.rank * 100, 2), p.value, p.county.name) for p in points],
+            unmatched_fips,
+            [f"{county.name}, {county.state.short}" for county in unmatched_counties],
+        )
+
+    def encode_points(self, points):
+        # points are (county ID, x, y, county name) tuples
+        # in compact series, counties are sent as their positions in the county prefetch data,
+        # which has their names; a county the bundle doesn't have (yet) can only be named in full
+        positions = county_prefetch_positions() if self.is_compact() else {}
+        if not self.is_compact() or any(c not in positions for (c, _, _, _) in points):
+            return point_series_config([{'x': x, 'y': y, 'name': name} for (_, x, y, name) in points])
 
-        errors = dict()
+        return compact_series(
+            point_series_config([]),
+            [x for (_, x, _, _) in points],
+            [y for (_, _, y, _) in points],
+            self.get_digits(),
+            county=[positions[county_id] for (county_id, _, _, _) in points],
+            county_list=prefetch_url('county'),
+        )
 
-        if len(unmatched_fips) > 0:
-            errors['no_county'] = '; '.join(unmatched_fips)
+    def build_data(self, data_set_id):
 
-        if len(unmatched_counties) > 0:
-            errors['no_fips'] = '; '.join(
-                [f"{county.name}, {county.state.short}" for county in unmatched_counties]
-            )
+        data_set = Data_Set.objects.get(pk=data_set_id)  # THROWS
+
+        # data sets uploaded before columns existed only have Data_Points
+        columns = Data_Set_Columns.objects.filter(data_set=data_set).first()
+        if columns is not None:
+            (points, unmatched_fips, unmatched_counties) = self.get_column_points(columns)  # THROWS
+        else:
+            (points, unmatched_fips, unmatched_counties) = self.get_model_points(data_set)  # THROWS
 
-        return {
-            'config': config,
-            'errors': errors,
-        }
+        return point_payload(self.encode_points(points), unmatched_fips, unmatched_counties)
 
 
+class ChartCacheStats(GetJSON):
+    """
+    Reports how often chart series were served from the server-side cache (staff only; see
+    app_api/urls.py)
+    """
 
+    def get_data(self):
+        return chart_cache.get_stats()
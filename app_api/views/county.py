@@ -1,5 +1,4 @@
-from django.db.models import Value, F
-from django.db.models.functions import Concat
+from django.db.models import F
 
 from app_api.views.list_all import ListEndpoint
 from hda_privileged.models import US_County
@@ -8,9 +7,10 @@ from hda_privileged.models import US_County
 class ListAll(ListEndpoint):
 
     model = US_County
+    key_field = 'fips5'
 
     def get_values_queryset(self, request):
         return US_County.objects.values(
             'name', 'fips5', 'state',
-            search=Concat('name', Value(' '), 'state__short')
+            search=F('search_str')
         )
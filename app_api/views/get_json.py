@@ -1,19 +1,52 @@
 from django.http import JsonResponse, HttpResponseServerError
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views import View
 
 
 class GetJSON(View):
 
+    # how long (in seconds) browsers and caches may reuse a response, for endpoints that have a
+    # version (see get_version); None to not send a Cache-Control header
+    cache_max_age = None
+
     def get_data(self, *args, **kwargs):
         return dict()
 
+    def get_version(self, *args, **kwargs):
+        # Returns (etag, last_modified) for the data get_data would return, so that requests
+        # with a matching If-None-Match or If-Modified-Since get a 304 without calling get_data.
+        # etag is an (unquoted) string and last_modified a datetime; either may be None.
+        return (None, None)
+
+    def get_response(self, *args, **kwargs):
+        # the response for a request the client doesn't already have the current version of
+        return JsonResponse(self.get_data(*args, **kwargs))
+
+    def set_validators(self, response, etag, last_modified):
+        if etag is not None:
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        if (etag or last_modified) and self.cache_max_age is not None:
+            patch_cache_control(response, public=True, max_age=self.cache_max_age)
+
     # def get(self, request, *args, **kwargs):
     #     data = self.get_data(*args, **kwargs)
     #     return JsonResponse(data)
 
     def get(self, request, *args, **kwargs):
         try:
-            data = self.get_data(*args, **kwargs)
-            return JsonResponse(data)
+            (etag, last_modified) = self.get_version(*args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = int(last_modified.timestamp()) if last_modified is not None else None
+
+            # a 304 Not Modified if the client already has this version, otherwise None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = self.get_response(*args, **kwargs)
+
+            self.set_validators(response, etag, last_modified)
+            return response
         except Exception as exc:
             return HttpResponseServerError(str(exc))
@@ -1,15 +1,89 @@
+# Endpoints that list every instance of a model, e.g. every county.
+#
+# The list is streamed: rows are read from the database cursor and written out one at a time,
+# so memory use doesn't grow with the table. Clients can also ask for only some of the fields
+# (?fields=name,fips5), and read the list a page at a time (?limit=500, then ?after=<the key of
+# the last row>&limit=500, using the "next" key of each page).
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.views import View
-from django.http import JsonResponse
+
+# how many rows to fetch from the database cursor at a time
+CHUNK_SIZE = 500
 
 
 class ListEndpoint(View):
+    """
+    MUST BE SUBCLASSED, setting model and key_field
+    """
 
     model = None
 
+    # the field rows are ordered and paged by; must be unique
+    key_field = None
+
+    # the largest page a client can ask for
+    max_limit = 5000
+
     def get_values_queryset(self, request):
         return self.model.objects.values()
 
+    def get_fields(self, request, available):
+        # the fields asked for with ?fields=, in the order asked for (default: all of them)
+        requested = request.GET.get('fields', None)
+        if not requested:
+            return list(available)
+        fields = requested.split(',')
+        unknown = [field for field in fields if field not in available]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        return fields
+
+    def get_limit(self, request):
+        # the number of rows asked for with ?limit=, or None for every row
+        if 'limit' not in request.GET:
+            return None
+        try:
+            limit = int(request.GET['limit'])
+        except ValueError:
+            raise ValueError('limit must be a number')
+        if not 0 < limit <= self.max_limit:
+            raise ValueError(f"limit must be between 1 and {self.max_limit}")
+        return limit
+
+    def stream(self, query, fields, limit):
+        # Yields the JSON for {"values": [...], "next": key}, a row at a time. The page is read
+        # with one extra row, so that "next" is only given if there are more rows after it.
+        encoder = DjangoJSONEncoder()
+        yield '{"values": ['
+
+        last_key = None
+        for (i, row) in enumerate(query.iterator(chunk_size=CHUNK_SIZE)):
+            if limit is not None and i == limit:
+                yield f'], "next": {encoder.encode(last_key)}}}'
+                return
+            last_key = row[self.key_field]
+            separator = ', ' if i else ''
+            yield separator + encoder.encode({field: row[field] for field in fields})
+
+        yield '], "next": null}'
+
     def get(self, request):
         query = self.get_values_queryset(request)
-        items = list(query.iterator())
-        return JsonResponse({'values': items})
+        try:
+            # every field of the values() query, in the order rows have them
+            available = query.query.values_select + tuple(query.query.annotation_select)
+            fields = self.get_fields(request, available)
+            limit = self.get_limit(request)
+        except ValueError as exc:
+            return HttpResponseBadRequest(str(exc))
+
+        query = query.order_by(self.key_field)
+        after = request.GET.get('after', None)
+        if after:
+            query = query.filter(**{f'{self.key_field}__gt': after})
+        if limit is not None:
+            query = query[:limit + 1]
+
+        return StreamingHttpResponse(self.stream(query, fields, limit), content_type='application/json')
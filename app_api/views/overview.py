@@ -0,0 +1,134 @@
+# Every chart series for a location overview page, in one response.
+#
+# The overview page shows a small chart for each important indicator, and each chart used to
+# request its percentile and point series separately: two requests (and two sets of queries) per
+# indicator. This endpoint returns every series the page needs at once, reading them with the
+# same handful of queries no matter how many indicators there are.
+
+from django.conf import settings
+from django.db.models import Q
+
+from app_api.views.chart import percentile_series_config, point_series_config, row_to_dict
+from app_api.views.get_json import GetJSON
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Data_Point, Data_Set, Data_Set_Columns
+
+from util.collections import index_selector, group_by_selector
+
+
+# how many points the percentile curves of small charts are drawn with, if neither the request
+# (?resolution=) nor the CHART_SMALL_RESOLUTION setting says otherwise
+DEFAULT_SMALL_RESOLUTION = 100
+
+
+class OverviewSeries(GetJSON):
+    """
+    Returns the percentile and point series for the most recent data set of every important
+    health indicator that has data for a location (?state=VA or ?county=51059).
+    The charts are small, so their percentile curves are downsampled (?resolution=).
+    """
+
+    def get_location(self, state=None, county=None):
+        # Returns (counties, fips prefix) for a state's USPS code or a county's FIPS code, where
+        # counties is a list of (id, name) tuples and the prefix matches every one of them
+        geography = get_geography()
+        if state:
+            found = geography.get_state(state)
+            if found is None:
+                raise Exception(f"No state matches {state}")
+            counties = geography.get_counties(found.short)
+            prefix = found.fips
+        else:
+            if county is None:
+                raise Exception('Endpoint must be called with a state or county query string')
+
+            found = geography.get_county(county)
+            counties = [found] if found is not None else []
+            prefix = county
+
+        counties = [(c.id, c.name) for c in counties]
+        if not counties:
+            raise Exception(f"No county matches {prefix}")
+        return (counties, prefix)
+
+    def get_latest_data_sets(self, county_ids, prefix):
+        # the most recent data set of each important indicator with a point in one of the counties,
+        # from the states and counties recorded for each data set (see Data_Set_State)
+        if len(prefix) == 2:
+            available = Q(states__state__fips=prefix)
+        else:
+            available = Q(counties__county__in=county_ids)
+        data_set_meta = (Data_Set.objects
+                         .filter(available, indicator__important=True)
+                         .values('id', 'year', 'indicator', 'indicator__name')
+                         .distinct())
+        grouped_by_indicator = group_by_selector(data_set_meta.iterator(), index_selector('indicator'))
+        latest = [max(dsm, key=index_selector('year')) for dsm in grouped_by_indicator.values()]
+        latest.sort(key=index_selector('indicator'))
+        return latest
+
+    def get_points(self, data_set_ids, counties, prefix):
+        # Returns {data set ID: list of points} for the requested location
+        names = dict(counties)
+        points = {ds_id: [] for ds_id in data_set_ids}
+
+        missing = set(data_set_ids)
+        for columns in Data_Set_Columns.objects.filter(data_set_id__in=data_set_ids):
+            points[columns.data_set_id] = [
+                row_to_dict(row, names[row.county_id]) for row in columns.get_rows(prefix)
+            ]
+            missing.discard(columns.data_set_id)
+
+        # data sets uploaded before columns existed: one query for all of their points
+        if missing:
+            query = (Data_Point.objects
+                     .filter(data_set_id__in=missing, county_id__in=names.keys())
+                     .order_by('pk')
+                     .values_list('data_set_id', 'county_id', 'value', 'rank'))
+            for (ds_id, county_id, value, rank) in query:
+                points[ds_id].append({'x': round(rank * 100, 2), 'y': value, 'name': names[county_id]})
+
+        return points
+
+    def get_data(self):
+        try:
+            resolution = int(self.request.GET['resolution'])
+        except (KeyError, ValueError):
+            resolution = None
+        return self.build_series(
+            state=self.request.GET.get('state', None),
+            county=self.request.GET.get('county', None),
+            resolution=resolution
+        )
+
+    def build_series(self, state=None, county=None, resolution=None):
+        """
+        Builds the series for a location; pages can call this directly to embed the payload
+
+        :param state: USPS code of a state  (Default value = None)
+        :param county: 5-digit FIPS code of a county, if no state is given  (Default value = None)
+        :param resolution: number of points in each percentile curve (at least 3); by default
+            the CHART_SMALL_RESOLUTION setting  (Default value = None)
+
+        """
+        if resolution is None:
+            resolution = getattr(settings, 'CHART_SMALL_RESOLUTION', DEFAULT_SMALL_RESOLUTION)
+        resolution = max(resolution, 3)
+        (counties, prefix) = self.get_location(state, county)  # THROWS
+        latest = self.get_latest_data_sets([county_id for (county_id, _) in counties], prefix)
+        data_set_ids = [dsm['id'] for dsm in latest]
+
+        percentiles = dict(Data_Set.objects.filter(id__in=data_set_ids).values_list('id', 'percentile_values'))
+        points = self.get_points(data_set_ids, counties, prefix)
+
+        charts = [
+            {
+                'indicator': dsm['indicator__name'],
+                'data_set_id': dsm['id'],
+                'year': dsm['year'],
+                'percentiles': percentile_series_config(percentiles[dsm['id']], resolution),
+                'points': point_series_config(points[dsm['id']]),
+            }
+            for dsm in latest
+        ]
+        return {'charts': charts}
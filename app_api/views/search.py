@@ -1,10 +1,6 @@
 from django.http import JsonResponse
 from django.views import View
 
-from django.db.models import F
-
-from hda_privileged.models import US_State, US_County
-
 from app_api.util import search
 
 
@@ -19,55 +15,32 @@ class Suggestions(View):
     '''
     limit = 5
 
-    def make_datum(self, object):
-        pass
-
-    def stringify_datum(self, result):
-        return str(result)
-
-    def filter_model(self, query):
+    def get_index(self):
+        # PrefixIndex of every datum that can be suggested
         pass
 
-    # sort results by the difference between the length of the query and
-    # the length of the field we were searching in when matching the result
-    # (If query is "Mont" and we have results "Monty" and "Montgomery", we want
-    # "Monty" to rank higher)
-    def rank(self, query, results):
-        query_len = len(query)
-
-        def compare(result):
-            as_str = self.stringify_datum(result)
-            return len(as_str) - query_len
-
-        return sorted(results, key=compare)
-
+    # Matches are ranked by the difference between the length of the query and the length of
+    # the field we were searching in when matching the result (If query is "Mont" and we have
+    # results "Monty" and "Montgomery", we want "Monty" to rank higher). The index keeps its
+    # datums in that order, so only the best few are ever looked at (see prefix_index.py).
     def get(self, request, query=None):
         objects = []
 
         if query:
-            matches = self.filter_model(query)
-            datums = [self.make_datum(m) for m in matches.iterator()]
-            objects = self.rank(query, datums)[:self.limit]
+            objects = self.get_index().search(query, self.limit)
 
         return JsonResponse(objects, safe=False)
 
 
 class StateSuggestions(Suggestions):
 
-    def make_datum(self, obj):
-        return search.datum_for_state(obj)
-
-    def filter_model(self, query):
-        return US_State.objects.filter(full__icontains=query)
+    def get_index(self):
+        (_, states) = search.get_suggestion_indexes()
+        return states
 
 
 class CountySuggestions(Suggestions):
 
-    def make_datum(self, obj):
-        return search.datum_for_county(obj)
-
-    def stringify_datum(self, result):
-        return result['value']
-
-    def filter_model(self, query):
-        return US_County.objects.filter(search_str__icontains=query)
+    def get_index(self):
+        (counties, _) = search.get_suggestion_indexes()
+        return counties
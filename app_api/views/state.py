@@ -8,6 +8,7 @@ from hda_privileged.models import US_State
 class ListAll(ListEndpoint):
 
     model = US_State
+    key_field = 'fips'
 
     def get_values_queryset(self, request):
         return US_State.objects.values(
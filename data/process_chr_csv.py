@@ -24,6 +24,9 @@
 #     9:"Adult Smoking" 85:"Uninsured" 4:"Primary Care Physicians" 69:"Some College" `
 #     23:"Unemployment" 24:"Children in Poverty"
 #
+# NOTE: the load_chr_file management command (and the CHR option on the upload page) can load
+# several measures straight from the CHR file in one pass, without creating these files first.
+#
 # Matthew Seiler
 import argparse
 import csv
@@ -0,0 +1 @@
+default_app_config = 'hda_privileged.apps.HdaPrivilegedConfig'
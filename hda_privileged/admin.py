@@ -4,6 +4,21 @@ from .models import *
 
 # Register your models here.
 
+class Read_Only_Admin_Mixin():
+    """
+    Lets staff view, but not add, change or delete, a model in the admin interface
+    """
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 class Data_Point_Inline(admin.TabularInline):
     """
 
@@ -18,15 +33,24 @@ class Data_Set_Inline(admin.StackedInline):
     model = Data_Set
 
 
-class US_County_Inline(admin.TabularInline):
+class US_County_Inline(Read_Only_Admin_Mixin, admin.TabularInline):
     """
 
     """
     model = US_County
 
 
+class US_County_Data_Point_Inline(Read_Only_Admin_Mixin, Data_Point_Inline):
+    """
+
+    """
+
+
+# States and counties are read-only here: every process keeps them in memory (see geography.py),
+# and only the process that saved a change would see it until the site is restarted.
+
 @admin.register(US_State)
-class US_State_Admin(admin.ModelAdmin):
+class US_State_Admin(Read_Only_Admin_Mixin, admin.ModelAdmin):
     """
     US_State model representation in admin interface
     """
@@ -34,11 +58,11 @@ class US_State_Admin(admin.ModelAdmin):
 
 
 @admin.register(US_County)
-class US_Counties_Admin(admin.ModelAdmin):
+class US_Counties_Admin(Read_Only_Admin_Mixin, admin.ModelAdmin):
     """
     US_Counties model representation in admin interface
     """
-    inlines = (Data_Point_Inline,)
+    inlines = (US_County_Data_Point_Inline,)
 
 
 @admin.register(Health_Indicator)
@@ -73,3 +97,13 @@ class Data_Point_Admin(admin.ModelAdmin):
     Data_Points model representation in admin interface
     """
     search_fields = ('county__name', 'county__state__name',)
+
+
+@admin.register(Upload_Job)
+class Upload_Job_Admin(admin.ModelAdmin):
+    """
+    Upload_Job model representation in admin interface
+    """
+    list_display = ('id', 'document', 'indicator', 'year', 'phase', 'created_at')
+    list_filter = ('phase',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
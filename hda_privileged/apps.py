@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class HdaPrivilegedConfig(AppConfig):
     name = 'hda_privileged'
+
+    def ready(self):
+        # connects the signal receivers that drop the in-memory geography when it may be stale
+        from hda_privileged import geography
+        if getattr(settings, 'GEOGRAPHY_PRELOAD', False):
+            geography.preload()
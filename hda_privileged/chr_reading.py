@@ -0,0 +1,185 @@
+# Reads County Health Rankings (CHR) "wide" CSV files directly into data sets.
+#
+# CHR publishes every measure for a year in one large CSV file, with one row per county and a
+# 'measure_ID_value' column for each measure. data/process_chr_csv.py splits that file into one
+# uploadable file per measure, but then every file has to be uploaded (and its counties matched)
+# separately. This reads the wide file once, matches each row's county once, and builds one
+# data set per selected measure, all in a single transaction.
+#
+# Measure IDs are listed in the CHR documentation, e.g.:
+# http://www.countyhealthrankings.org/sites/default/files/CHR2018_CSV_SAS_documentation.pdf
+
+import csv
+import time
+
+from django.db import transaction
+
+from hda_privileged.ingest import (
+    IngestStats,
+    PROGRESS_INTERVAL,
+    ValueColumn,
+    county_fips_by_id,
+    report_progress,
+    save_value_column
+)
+from hda_privileged.models import Health_Indicator, Upload_Job
+from hda_privileged.upload_reading import CountyResolver
+
+# Upload format choice for CHR files (see upload_reading.UPLOAD_FORMAT_CHOICES)
+CHOICE_CHR = "CHR"
+CHR_FORMAT_CHOICE = (
+    CHOICE_CHR,
+    "County Health Rankings file, one data set per measure ('measure_ID_value')"
+)
+
+# Column in the CHR file that contains the State FIPS code for the current row
+INPUT_STATE_HEADER = 'FIPS State Code'
+# Column in the CHR file that contains the County FIPS code for the current row
+INPUT_COUNTY_HEADER = 'FIPS County Code'
+
+
+def value_header(measure_id):
+    """
+    Returns the name of the CHR column holding values for a measure
+
+    :param measure_id: integer CHR measure ID
+    :returns: e.g. 'measure_11_value'
+
+    """
+    return f'measure_{measure_id:d}_value'
+
+
+def parse_measure_spec(value):
+    """
+    Parses a measure given as 'ID:NAME' (e.g. '11:Obesity') into a tuple (11, 'Obesity')
+
+    :param value: 'ID:NAME' string
+    :returns: (int, str)
+    :raises ValueError: if the ID is not an integer or there is no name
+
+    """
+    (measure_id, _, name) = value.partition(':')
+    name = name.strip()
+    if not name:
+        raise ValueError(f"Measure '{value}' should look like ID:NAME")
+    return (int(measure_id), name)
+
+
+def parse_measure_list(text):
+    """
+    Parses one 'ID:NAME' measure per (non-blank) line
+
+    :param text: measures, one per line
+    :returns: list of (int, str)
+
+    """
+    return [parse_measure_spec(line) for line in text.splitlines() if line.strip()]
+
+
+def is_all_zero(fips):
+    """
+    Checks if a string is composed of all '0' characters.
+    We use this to determine if a FIPS code refers to a state or national aggregate value.
+
+    :param fips: a FIPS code
+    :returns: True if the string is all '0's, False otherwise
+
+    """
+    return fips.strip('0') == ''
+
+
+def read_chr_columns(file, measure_ids, stats, resolver=None, progress=None):
+    """
+    Reads the values of several measures out of a CHR file in one pass. Each row's county is
+    matched once, no matter how many measures are read. State and national aggregate rows
+    (county or state FIPS code of all zeroes) are counted as skipped. Blank values are left out of
+    their measure's column, and so are values that aren't numbers (listed in stats.non_numeric).
+
+    :param file: open CHR CSV file (text mode)
+    :param measure_ids: list of integer CHR measure IDs
+    :param stats: IngestStats to count rows and unmatched counties in
+    :param resolver: CountyResolver to match counties with  (Default value = None)
+    :param progress: called every PROGRESS_INTERVAL rows  (Default value = None)
+    :returns: dict of measure ID -> ValueColumn
+
+    """
+    resolver = resolver or CountyResolver()
+    headers = {mid: value_header(mid) for mid in measure_ids}
+    columns = {mid: ValueColumn() for mid in measure_ids}
+
+    reader = csv.DictReader(file)
+    missing = [h for h in headers.values() if h not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CHR file has no column(s): {', '.join(missing)}")
+
+    for row in reader:
+        stats.rows += 1
+        state_fips = row[INPUT_STATE_HEADER]
+        county_fips = row[INPUT_COUNTY_HEADER]
+
+        if is_all_zero(state_fips) or is_all_zero(county_fips):
+            stats.skipped += 1
+        else:
+            (county, error) = resolver.county_for_fips(state_fips, county_fips)
+            if county is not None:
+                stats.matched += 1
+                for (mid, header) in headers.items():
+                    # blank and non-numeric values are left out (the latter noted in stats)
+                    value = stats.parse_value(reader.line_num, header, row[header])
+                    if value is not None:
+                        columns[mid].append(county.id, value)
+            elif error is not None:
+                stats.unmatched.update(error)
+
+        if stats.rows % PROGRESS_INTERVAL == 0:
+            report_progress(progress, Upload_Job.READING, stats)
+
+    return columns
+
+
+def ingest_chr_file(file, measures, year, document=None, batch_size=None, progress=None):
+    """
+    Reads a CHR file once, and creates a data set (with data points and percentiles) for
+    each of the given measures. A health indicator is created for any measure name that does
+    not already have one. Either every data set is created, or none of them are.
+
+    :param file: open CHR CSV file (text mode)
+    :param measures: list of (CHR measure ID, health indicator name)
+    :param year: year the new data sets cover
+    :param document: Document the file was uploaded as  (Default value = None)
+    :param batch_size: number of points to insert per query  (Default value = None)
+    :param progress: function (phase, IngestStats) -> None, called as the file is read and as
+        data sets are saved; raising from it rolls back every data set  (Default value = None)
+    :returns: (IngestStats, list of new Data_Set)
+    :raises ValueError: if an indicator already has a data set for the year
+
+    """
+    stats = IngestStats()
+    start = time.perf_counter()
+
+    columns = read_chr_columns(file, [mid for (mid, _) in measures], stats, progress=progress)
+    report_progress(progress, Upload_Job.SAVING, stats)
+
+    def heartbeat():
+        report_progress(progress, Upload_Job.SAVING, stats)
+
+    data_sets = []
+    # every measure's columns need the FIPS codes of the same counties, so only look them up once
+    fips_by_id = county_fips_by_id()
+    with transaction.atomic():
+        for (mid, name) in measures:
+            indicator, _ = Health_Indicator.objects.get_or_create(name=name)
+            # don't overwrite an existing data set!
+            if indicator.data_sets.filter(year=year).exists():
+                raise ValueError(
+                    f"Indicator {indicator.name} already has a data set for year {year}")
+
+            data_set = indicator.data_sets.create(year=year, source_document=document)
+            if len(columns[mid]) > 0:
+                save_value_column(data_set, columns[mid], batch_size, fips_by_id, heartbeat)
+            data_sets.append(data_set)
+
+        heartbeat()
+
+    stats.seconds = time.perf_counter() - start
+    return (stats, data_sets)
@@ -5,6 +5,7 @@ from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
 
 from .models import Health_Indicator, Profile
+from .chr_reading import CHOICE_CHR, CHR_FORMAT_CHOICE, parse_measure_list
 from .upload_reading import UPLOAD_FORMAT_CHOICES, CHOICE_NAME
 
 
@@ -91,11 +92,20 @@ class UploadNewDataForm(forms.Form):
         label='CSV file format',
         help_text='What columns to use to identify counties in the uploaded CSV file',
         widget=forms.RadioSelect,
-        choices=UPLOAD_FORMAT_CHOICES,
+        choices=UPLOAD_FORMAT_CHOICES + [CHR_FORMAT_CHOICE],
         required=True,
         initial=CHOICE_NAME
     )
 
+    # only used for County Health Rankings files, which contain many measures
+    measures = forms.CharField(
+        label='CHR measures',
+        help_text='For County Health Rankings files only: one <code>ID:Indicator name</code> '
+                  'per line, e.g. <code>11:Adult Obesity</code>. A data set is created for each.',
+        required=False,
+        widget=forms.Textarea(attrs={'rows': 3})
+    )
+
     # This needs to be required once we have a way to create new ones #
     indicator = forms.ModelChoiceField(
         queryset=Health_Indicator.objects.all(),
@@ -120,3 +130,25 @@ class UploadNewDataForm(forms.Form):
         max_value=9999
     )
 
+    # check the file for problems, without saving anything
+    validate_only = forms.BooleanField(
+        label='Only check the file',
+        help_text='Report unmatched counties, duplicate counties and values that are not numbers, '
+                  'without uploading anything',
+        required=False
+    )
+
+    def clean(self):
+        """
+        Checks the measures list when a County Health Rankings file is uploaded
+        """
+        cleaned_data = super().clean()
+        if cleaned_data.get('column_format') == CHOICE_CHR:
+            try:
+                measures = parse_measure_list(cleaned_data.get('measures', ''))
+            except ValueError as exc:
+                self.add_error('measures', str(exc))
+            else:
+                if not measures:
+                    self.add_error('measures', 'List at least one measure to load from the file')
+        return cleaned_data
@@ -0,0 +1,173 @@
+# An in-memory index of every state and county.
+#
+# States and counties are reference data: migration 0003 loads them, and nothing changes them
+# while the site is running. Yet nearly every page and API request looks one of them up by USPS
+# code or FIPS code. This keeps one snapshot of both tables per process, indexed every way they
+# are looked up, so those lookups don't touch the database.
+#
+# The snapshot is loaded the first time it is needed, or when the app starts if the
+# GEOGRAPHY_PRELOAD setting is on. Every process (each mod_wsgi daemon process, the upload
+# worker, management commands) has its own.
+#
+# The snapshot is dropped (and loaded again when next needed) whenever migrations run, and when
+# a state or county is saved or deleted in this process; call reload() after changing them in
+# any other way. Other processes keep their snapshots until they restart, so states and counties
+# are read-only in the admin site, and changing them any other way needs the site restarted. The
+# model instances in the snapshot are shared by every request: don't modify them.
+
+from types import MappingProxyType
+
+from django.db import DatabaseError
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from hda_privileged.models import US_County, US_State
+
+
+class Geography():
+    """
+    An immutable snapshot of every US_State and US_County. Each county's state is attached,
+    so reading county.state doesn't need a query.
+    """
+
+    def __init__(self, states, counties):
+        """
+        :param states: every US_State
+        :param counties: every US_County
+
+        """
+        states = tuple(states)
+        by_short = {state.short: state for state in states}
+        in_state = {state.short: [] for state in states}
+        for county in counties:
+            county.state = by_short[county.state_id]
+            in_state[county.state_id].append(county)
+
+        self.states = states
+        self.counties = tuple(county for state in states for county in in_state[state.short])
+        self.states_by_short = MappingProxyType(by_short)
+        self.states_by_fips = MappingProxyType({state.fips: state for state in states})
+        self.states_by_name = MappingProxyType({state.full: state for state in states})
+        self.counties_by_id = MappingProxyType({county.id: county for county in self.counties})
+        self.counties_by_fips5 = MappingProxyType({county.fips5: county for county in self.counties})
+        self.counties_by_name = MappingProxyType(
+            {(county.state_id, county.name): county for county in self.counties})
+        self.counties_in_state = MappingProxyType(
+            {short: tuple(counties) for (short, counties) in in_state.items()})
+
+    @classmethod
+    def load(cls):
+        """
+        Reads every state and county from the database (two queries)
+        """
+        return cls(US_State.objects.order_by('short'), US_County.objects.order_by('state', 'fips'))
+
+    def get_state(self, short):
+        """
+        Finds a state by its USPS code, e.g. 'VA' (in any case), returning None if there isn't one
+
+        :param short: USPS code
+
+        """
+        return self.states_by_short.get(short.upper(), None)
+
+    def get_state_for_fips(self, fips):
+        """
+        Finds a state by its 2-digit FIPS code, e.g. '51', returning None if there isn't one
+
+        :param fips: 2-digit state FIPS code
+
+        """
+        return self.states_by_fips.get(fips, None)
+
+    def get_county(self, fips5):
+        """
+        Finds a county by its 5-digit FIPS code, e.g. '51059', returning None if there isn't one
+
+        :param fips5: 5-digit county FIPS code
+
+        """
+        return self.counties_by_fips5.get(fips5, None)
+
+    def get_counties_for_fips(self, fips_codes):
+        """
+        Finds the counties for a list of 5-digit FIPS codes, all at once
+
+        :param fips_codes: 5-digit county FIPS codes, e.g. from a comma-separated query string
+        :returns: (counties matching a code, codes that don't match a county), both in the
+            order the codes were given
+
+        """
+        counties = []
+        missing = []
+        for fips5 in fips_codes:
+            county = self.counties_by_fips5.get(fips5, None)
+            if county is None:
+                missing.append(fips5)
+            else:
+                counties.append(county)
+        return (counties, missing)
+
+    def get_county_by_name(self, short, name):
+        """
+        Finds a county by its state and exact name, returning None if there isn't one
+
+        :param short: USPS code of the state, e.g. 'VA'
+        :param name: e.g. 'Fairfax County'
+
+        """
+        return self.counties_by_name.get((short.upper(), name), None)
+
+    def get_counties(self, short):
+        """
+        Returns every county in a state, in order of FIPS code (empty if there is no such state)
+
+        :param short: USPS code of the state
+
+        """
+        return self.counties_in_state.get(short.upper(), ())
+
+
+_geography = None
+
+
+def get_geography():
+    """
+    Returns the process's Geography, loading it if it isn't loaded yet
+    """
+    global _geography
+    if _geography is None:
+        _geography = Geography.load()
+    return _geography
+
+
+def reload():
+    """
+    Drops the process's Geography, so that it is loaded from the database when next needed
+    """
+    global _geography
+    _geography = None
+
+
+def preload():
+    """
+    Loads the process's Geography now, if the database has the tables for it (it may not yet,
+    e.g. when running migrate on a new database)
+    """
+    try:
+        get_geography()
+    except DatabaseError:
+        reload()
+
+
+@receiver(post_migrate)
+def reload_after_migrate(sender, **kwargs):
+    reload()
+
+
+@receiver(post_save, sender=US_State)
+@receiver(post_delete, sender=US_State)
+@receiver(post_save, sender=US_County)
+@receiver(post_delete, sender=US_County)
+def reload_after_change(sender, **kwargs):
+    reload()
@@ -0,0 +1,335 @@
+# Streaming ingestion of uploaded data files.
+#
+# read_data_points_from_file builds a Data_Point model instance for every row of a file before
+# anything is saved, and the upload view then sorts that list and inserts it with one big query.
+# That is fine for a county-level file, but memory grows with the file and very large files blow
+# up workers (and statement size limits). This module reads a file once, keeping only the county
+# ID and value of each row in packed arrays, computes percentiles from those arrays, and then
+# writes the data points in fixed-size batches.
+
+import csv
+import time
+import tracemalloc
+from array import array
+
+from django.conf import settings
+from django.db import transaction
+
+from hda_privileged.models import (
+    Data_Point,
+    Data_Set_Columns,
+    Data_Set_County,
+    Data_Set_State,
+    Upload_Job,
+    US_County
+)
+from hda_privileged.percentile import (
+    PERCENTILE_RANKS,
+    PERCENTILE_RANK_ARRAY,
+    pack_percentile_values,
+    percentile_grid,
+    percentile_ranks
+)
+from hda_privileged.signals import data_set_ready
+from hda_privileged.upload_reading import UPLOAD_FORMAT_FUNCTIONS, CountyResolver
+
+# how many data points to insert per query, if the settings don't say otherwise
+DEFAULT_BATCH_SIZE = 1000
+
+# how many rows to read between calls to a progress callback
+PROGRESS_INTERVAL = 500
+
+# stop listing non-numeric values after this many; a file with more is probably the wrong file
+MAX_NON_NUMERIC = 100
+
+
+def get_batch_size():
+    """
+    Returns the number of data points to write per query, from the UPLOAD_BATCH_SIZE setting
+    """
+    return getattr(settings, 'UPLOAD_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def county_fips_by_id():
+    """
+    Returns the full 5-digit FIPS code of every county, by county ID (one query)
+    """
+    return dict(US_County.objects.values_list('id', 'fips5'))
+
+
+def batched(items, size):
+    """
+    Splits an iterable into lists of (at most) the given size
+
+    :param items: iterable to split
+    :param size: largest number of items in a batch
+    :returns: generator of lists
+
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ValueColumn():
+    """
+    The values for one data set, read from a file: parallel arrays of county IDs and values.
+    Each entry costs 16 bytes, instead of a whole Data_Point model instance.
+    """
+
+    def __init__(self):
+        self.county_ids = array('q')
+        self.values = array('d')
+
+    def append(self, county_id, value):
+        """
+
+        :param county_id: primary key of a US_County
+        :param value: the measured value for that county
+
+        """
+        self.county_ids.append(county_id)
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class IngestStats():
+    """
+    What happened while reading and saving a data file: row counts,
+    counties that could not be matched, and how long / how much memory it took.
+    """
+
+    def __init__(self):
+        # rows read from the file
+        self.rows = 0
+        # rows that were matched to a county and saved as a data point
+        self.matched = 0
+        # rows that matched a county but did not have a value (or not a number)
+        self.skipped = 0
+        # (line number, column, value) for values that are not numbers (the first MAX_NON_NUMERIC)
+        self.non_numeric = []
+        # {county: state} for rows that could not be matched to a county
+        self.unmatched = dict()
+        # wall-clock time taken
+        self.seconds = 0.0
+        # largest amount of memory allocated at once, in bytes (None if not traced)
+        self.peak_memory = None
+
+    def parse_value(self, line, column, value_str):
+        """
+        Reads a value from a file, noting it if it isn't a number
+
+        :param line: line number of the row in the file
+        :param column: header of the value's column
+        :param value_str: the value, as it is in the file
+        :returns: float, or None if the value is blank or not a number
+
+        """
+        if not value_str:
+            return None
+        try:
+            return float(value_str)
+        except ValueError:
+            if len(self.non_numeric) < MAX_NON_NUMERIC:
+                self.non_numeric.append((line, column, value_str))
+            return None
+
+    @property
+    def rows_per_second(self):
+        """ """
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        summary = (f"Read {self.rows} rows ({self.matched} saved, "
+                   f"{self.skipped} without a numeric value, "
+                   f"{len(self.unmatched)} unmatched) in {self.seconds:.2f}s "
+                   f"({self.rows_per_second:.0f} rows/sec)")
+        if self.peak_memory is not None:
+            summary += f", peak memory {self.peak_memory / 1024:.0f} KiB"
+        return summary
+
+
+def report_progress(progress, phase, stats):
+    """
+    Calls a progress callback, if there is one
+
+    :param progress: function (phase, IngestStats) -> None, or None
+    :param phase: one of the Upload_Job phases
+    :param stats: IngestStats so far
+
+    """
+    if progress is not None:
+        progress(phase, stats)
+
+
+def read_value_column(file, choice, stats, resolver=None, progress=None):
+    """
+    Reads the county and value of every row in a CSV file into a ValueColumn.
+    Rows are read one at a time, so the file is never held in memory all at once.
+
+    :param file: open CSV file (text mode)
+    :param choice: one of the choice codes from UPLOAD_FORMAT_CHOICES
+    :param stats: IngestStats to count rows and unmatched counties in
+    :param resolver: CountyResolver to match counties with  (Default value = None)
+    :param progress: called every PROGRESS_INTERVAL rows  (Default value = None)
+    :returns: a ValueColumn
+
+    """
+    county_getter = UPLOAD_FORMAT_FUNCTIONS.get(choice, None)
+    if not county_getter:
+        raise TypeError(f"Choice {choice} did not match to a county parsing function")
+
+    resolver = resolver or CountyResolver()
+    column = ValueColumn()
+
+    reader = csv.DictReader(file)
+    for row in reader:
+        stats.rows += 1
+        (county, error) = county_getter(row, resolver)
+        if county is not None:
+            value = stats.parse_value(reader.line_num, 'Value', row.get('Value', None))
+            if value is not None:
+                column.append(county.id, value)
+            else:
+                stats.skipped += 1
+        elif error is not None:
+            stats.unmatched.update(error)
+
+        if stats.rows % PROGRESS_INTERVAL == 0:
+            stats.matched = len(column)
+            report_progress(progress, Upload_Job.READING, stats)
+
+    return column
+
+
+def save_availability(data_set, county_ids, batch_size=None):
+    """
+    Records which counties and states a data set has points for
+
+    :param data_set: saved Data_Set instance
+    :param county_ids: county ID of every point (duplicates are fine)
+    :param batch_size: number of rows to insert per query  (Default value = None)
+
+    """
+    for batch in batched(sorted(set(county_ids)), batch_size or get_batch_size()):
+        Data_Set_County.objects.bulk_create([
+            Data_Set_County(data_set=data_set, county_id=c) for c in batch
+        ])
+    states = (Data_Set_County.objects
+              .filter(data_set=data_set)
+              .values_list('county__state_id', flat=True)
+              .distinct()
+              .order_by())
+    Data_Set_State.objects.bulk_create([
+        Data_Set_State(data_set=data_set, state_id=s) for s in states
+    ])
+
+
+def save_value_column(data_set, column, batch_size=None, fips_by_id=None, heartbeat=None):
+    """
+    Calculates percentiles for a column of values, then saves them along with a data point for
+    every value in the column. Data points are created and inserted one batch at a time.
+    The points are also saved in columnar form, as the data set's Data_Set_Columns, the counties
+    and states they are in are recorded, and then data_set_ready is sent (see signals.py).
+
+    :param data_set: saved Data_Set instance the points belong to
+    :param column: ValueColumn of county IDs and values
+    :param batch_size: number of points to insert per query  (Default value = None)
+    :param fips_by_id: dict from county_fips_by_id, if the caller already has it
+        (Default value = None)
+    :param heartbeat: function () -> None, called after each batch of points and last thing
+        before the transaction ends; raising from it rolls everything back  (Default value = None)
+    :returns: the (rank, value) percentile list for the data set
+
+    """
+    batch_size = batch_size or get_batch_size()
+    fips_by_id = fips_by_id or county_fips_by_id()
+
+    # percentile_grid reads the packed values without copying them into Python floats
+    grid = percentile_grid(column.values)
+    # rank every value at once, rather than one data point at a time
+    ranks = percentile_ranks(column.values, PERCENTILE_RANK_ARRAY, grid)
+    percentile_values = list(zip(PERCENTILE_RANKS, grid.tolist()))
+
+    with transaction.atomic():
+        rows = zip(column.county_ids, column.values, ranks)
+        for batch in batched(rows, batch_size):
+            Data_Point.objects.bulk_create([
+                Data_Point(county_id=c, value=v, rank=float(r), data_set=data_set)
+                for (c, v, r) in batch
+            ])
+            if heartbeat is not None:
+                heartbeat()
+
+        # all 999 percentile values go in one column of the data set's own row
+        data_set.percentile_values = pack_percentile_values(grid)
+        data_set.save(update_fields=['percentile_values', 'modified_at'])
+
+        Data_Set_Columns.from_points(
+            data_set,
+            [fips_by_id[c] for c in column.county_ids],
+            column.county_ids,
+            column.values,
+            ranks,
+        ).save()
+
+        save_availability(data_set, column.county_ids, batch_size)
+
+        data_set_ready.send(sender=type(data_set), data_set=data_set)
+
+        if heartbeat is not None:
+            heartbeat()
+
+    return percentile_values
+
+
+def ingest_data_file(file, choice, data_set, batch_size=None, trace_memory=False, progress=None):
+    """
+    Reads every row of a CSV file and saves it as a data point in the given data set,
+    along with the data set's percentiles. This is the streaming equivalent of calling
+    read_data_points_from_file and saving the results.
+
+    :param file: open CSV file (text mode)
+    :param choice: one of the choice codes from UPLOAD_FORMAT_CHOICES
+    :param data_set: saved Data_Set instance to add points to
+    :param batch_size: number of points to insert per query  (Default value = None)
+    :param trace_memory: measure peak memory use with tracemalloc, which slows reading down and
+        uses a lot more memory, so only for measuring (e.g. load_data_file)
+        (Default value = False)
+    :param progress: function (phase, IngestStats) -> None, called as the file is read, before
+        points are saved, and as they are saved; raising from it stops the ingest, and rolls
+        back any points saved  (Default value = None)
+    :returns: IngestStats
+
+    """
+    stats = IngestStats()
+
+    def heartbeat():
+        report_progress(progress, Upload_Job.SAVING, stats)
+
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+
+    try:
+        column = read_value_column(file, choice, stats, progress=progress)
+        stats.matched = len(column)
+        report_progress(progress, Upload_Job.SAVING, stats)
+        if stats.matched > 0:
+            save_value_column(data_set, column, batch_size, heartbeat=heartbeat)
+    finally:
+        stats.seconds = time.perf_counter() - start
+        if trace_memory:
+            (_, stats.peak_memory) = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+    return stats
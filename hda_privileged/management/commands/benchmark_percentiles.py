@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand
+from hda_privileged.percentile import PERCENTILE_RANKS, percentile, percentile_grid
+
+import random
+import timeit
+
+
+def scalar_grid(values):
+    # how percentiles were calculated before the vectorized engine: one call per percentile
+    sorted_values = sorted(values)
+    return [percentile(p, sorted_values) for p in PERCENTILE_RANKS]
+
+
+class Command(BaseCommand):
+    help = 'Compares the speed of the scalar and vectorized percentile calculations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=[3000, 70000, 1000000],
+                            help='Sample sizes to time (default: 3000 70000 1000000)')
+        parser.add_argument('-r', '--repeat', type=int, default=5,
+                            help='Take the best of this many runs')
+
+    def best_time(self, func, values, repeat):
+        timer = timeit.Timer(lambda: func(values))
+        return min(timer.repeat(repeat=repeat, number=1))
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        rng = random.Random(0)
+
+        self.stdout.write(f"{'size':>10} {'scalar (ms)':>12} {'vector (ms)':>12} {'speedup':>8}")
+        for size in options['sizes']:
+            values = [rng.gauss(0.5, 0.1) for _ in range(size)]
+
+            scalar = self.best_time(scalar_grid, values, repeat)
+            vector = self.best_time(percentile_grid, values, repeat)
+
+            self.stdout.write(
+                f"{size:>10} {scalar * 1000:>12.2f} {vector * 1000:>12.2f} {scalar / vector:>7.1f}x"
+            )
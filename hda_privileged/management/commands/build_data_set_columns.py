@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+from hda_privileged.models import Data_Set, Data_Set_Columns
+
+
+def _build_columns(data_set):
+    # in the order they were saved, so a county's first point is the one kept
+    points = (data_set.data_points
+              .order_by('pk')
+              .values_list('county__fips5', 'county_id', 'value', 'rank'))
+    (fips, county_ids, values, ranks) = zip(*points)
+    return Data_Set_Columns.from_points(data_set, fips, county_ids, values, ranks)
+
+
+class Command(BaseCommand):
+    help = '''Saves the columnar form of data sets that were uploaded before it existed
+    (or that have had their points edited). Data sets uploaded since are stored in both forms.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild the columns of every data set, not just missing ones')
+
+    def handle(self, *args, **options):
+        data_sets = Data_Set.objects.filter(data_points__isnull=False).distinct()
+        if not options['rebuild']:
+            data_sets = data_sets.filter(columns__isnull=True)
+
+        built = 0
+        for data_set in data_sets.iterator():
+            # saving with an existing primary key replaces the old columns
+            _build_columns(data_set).save()
+            built += 1
+
+        self.stdout.write(f"Built columns for {built} data sets")
@@ -0,0 +1,44 @@
+from django.core.management import BaseCommand, CommandError
+from hda_privileged.chr_reading import ingest_chr_file, parse_measure_spec
+
+import argparse
+
+
+def measure_spec(value):
+    try:
+        return parse_measure_spec(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+
+class Command(BaseCommand):
+    help = '''Reads a County Health Rankings CSV file once, creating a data set for each
+    listed measure. Each measure is given as ID:NAME, where ID is a CHR measure ID (the file
+    column 'measure_ID_value' is read) and NAME is the health indicator to create it for.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=argparse.FileType('r', encoding='utf-8'))
+        parser.add_argument('measures', nargs='+', type=measure_spec, metavar='ID:NAME')
+        parser.add_argument('-y', '--year', type=int, required=True)
+        parser.add_argument('-b', '--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        measures = options['measures']
+        year = options['year']
+
+        self.stdout.write(f"Loading {len(measures)} measures for {year}")
+
+        with options['file'] as fp:
+            try:
+                (stats, data_sets) = ingest_chr_file(fp, measures, year,
+                                                     batch_size=options['batch_size'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        self.stdout.write(str(stats))
+        for data_set in data_sets:
+            self.stdout.write(f"Created {data_set!s} with {data_set.data_points.count()} points")
+        for (county, state) in stats.unmatched.items():
+            self.stdout.write(f"Unmatched: {county}, {state}")
+        for (line, column, value) in stats.non_numeric:
+            self.stdout.write(f"Not a number: line {line}, {column}: {value!r}")
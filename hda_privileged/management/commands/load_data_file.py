@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand, CommandError
+from hda_privileged.models import Health_Indicator
+from hda_privileged.ingest import ingest_data_file, get_batch_size
+from hda_privileged.upload_reading import UPLOAD_FORMAT_CHOICES, CHOICE_NAME
+
+import argparse
+
+
+class Command(BaseCommand):
+    help = 'Loads a CSV data file as a new data set, streaming it in batches instead of uploading it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=argparse.FileType('r', encoding='utf-8'))
+        parser.add_argument('-i', '--indicator', required=True)
+        parser.add_argument('-y', '--year', type=int, required=True)
+        parser.add_argument('-f', '--format',
+                            choices=[code for (code, _) in UPLOAD_FORMAT_CHOICES],
+                            default=CHOICE_NAME)
+        parser.add_argument('-b', '--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        indicator_name = options['indicator']
+        year = options['year']
+        batch_size = options['batch_size'] or get_batch_size()
+
+        indicator, _ = Health_Indicator.objects.get_or_create(name=indicator_name)
+        # don't overwrite an existing data set!
+        if indicator.data_sets.filter(year=year).exists():
+            raise CommandError(f'Indicator {indicator.name} already has a data set for year {year}, aborting')
+        data_set = indicator.data_sets.create(year=year)
+
+        self.stdout.write(f"Loading data set {data_set.id} in batches of {batch_size}")
+
+        with options['file'] as fp:
+            stats = ingest_data_file(fp, options['format'], data_set, batch_size, trace_memory=True)
+
+        self.stdout.write(str(stats))
+        for (county, state) in stats.unmatched.items():
+            self.stdout.write(f"Unmatched: {county}, {state}")
+        for (line, column, value) in stats.non_numeric:
+            self.stdout.write(f"Not a number: line {line}, {column}: {value!r}")
@@ -1,13 +1,11 @@
 from django.core.management import BaseCommand, CommandError
 from hda_privileged.models import *
-from hda_privileged.percentile import get_percentiles_for_points, assign_percentiles_to_points
+from hda_privileged.ingest import ValueColumn, save_value_column
 
 import argparse
 import random
 import math
 
-from itertools import dropwhile
-
 def _create_data_set(indicator, year):
     # don't overwrite an existing data set!
     if indicator.data_sets.filter(year=year).exists():
@@ -16,10 +14,12 @@ def _create_data_set(indicator, year):
         # https://docs.djangoproject.com/en/2.1/topics/db/queries/#additional-methods-to-handle-related-objects
         return indicator.data_sets.create(year=year)
 
-def _create_data_points(data_set, max_points, mean, stddev):
-    make_point = lambda c: Data_Point(value=random.gauss(mean, stddev), county=c, data_set=data_set)
-    counties = US_County.objects.all()[:max_points]
-    return [make_point(c) for c in counties.iterator()]
+def _create_values(max_points, mean, stddev):
+    column = ValueColumn()
+    county_ids = US_County.objects.values_list('id', flat=True)[:max_points]
+    for county_id in county_ids.iterator():
+        column.append(county_id, random.gauss(mean, stddev))
+    return column
 
 class Command(BaseCommand):
 
@@ -47,18 +47,9 @@ class Command(BaseCommand):
 
         random.seed()
 
-        points = _create_data_points(data_set, max_points, mean, stddev)
-        self.stdout.write(f"Created {len(points)} new data points")
-
-        self.stdout.write("Adding percentiles...")
-        percentile_values = get_percentiles_for_points(points)
-        assign_percentiles_to_points(points, percentile_values)
-
-        pv_models = [Percentile(rank=p, value=pv, data_set=data_set) for (p, pv) in percentile_values]
-
-        # https://docs.djangoproject.com/en/2.1/ref/models/querysets/#bulk-create
-        # it mentions several caveats, but it seems sufficient for this use case
-        self.stdout.write("Saving data points")
-        Data_Point.objects.bulk_create(points)
-        Percentile.objects.bulk_create(pv_models)
+        values = _create_values(max_points, mean, stddev)
+        self.stdout.write(f"Created {len(values)} new values")
 
+        # calculates percentiles, then saves the data points and percentiles in batches
+        self.stdout.write("Saving data points and percentiles")
+        save_value_column(data_set, values)
@@ -0,0 +1,40 @@
+from django.core.management import BaseCommand
+from hda_privileged.upload_jobs import claim_next_job, requeue_stale_jobs, run_job
+
+import time
+
+
+class Command(BaseCommand):
+    help = 'Runs queued upload jobs, reading each uploaded file into a new data set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty, instead of waiting for more jobs')
+        parser.add_argument('-s', '--sleep', type=float, default=5.0,
+                            help='Seconds to wait between checks of an empty queue')
+        parser.add_argument('--stale-after', type=float, default=None,
+                            help='Seconds a running job can go without progress before it is '
+                                 'queued again (default: the UPLOAD_JOB_STALE_AFTER setting)')
+
+    def handle(self, *args, **options):
+        while True:
+            # jobs left running by a worker that died
+            for stale in requeue_stale_jobs(options['stale_after']):
+                self.stderr.write(f"Took back upload job {stale.id} ({stale.phase}) from a stopped worker")
+
+            job = claim_next_job()
+
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            self.stdout.write(f"Running upload job {job.id}")
+            job = run_job(job)
+            if job.phase == job.FAILED:
+                self.stderr.write(f"Upload job {job.id} failed: {job.error}")
+            elif job.phase != job.DONE:
+                self.stderr.write(f"Upload job {job.id} was taken back from this worker")
+            else:
+                self.stdout.write(f"Upload job {job.id} created data set {job.data_set_id}")
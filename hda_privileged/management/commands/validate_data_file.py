@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand, CommandError
+from hda_privileged.chr_reading import CHOICE_CHR
+from hda_privileged.upload_reading import UPLOAD_FORMAT_CHOICES, CHOICE_NAME
+from hda_privileged.upload_validation import validate_data_file
+
+import argparse
+
+
+class Command(BaseCommand):
+    help = '''Checks a CSV data file for unmatched counties, duplicate counties and values that
+    are not numbers, without saving anything. Exits with an error if any problems are found.'''
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', type=argparse.FileType('r', encoding='utf-8'))
+        parser.add_argument('-f', '--format',
+                            choices=[code for (code, _) in UPLOAD_FORMAT_CHOICES] + [CHOICE_CHR],
+                            default=CHOICE_NAME)
+        parser.add_argument('-m', '--measure', type=int, action='append', dest='measures', default=[],
+                            help='CHR measure ID to check (CHR format only); may be repeated')
+
+    def handle(self, *args, **options):
+        with options['file'] as fp:
+            try:
+                report = validate_data_file(fp, options['format'], options['measures'])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+
+        self.stdout.write(str(report))
+        for (column, summary) in report.summaries.items():
+            if summary:
+                stats = ', '.join(f"{name} {value:.4g}" for (name, value) in summary.items())
+                self.stdout.write(f"{column}: {stats}")
+        for (county, state) in report.unmatched.items():
+            self.stdout.write(f"Unmatched: {county}, {state}")
+        for (county, count) in report.duplicates.items():
+            self.stdout.write(f"Duplicate: {county} ({count} rows)")
+        for (line, column, value) in report.non_numeric:
+            self.stdout.write(f"Not a number: line {line}, {column}: '{value}'")
+
+        if not report.is_valid:
+            raise CommandError('File has problems; nothing was saved')
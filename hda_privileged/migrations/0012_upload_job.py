@@ -0,0 +1,37 @@
+# Generated by Django 2.1.5 on 2019-04-02 14:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0011_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload_Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('column_format', models.CharField(max_length=10)),
+                ('phase', models.CharField(choices=[('queued', 'Waiting to be processed'), ('reading', 'Reading file'), ('saving', 'Saving data points'), ('done', 'Finished'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('rows_read', models.PositiveIntegerField(default=0)),
+                ('rows_matched', models.PositiveIntegerField(default=0)),
+                ('rows_skipped', models.PositiveIntegerField(default=0)),
+                ('unmatched', models.TextField(default='{}')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('data_set', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='hda_privileged.Data_Set')),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to='hda_privileged.Document')),
+                ('indicator', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='hda_privileged.Health_Indicator')),
+            ],
+            options={
+                'verbose_name': 'Upload job',
+            },
+        ),
+    ]
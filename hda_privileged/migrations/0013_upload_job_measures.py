@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2019-04-05 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0012_upload_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload_job',
+            name='measures',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 2.1.5 on 2019-04-09 16:05
+#
+# Replaces the 999 Percentile rows of every data set with a single packed binary column on
+# Data_Set. Existing percentile rows are packed into the new column before the table is dropped
+# (and unpacked back into rows if this migration is reversed). If any data set has percentile
+# rows that can't be packed, the migration fails, rather than dropping them with the table.
+#
+# The packed format is the one hda_privileged/percentile.py reads (999 little-endian float64s,
+# in order of rank), but it is written out here, so that later changes to that module can't
+# change what this migration does.
+
+import struct
+
+from django.db import migrations, models
+
+# the 999 percentiles, 0.001 to 0.999
+PERCENTILE_RANKS = [p / 1000 for p in range(1, 1000)]
+
+PACKED_FORMAT = f'<{len(PERCENTILE_RANKS)}d'
+
+
+def pack_percentiles(apps, schema_editor):
+    Data_Set = apps.get_model('hda_privileged', 'Data_Set')
+    unpackable = []
+    for data_set in Data_Set.objects.all().iterator():
+        rows = list(data_set.percentiles.order_by('rank').values_list('rank', 'value'))
+        if not rows:
+            # nothing to keep (e.g. an upload that matched no counties)
+            continue
+        ranks = [round(rank, 3) for (rank, _) in rows]
+        if ranks != PERCENTILE_RANKS:
+            unpackable.append(f"{data_set.id} ({len(rows)} percentiles)")
+            continue
+        data_set.percentile_values = struct.pack(PACKED_FORMAT, *(value for (_, value) in rows))
+        data_set.save(update_fields=['percentile_values'])
+
+    if unpackable:
+        # (the migration runs in a transaction, so nothing has been packed or dropped)
+        raise RuntimeError(
+            "These data sets don't have one percentile for each of the 999 ranks, so they can't "
+            f"be packed: {', '.join(unpackable)}. Delete them (or fix their percentiles) and run "
+            "the migration again, then upload them again."
+        )
+
+
+def unpack_percentiles(apps, schema_editor):
+    Data_Set = apps.get_model('hda_privileged', 'Data_Set')
+    Percentile = apps.get_model('hda_privileged', 'Percentile')
+    for data_set in Data_Set.objects.exclude(percentile_values=None).iterator():
+        values = struct.unpack(PACKED_FORMAT, bytes(data_set.percentile_values))
+        Percentile.objects.bulk_create([
+            Percentile(rank=p, value=v, data_set=data_set) for (p, v) in zip(PERCENTILE_RANKS, values)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0013_upload_job_measures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='data_set',
+            name='percentile_values',
+            field=models.BinaryField(editable=False, null=True),
+        ),
+        migrations.RunPython(pack_percentiles, unpack_percentiles),
+        migrations.DeleteModel(
+            name='Percentile',
+        ),
+    ]
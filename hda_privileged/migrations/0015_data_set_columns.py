@@ -0,0 +1,28 @@
+# Generated by Django 2.1.5 on 2019-04-10 11:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0014_pack_percentile_values'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Data_Set_Columns',
+            fields=[
+                ('data_set', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='columns', serialize=False, to='hda_privileged.Data_Set')),
+                ('county_fips', models.BinaryField()),
+                ('county_ids', models.BinaryField()),
+                ('point_values', models.BinaryField()),
+                ('point_ranks', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Data set columns',
+                'verbose_name_plural': 'Data set columns',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.5 on 2019-04-11 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0015_data_set_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='data_set',
+            name='modified_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
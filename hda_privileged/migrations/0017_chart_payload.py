@@ -0,0 +1,31 @@
+# Generated by Django 2.1.5 on 2019-04-15 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0016_data_set_modified_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Chart_Payload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('percentiles', 'Percentiles'), ('points', 'Points in a state')], max_length=12)),
+                ('state', models.CharField(blank=True, max_length=2)),
+                ('body', models.BinaryField(editable=False)),
+                ('data_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chart_payloads', to='hda_privileged.Data_Set')),
+            ],
+            options={
+                'verbose_name': 'Chart payload',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='chart_payload',
+            unique_together={('data_set', 'kind', 'state')},
+        ),
+    ]
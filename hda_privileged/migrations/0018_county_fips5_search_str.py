@@ -0,0 +1,53 @@
+# Generated by Django 2.1.5 on 2019-04-16 14:31
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Concat
+
+
+def fill_derived_fields(apps, schema_editor):
+    """
+    Stores the fips5 and search_str of every county, which used to be computed when they were
+    read (one update per state, rather than one per county)
+    """
+    US_State = apps.get_model('hda_privileged', 'US_State')
+    US_County = apps.get_model('hda_privileged', 'US_County')
+    for state in US_State.objects.all():
+        US_County.objects.filter(state=state).update(
+            fips5=Concat(Value(state.fips), 'fips'),
+            search_str=Concat('name', Value(' ' + state.short)),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0017_chart_payload'),
+    ]
+
+    operations = [
+        # added without indexes, which are only created once every county has its own values
+        migrations.AddField(
+            model_name='us_county',
+            name='fips5',
+            field=models.CharField(default='', editable=False, max_length=5),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='us_county',
+            name='search_str',
+            field=models.CharField(default='', editable=False, max_length=203),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_derived_fields, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='us_county',
+            name='fips5',
+            field=models.CharField(editable=False, max_length=5, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='us_county',
+            name='search_str',
+            field=models.CharField(db_index=True, editable=False, max_length=203),
+        ),
+    ]
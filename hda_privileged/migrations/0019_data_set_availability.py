@@ -0,0 +1,64 @@
+# Generated by Django 2.1.5 on 2019-04-17 11:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_availability(apps, schema_editor):
+    """
+    Records the states and counties of every data set that already exists, from its data points
+    """
+    Data_Point = apps.get_model('hda_privileged', 'Data_Point')
+    Data_Set_State = apps.get_model('hda_privileged', 'Data_Set_State')
+    Data_Set_County = apps.get_model('hda_privileged', 'Data_Set_County')
+
+    pairs = Data_Point.objects.values_list('data_set_id', 'county_id').distinct().order_by()
+    Data_Set_County.objects.bulk_create(
+        [Data_Set_County(data_set_id=ds, county_id=c) for (ds, c) in pairs.iterator()]
+    )
+    pairs = Data_Set_County.objects.values_list('data_set_id', 'county__state_id').distinct().order_by()
+    Data_Set_State.objects.bulk_create(
+        [Data_Set_State(data_set_id=ds, state_id=s) for (ds, s) in pairs.iterator()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0018_county_fips5_search_str'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Data_Set_County',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('county', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_sets', to='hda_privileged.US_County')),
+                ('data_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='counties', to='hda_privileged.Data_Set')),
+            ],
+            options={
+                'verbose_name': 'Data set county',
+                'verbose_name_plural': 'Data set counties',
+            },
+        ),
+        migrations.CreateModel(
+            name='Data_Set_State',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_set', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='hda_privileged.Data_Set')),
+                ('state', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='data_sets', to='hda_privileged.US_State')),
+            ],
+            options={
+                'verbose_name': 'Data set state',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='data_set_state',
+            unique_together={('state', 'data_set')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='data_set_county',
+            unique_together={('county', 'data_set')},
+        ),
+        migrations.RunPython(fill_availability, migrations.RunPython.noop),
+    ]
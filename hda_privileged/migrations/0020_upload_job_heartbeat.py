@@ -0,0 +1,23 @@
+# Generated by Django 2.1.5 on 2019-04-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hda_privileged', '0019_data_set_availability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='upload_job',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='upload_job',
+            name='heartbeat_at',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -14,6 +14,20 @@ from django.dispatch import receiver
 
 from django.utils.text import slugify
 
+from hda_privileged.percentile import percentile_index, unpack_percentile_values
+from hda_privileged.value_columns import (
+    FIPS5_WIDTH,
+    ColumnRow,
+    fips_order,
+    pack_fips,
+    pack_floats,
+    pack_ints,
+    prefix_slice,
+    unpack_fips,
+    unpack_floats,
+    unpack_ints
+)
+
 
 # helper functions
 def get_sentinel_user():
@@ -154,6 +168,39 @@ class Data_Set(models.Model):
         related_name='data_sets'
     )
 
+    # The values for the 0.1% through 99.9% percentiles of this data set, packed into a single
+    # column with percentile.pack_percentile_values (999 float64s, in PERCENTILE_RANKS order).
+    # What I'm calling a "percentile value" is the value such that some percent of
+    # the other values in the data set are <= that value, e.g.
+    # p = 0.86, v = 490 -> 86% of the values in the data set are <= 490
+    # Use get_percentile_values / get_percentile_value rather than reading this directly.
+    percentile_values = models.BinaryField(null=True, editable=False)
+
+    # when this data set (or its points) last changed; used as the version of the data set
+    # in HTTP caching headers for the chart API, so it must be updated by anything that
+    # changes the data set's points or percentiles
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def get_percentile_values(self):
+        """
+        Returns the values for every percentile in PERCENTILE_RANKS, or None if the data set
+        has no percentiles yet
+        """
+        if self.percentile_values is None:
+            return None
+        return unpack_percentile_values(self.percentile_values)
+
+    def get_percentile_value(self, rank):
+        """
+        Returns the value for one percentile, e.g. 0.86 -> the value such that 86% of the values
+        in the data set are <= it
+
+        :param rank: one of the percentiles in PERCENTILE_RANKS
+
+        """
+        values = self.get_percentile_values()
+        return None if values is None else values[percentile_index(rank)]
+
     def __str__(self):
         return f"Dataset {self.id} for indicator {self.indicator!s} and year {self.year:d}"
 
@@ -184,34 +231,15 @@ class US_State(models.Model):
         verbose_name = 'US state'
 
 
-# This overrides the default manager to add a new computed field to counties when
-# they are read from the database. We could make this more efficient by actually
-# storing the full 5-digit fips code for every county, rather than the partial code.
-# Solution from here: https://stackoverflow.com/a/42491803/5111071
-# We could add an @property to the model class, but this way we can use the property
-# to filter a queryset!
-class US_County_Manager(models.Manager):
+@receiver(post_save, sender=US_State)
+def update_county_fips(sender, instance, **kwargs):
     """
-    QuerySet manager for US_County class to add *non-database* fields.
-    
-    A @property in the model cannot be used because QuerySets (eg. return
-    value from .all()) are directly tied to the database Fields -
-    this does not include @property attributes.
-
+    Keeps the stored fips5 (and search_str) of a state's counties in step with the state
     """
-
-    def get_queryset(self):
-        """
-        Overrides the models.Manager method
-        """
-        qs = super(US_County_Manager, self).get_queryset()
-        # add the "fips5" property - full 5-digit FIPs code
-        qs = qs.annotate(fips5=Concat('state__fips', 'fips'))
-        # add the "search_str" property - a human readable string including the state USPS code,
-        # that uniquely identifies this county (or very nearly so)
-        # used for creating search tokens and autocomplete values
-        qs = qs.annotate(search_str=Concat('name', Value(' '), 'state__short'))
-        return qs
+    instance.counties.update(
+        fips5=Concat(Value(instance.fips), 'fips'),
+        search_str=Concat('name', Value(' ' + instance.short)),
+    )
 
 
 class US_County(models.Model):
@@ -220,14 +248,38 @@ class US_County(models.Model):
     We populate the DB with a known-good set of these; they should not be user-generated
 
     """
-    # overriden model manager
-    objects = US_County_Manager()
-
     # database fields
     fips = models.CharField(max_length=3)
     name = models.CharField(max_length=200)
     state = models.ForeignKey(US_State, related_name='counties', on_delete=models.CASCADE)
 
+    # These are derived from the fields above, but stored (and indexed) so that counties can be
+    # looked up by them without joining every county to its state. save() keeps them up to date,
+    # as does saving the county's state; anything that bypasses save() (bulk_create, update)
+    # must call set_derived_fields or set them itself.
+    # the full 5-digit FIPS code: the state's code followed by the county's
+    fips5 = models.CharField(max_length=5, unique=True, editable=False)
+    # a human readable string including the state USPS code, that uniquely identifies this county
+    # (or very nearly so); used for creating search tokens and autocomplete values
+    search_str = models.CharField(max_length=203, db_index=True, editable=False)
+
+    def set_derived_fields(self):
+        """
+        Sets fips5 and search_str from the county's FIPS code, name and state
+        """
+        if self.state.pk != self.state_id:
+            # state_id was changed after the old state was loaded
+            self.state = US_State.objects.get(pk=self.state_id)
+        self.fips5 = self.state.fips + self.fips
+        self.search_str = f'{self.name} {self.state_id}'
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields', None)
+        if update_fields is not None and {'fips', 'name', 'state', 'state_id'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'fips5', 'search_str'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.fips} - {self.name} - {self.state_id}'
 
@@ -268,30 +320,230 @@ class Data_Point(models.Model):
         verbose_name = 'Data point'
 
 
-# As an alternative to this, if we need more efficiency we can pack arrays of percentile values
-# into a bytearray (using the struct module) and save that in a model.ByteField.
-class Percentile(models.Model):
+class Data_Set_Columns(models.Model):
+    """
+    The points of a data set, packed into parallel arrays of FIPS codes, county IDs, values and
+    ranks, in order of county FIPS code (see value_columns.py). These are written alongside the
+    data set's Data_Points when it is uploaded, so that all the points in a state can be read
+    with one query and without building a Data_Point for each of them.
+
     """
-    Stores *one* of the percentile values associated with a particular data set.
-    What I'm calling a "percentile value" is the value such that some percent of
-    the other values in the data set are <= that value, e.g.
-    p = 0.86, v = 490 -> 86% of the values in the data set are <= 490
+    data_set = models.OneToOneField(Data_Set, models.CASCADE, primary_key=True, related_name='columns')
+
+    county_fips = models.BinaryField(editable=False)
+    county_ids = models.BinaryField(editable=False)
+    point_values = models.BinaryField(editable=False)
+    point_ranks = models.BinaryField(editable=False)
+
+    @classmethod
+    def from_points(cls, data_set, county_fips, county_ids, values, ranks):
+        """
+        Packs a data set's points, which may be in any order, into a new (unsaved) instance. If a
+        county has more than one point, only the first is kept, as charts of Data_Points do.
+
+        :param data_set: the Data_Set the points belong to
+        :param county_fips: 5-digit FIPS code of each point's county, in the order they were saved
+        :param county_ids: primary key of each point's county
+        :param values: value of each point
+        :param ranks: percentile rank of each point
+
+        """
+        # {FIPS code: position of the county's first point}
+        first = dict()
+        for (i, fips) in enumerate(county_fips):
+            first.setdefault(fips, i)
+        kept = list(first.values())
+        order = [kept[i] for i in fips_order(list(first))]
+        return cls(
+            data_set=data_set,
+            county_fips=pack_fips([county_fips[i] for i in order]),
+            county_ids=pack_ints([county_ids[i] for i in order]),
+            point_values=pack_floats([values[i] for i in order]),
+            point_ranks=pack_floats([ranks[i] for i in order]),
+        )
+
+    def get_rows(self, fips_prefix=''):
+        """
+        Returns the points whose county FIPS code starts with a prefix, in order of FIPS code
+
+        :param fips_prefix: e.g. a 2-digit state FIPS code, or a 5-digit county FIPS code;
+            every point matches ''  (Default value = '')
+        :returns: list of ColumnRow
+
+        """
+        fips = unpack_fips(self.county_fips)
+        rows = prefix_slice(fips, fips_prefix)
+        return [
+            ColumnRow(*row) for row in zip(
+                unpack_ints(self.county_ids)[rows].tolist(),
+                fips[rows],
+                unpack_floats(self.point_values)[rows].tolist(),
+                unpack_floats(self.point_ranks)[rows].tolist(),
+            )
+        ]
+
+    def get_rows_for_counties(self, fips_codes):
+        """
+        Returns the points for several counties, in the order the counties were given
+
+        :param fips_codes: 5-digit county FIPS codes
+        :returns: list of ColumnRow
+
+        """
+        fips = unpack_fips(self.county_fips)
+        rows = [i for code in fips_codes for i in range(len(fips))[prefix_slice(fips, code)]]
+        county_ids = unpack_ints(self.county_ids)
+        values = unpack_floats(self.point_values)
+        ranks = unpack_floats(self.point_ranks)
+        return [ColumnRow(int(county_ids[i]), fips[i], float(values[i]), float(ranks[i])) for i in rows]
+
+    def __len__(self):
+        return len(self.county_fips) // FIPS5_WIDTH
+
+    class Meta:
+        """
+
+        """
+        verbose_name = 'Data set columns'
+        verbose_name_plural = 'Data set columns'
+
 
+class Data_Set_State(models.Model):
     """
+    Records that a data set has a point in at least one county of a state. These (and
+    Data_Set_County) are written when a data set is uploaded, so pages can find the data sets
+    for a place without searching every data point.
 
-    # the "name" of this percentile - e.g. for instance to represent the 86th percentile,
-    # this value should be 0.86 while for the 25.1 percentile, it would be .251
-    rank = models.FloatField()
-
-    # the value in the data set that marks the boundary for the rank. For example,
-    # if our rank is 0.86 and 86% of the values in the data set are <= 456, then this
-    # value would be 456. It needs to be a float field because we are not constraining
-    # the kind of numbers in a data set - they may be integers or floats
-    value = models.FloatField()
-
-    # pointer back to the data set we belong to. This establishes a one-to-many relationship from
-    # Data_Set to Percentile, where was say "One Data_Set has many Percentiles". After calculating
-    # the percentile values using the Data_Points in a Data_Set, we can save them in the database
-    # by creating instances of this class that reference a specific Data_Set instance.
-    # To read them back, use the property 'percentiles' on a Data_Set instance.
-    data_set = models.ForeignKey(Data_Set, models.CASCADE, related_name='percentiles')
+    """
+    data_set = models.ForeignKey(Data_Set, models.CASCADE, related_name='states')
+    state = models.ForeignKey(US_State, models.CASCADE, related_name='data_sets')
+
+    class Meta:
+        """
+
+        """
+        verbose_name = 'Data set state'
+        # (state, data set) rather than the other way around, since pages look up by state
+        unique_together = (('state', 'data_set'),)
+
+
+class Data_Set_County(models.Model):
+    """
+    Records that a data set has a point for a county (see Data_Set_State)
+
+    """
+    data_set = models.ForeignKey(Data_Set, models.CASCADE, related_name='counties')
+    county = models.ForeignKey(US_County, models.CASCADE, related_name='data_sets')
+
+    class Meta:
+        """
+
+        """
+        verbose_name = 'Data set county'
+        verbose_name_plural = 'Data set counties'
+        unique_together = (('county', 'data_set'),)
+
+
+class Chart_Payload(models.Model):
+    """
+    A chart series for a data set, built when the data set is uploaded and stored gzipped, ready
+    to be sent as a response body. One is stored for the data set's percentiles, and one for the
+    points in each state (see app_api/materialize.py).
+
+    """
+    PERCENTILES = 'percentiles'
+    POINTS = 'points'
+    KINDS = (
+        (PERCENTILES, 'Percentiles'),
+        (POINTS, 'Points in a state'),
+    )
+
+    data_set = models.ForeignKey(Data_Set, models.CASCADE, related_name='chart_payloads')
+    kind = models.CharField(max_length=12, choices=KINDS)
+    # USPS code of the state the points are in; blank for percentiles
+    state = models.CharField(max_length=2, blank=True)
+
+    # the response JSON, gzipped
+    body = models.BinaryField(editable=False)
+
+    def __str__(self):
+        where = f" in {self.state}" if self.state else ''
+        return f"Chart {self.kind}{where} for data set {self.data_set_id}"
+
+    class Meta:
+        """
+
+        """
+        verbose_name = 'Chart payload'
+        unique_together = (('data_set', 'kind', 'state'),)
+
+
+class Upload_Job(models.Model):
+    """
+    An uploaded document waiting to be read into a new data set. The upload view only saves the
+    document and queues one of these; the process_upload_jobs management command does the slow
+    work of reading the file and saving the data set, updating the job's progress as it goes.
+    """
+
+    # the phases a job moves through, in order (it may also stop at 'failed')
+    QUEUED = 'queued'
+    READING = 'reading'
+    SAVING = 'saving'
+    DONE = 'done'
+    FAILED = 'failed'
+    PHASES = (
+        (QUEUED, 'Waiting to be processed'),
+        (READING, 'Reading file'),
+        (SAVING, 'Saving data points'),
+        (DONE, 'Finished'),
+        (FAILED, 'Failed'),
+    )
+
+    # the uploaded file, along with its source and the user that uploaded it
+    document = models.ForeignKey(Document, models.CASCADE, related_name='upload_jobs')
+
+    # what the data set created from the document should look like
+    indicator = models.ForeignKey(Health_Indicator, models.CASCADE, null=True)
+    year = models.PositiveSmallIntegerField()
+    # one of the choice codes from upload_reading.UPLOAD_FORMAT_CHOICES, or chr_reading.CHOICE_CHR
+    column_format = models.CharField(max_length=10)
+    # for CHR files: the measures to load, one 'ID:NAME' per line
+    measures = models.TextField(blank=True)
+
+    phase = models.CharField(max_length=10, choices=PHASES, default=QUEUED)
+
+    # the data set created from the document, once there is one
+    # (CHR files create several; find them all through document.data_sets)
+    data_set = models.ForeignKey(Data_Set, models.SET_NULL, null=True, related_name='+')
+
+    # progress counters, updated while the job runs
+    rows_read = models.PositiveIntegerField(default=0)
+    rows_matched = models.PositiveIntegerField(default=0)
+    rows_skipped = models.PositiveIntegerField(default=0)
+    # JSON object mapping unmatched county -> state, as reported by upload_reading
+    unmatched = models.TextField(default='{}')
+    # what went wrong, if the job failed
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+    # when the worker running the job last saved its progress; a job that has been running
+    # without a heartbeat for too long was left behind by a worker that died (see upload_jobs.py)
+    heartbeat_at = models.DateTimeField(null=True)
+    # how many times a worker has claimed the job
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    @property
+    def is_finished(self):
+        """ """
+        return self.phase in (self.DONE, self.FAILED)
+
+    def __str__(self):
+        return f"Upload job {self.id} ({self.phase})"
+
+    class Meta:
+        """
+
+        """
+        verbose_name = 'Upload job'
@@ -1,5 +1,16 @@
+from array import array
 from math import floor
-from itertools import dropwhile
+import sys
+
+import numpy as np
+
+# the percentiles we calculate for every data set: 0.001 to 0.999 in steps of 0.001
+PERCENTILE_RANKS = [p / 1000 for p in range(1, 1000)]
+# ...and the same thing as an array, for vectorized calculations
+PERCENTILE_RANK_ARRAY = np.array(PERCENTILE_RANKS, dtype=np.float64)
+
+# size in bytes of a packed percentile grid: one little-endian float64 per percentile
+PACKED_PERCENTILES_SIZE = len(PERCENTILE_RANKS) * 8
 
 
 class PercentileBoundsError(ArithmeticError):
@@ -96,6 +107,54 @@ def percentile(p, values):
         return lower + fraction * (upper - lower)
 
 
+def percentile_array(plist, values):
+    """Calculates the percentile values for many percentiles at once. This is a vectorized
+    version of calling `percentile` for each p in plist: it does exactly the same floating
+    point operations in the same order, so the results are identical, but it does them for
+    every percentile in a handful of NumPy operations instead of a Python loop.
+
+    :param plist: percentiles to calculate, each between 0 and 1, exclusive
+    :param values: values to draw percentiles from. *Must be pre-sorted in ascending order*
+    :returns: NumPy float64 array of percentile values, one for each percentile in plist
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ps = np.asarray(plist, dtype=np.float64)
+    sample_size = len(values)
+
+    if sample_size == 0:
+        raise PercentileBoundsError("Can't calculate percentile with no values!")
+
+    if np.any((ps == 0) | (ps == 1)):
+        raise PercentileBoundsError("Cannot calculate percentile rank for p = 0 or p = 1")
+
+    # the same three cases as `rank`, with the same precedence
+    lower_bound = 1 / (sample_size + 1)
+    upper_bound = sample_size / (sample_size + 1)
+    x = np.where(ps <= lower_bound, 1.0,
+                 np.where(ps >= upper_bound, float(sample_size), ps * (sample_size + 1)))
+
+    index = np.floor(x).astype(np.intp) - 1
+    fraction = np.mod(x, 1)
+
+    # where the rank is the last element there is nothing to interpolate towards; clamp the
+    # upper index so the lookup is safe, and use the lower value as-is for those percentiles
+    lower = values[index]
+    upper = values[np.minimum(index + 1, sample_size - 1)]
+    return np.where(x >= sample_size, lower, lower + fraction * (upper - lower))
+
+
+def percentile_grid(values):
+    """Calculates the value for every percentile in PERCENTILE_RANKS (0.1% to 99.9%)
+
+    :param values: values to draw percentiles from, in any order
+    :returns: NumPy float64 array of 999 percentile values
+
+    """
+    sorted_values = np.sort(np.asarray(values, dtype=np.float64))
+    return percentile_array(PERCENTILE_RANK_ARRAY, sorted_values)
+
+
 def get_percentile_values(plist, values):
     """Produce a list of (rank, value) given a list of percentiles to calculate
     and values to draw percentiles from.
@@ -114,7 +173,7 @@ def get_percentile_values(plist, values):
     :param values: a list of values to use when calculating the percentiles
 
     """
-    return [(p, percentile(p, values)) for p in plist]
+    return list(zip(plist, percentile_array(plist, values).tolist()))
 
 
 def get_percentiles_for_points(points):
@@ -124,43 +183,98 @@ def get_percentiles_for_points(points):
     :param points: List
 
     """
-    # generate 0.001 to 0.999 in steps of 0.001
-    percentiles = [p / 1000 for p in range(1, 1000)]
-    # take the values out of the points, and
-    # make sure they are in ascending order by value
-    values = sorted([pt.value for pt in points])
+    # take the values out of the points (percentile_grid sorts them)
+    values = np.fromiter((pt.value for pt in points), dtype=np.float64, count=len(points))
     # calculate a value for each of the percentiles
-    return get_percentile_values(percentiles, values)
+    return list(zip(PERCENTILE_RANKS, percentile_grid(values).tolist()))
 
 
-def assign_percentiles_to_points(points, percentiles):
+def percentile_ranks(values, ranks, rank_values):
+    """Finds the percentile rank of each value: the smallest percentile whose value is >= it.
+    Uses a binary search over the percentile values, so ranking n values costs O(n log 999)
+    and the values do not need to be sorted.
+
+    Values larger than the largest percentile value don't fit in any of the "buckets" we have.
+    We assign those a rank of 1, since it's technically correct - but be careful; we weren't
+    given a 100th percentile, so trying to use the rank of such a value to look up a percentile
+    value will fail! (There may be more than one value above the 99.9th percentile.)
+
+    :param values: values to rank, in any order
+    :param ranks: percentiles (between 0 and 1, exclusive), in ascending order
+    :param rank_values: the value for each percentile in ranks (so also ascending)
+    :returns: NumPy float64 array with the rank of each value, in the same order as values
+
     """
+    values = np.asarray(values, dtype=np.float64)
+    ranks = np.asarray(ranks, dtype=np.float64)
+    # index of the first percentile value >= each value; len(ranks) if there isn't one
+    index = np.searchsorted(np.asarray(rank_values, dtype=np.float64), values, side='left')
+    in_range = index < len(ranks)
+    return np.where(in_range, ranks[np.where(in_range, index, 0)], 1.0)
+
+
+def assign_percentiles_to_points(points, percentiles):
+    """Sorts points by value, and sets the rank of each one to the smallest percentile with a
+    percentile-value >= the point's value (see percentile_ranks).
 
     :param points: List
-    :param percentiles: floating point value between 0 and 1, exclusive
+    :param percentiles: list of (rank, value) tuples, as from get_percentiles_for_points
 
     """
     # ensure the point list is in ascending order
     points.sort(key=lambda pt: pt.value)
-    # now for each point, find the percentile with
-    # the closest percentile-value >= the point's value
-    for pt in points:
-        # skip percentiles until we find one with a value larger than the point's value
-        # when this stops, the first element in the percentile-value list should have a
-        # value >= the value of the point:
-        percentiles = list(dropwhile(lambda pv: pv[1] < pt.value, percentiles))
-        # it's possible that some value are larger than the largest percentile value we were asked
-        #  to calculate! in that case they don't fit in any of the "buckets" we have, so we'll run
-        # out of values here:
-        if len(percentiles) == 0:
-            # ??? we'll assign it "1" since it's technically correct - but be careful; we
-            # weren't given a 100th percentile so trying to use the rank of this point to pull
-            # a percentile value will fail; i.e. for any other county, we can ask the Percentiles
-            # model class "this county is ranked at the 45th percentile; what is the value for
-            # that percentile rank?" and get an answer, but for this county that WILL fail!
-            pt.rank = 1
-            # DO NOT BREAK THE LOOP since there may be MORE THAN ONE county above the 99.9th rank!
-        else:
-            # assign that percentile (between 0 and 1) to the point
-            (p, _) = percentiles[0]
-            pt.rank = p
+    ranks = [p for (p, _) in percentiles]
+    rank_values = [pv for (_, pv) in percentiles]
+    point_values = [pt.value for pt in points]
+    for (pt, r) in zip(points, percentile_ranks(point_values, ranks, rank_values).tolist()):
+        pt.rank = r
+
+
+def pack_percentile_values(values):
+    """Packs the values for every percentile in PERCENTILE_RANKS into bytes, for storage in
+    a single binary column (Data_Set.percentile_values). The values are stored as little-endian
+    float64s, in the same order as PERCENTILE_RANKS.
+
+    :param values: 999 percentile values, e.g. from percentile_grid
+    :returns: bytes
+
+    """
+    packed = np.asarray(values, dtype='<f8')
+    if packed.shape != (len(PERCENTILE_RANKS),):
+        raise ValueError(f"Expected {len(PERCENTILE_RANKS)} percentile values, got {packed.size}")
+    return packed.tobytes()
+
+
+def unpack_percentile_values(blob):
+    """Reads packed percentile values back out of bytes. On little-endian machines (i.e. nearly
+    all of them) this does not copy anything: the result is a view of the bytes that it was
+    given, which can be indexed like a list of floats.
+
+    :param blob: bytes (or memoryview, depending on the database driver) from
+        pack_percentile_values
+    :returns: a sequence of 999 floats, in the same order as PERCENTILE_RANKS
+
+    """
+    view = memoryview(blob)
+    if view.nbytes != PACKED_PERCENTILES_SIZE:
+        raise ValueError(f"Packed percentiles should be {PACKED_PERCENTILES_SIZE} bytes, "
+                         f"not {view.nbytes}")
+    if sys.byteorder == 'little':
+        return view.cast('B').cast('d')
+    # big-endian: the bytes have to be swapped, so we need a copy
+    swapped = array('d', view.tobytes())
+    swapped.byteswap()
+    return swapped
+
+
+def percentile_index(p):
+    """Returns the position of a percentile in PERCENTILE_RANKS (and so in packed percentile
+    values), e.g. 0.001 -> 0, 0.5 -> 499, 0.999 -> 998
+
+    :param p: one of the percentiles in PERCENTILE_RANKS
+
+    """
+    index = int(round(p * 1000)) - 1
+    if not 0 <= index < len(PERCENTILE_RANKS):
+        raise PercentileBoundsError(f"There is no stored percentile for p = {p}")
+    return index
@@ -0,0 +1,12 @@
+# Signals sent by the upload pipeline.
+#
+# data_set_ready is sent once a data set's points, percentiles and columns have all been saved,
+# so other apps can build whatever they derive from a data set (e.g. the chart API's stored
+# payloads) without the upload code having to know about them. It is sent inside the upload's
+# transaction, so anything receivers save is committed (or rolled back) along with the data set;
+# receivers with slow work can defer it with transaction.on_commit, as the chart API's does.
+
+from django.dispatch import Signal
+
+# sent with data_set=the finished Data_Set
+data_set_ready = Signal(providing_args=['data_set'])
@@ -0,0 +1,115 @@
+import csv
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from hda_privileged.geography import get_geography
+from hda_privileged.ingest import IngestStats
+from hda_privileged.models import Health_Indicator, Data_Set
+from hda_privileged.chr_reading import (
+    ingest_chr_file,
+    read_chr_columns,
+    is_all_zero,
+    parse_measure_list,
+    parse_measure_spec
+)
+
+HEADER = ['FIPS State Code', 'FIPS County Code', 'County', 'measure_1_value', 'measure_11_value']
+ROWS = [
+    HEADER,
+    ['00', '000', 'United States', '7000', '0.28'],  # national aggregate
+    ['01', '000', 'Alabama', '9000', '0.35'],  # state aggregate
+    ['01', '001', 'Autauga', '8500', '0.33'],
+    ['01', '003', 'Baldwin', '7500', ''],  # missing one measure
+    ['01', '005', 'Barbour', '11000', '0.41'],
+    ['01', '999', 'Nowhere', '1', '0.1'],  # not a county
+]
+
+
+class MeasureSpecTestCase(TestCase):
+
+    def test_parse_spec(self):
+        self.assertEqual(parse_measure_spec('11:Adult Obesity'), (11, 'Adult Obesity'))
+
+    def test_parse_spec_without_name(self):
+        with self.assertRaises(ValueError):
+            parse_measure_spec('11')
+
+    def test_parse_list_skips_blank_lines(self):
+        self.assertEqual(parse_measure_list('1:Premature Death\n\n11:Obesity\n'),
+                         [(1, 'Premature Death'), (11, 'Obesity')])
+
+    def test_all_zero(self):
+        self.assertTrue(is_all_zero('000'))
+        self.assertFalse(is_all_zero('010'))
+
+
+class IngestCHRFileTestCase(TestCase):
+
+    def write_rows(self, rows):
+        fp = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='')
+        csv.writer(fp).writerows(rows)
+        fp.seek(0)
+        return fp
+
+    def ingest(self, measures, rows=ROWS, year=2018):
+        with self.write_rows(rows) as fp:
+            return ingest_chr_file(fp, measures, year)
+
+    def test_one_data_set_per_measure(self):
+        (stats, data_sets) = self.ingest([(1, 'Premature Death'), (11, 'Obesity')])
+
+        self.assertEqual([ds.indicator.name for ds in data_sets], ['Premature Death', 'Obesity'])
+        self.assertEqual(data_sets[0].data_points.count(), 3)
+        # Baldwin has no obesity value
+        self.assertEqual(data_sets[1].data_points.count(), 2)
+        self.assertEqual(len(data_sets[0].get_percentile_values()), 999)
+
+    def test_counts_rows(self):
+        (stats, _) = self.ingest([(1, 'Premature Death')])
+
+        self.assertEqual(stats.rows, 6)
+        self.assertEqual(stats.skipped, 2)
+        self.assertEqual(stats.matched, 3)
+        self.assertEqual(stats.unmatched, {'999': '01'})
+
+    def test_non_numeric_values_are_left_out(self):
+        rows = ROWS + [['01', '007', 'Bibb', 'unreliable', '0.3']]
+        (stats, data_sets) = self.ingest([(1, 'Premature Death'), (11, 'Obesity')], rows=rows)
+
+        self.assertEqual(stats.non_numeric, [(8, 'measure_1_value', 'unreliable')])
+        self.assertEqual(data_sets[0].data_points.count(), 3)
+        self.assertEqual(data_sets[1].data_points.count(), 3)
+
+    def test_counties_matched_once(self):
+        # no queries once the geography is loaded, no matter how many measures are read
+        get_geography()
+        with self.write_rows(ROWS) as fp:
+            with self.assertNumQueries(0):
+                read_chr_columns(fp, [1, 11], IngestStats())
+
+    def test_missing_measure_column(self):
+        with self.assertRaises(ValueError):
+            self.ingest([(42, 'Not in the file')])
+        self.assertFalse(Data_Set.objects.exists())
+
+    def test_existing_year_rolls_back_everything(self):
+        obesity = Health_Indicator.objects.create(name='Obesity')
+        Data_Set.objects.create(indicator=obesity, year=2018)
+
+        with self.assertRaises(ValueError):
+            self.ingest([(1, 'Premature Death'), (11, 'Obesity')])
+
+        self.assertFalse(Data_Set.objects.filter(indicator__name='Premature Death').exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', newline='',
+                                         suffix='.csv') as fp:
+            csv.writer(fp).writerows(ROWS)
+            fp.flush()
+            call_command('load_chr_file', fp.name, '1:Premature Death', '11:Obesity',
+                         '--year=2018', stdout=StringIO())
+
+        self.assertEqual(Data_Set.objects.filter(year=2018).count(), 2)
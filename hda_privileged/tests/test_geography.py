@@ -0,0 +1,64 @@
+from django.test import TestCase
+
+from hda_privileged import geography
+from hda_privileged.models import US_County, US_State
+
+
+class GeographyTestCase(TestCase):
+
+    def setUp(self):
+        self.geography = geography.Geography.load()
+
+    def tearDown(self):
+        # tests that change states or counties must not leave them in the process's geography
+        geography.reload()
+
+    def test_states(self):
+        self.assertEqual(len(self.geography.states), US_State.objects.count())
+        self.assertEqual(self.geography.get_state('va').full, 'Virginia')
+        self.assertEqual(self.geography.get_state_for_fips('51').short, 'VA')
+        self.assertEqual(self.geography.states_by_name['Virginia'].short, 'VA')
+        self.assertIsNone(self.geography.get_state('XX'))
+
+    def test_counties(self):
+        county = self.geography.get_county('51059')
+        self.assertEqual(county, US_County.objects.get(fips5='51059'))
+        self.assertIs(self.geography.get_county_by_name('va', county.name), county)
+        self.assertIsNone(self.geography.get_county('99999'))
+
+        in_state = self.geography.get_counties('VA')
+        self.assertEqual(len(in_state), US_County.objects.filter(state='VA').count())
+        self.assertEqual([c.fips for c in in_state], sorted(c.fips for c in in_state))
+        self.assertEqual(self.geography.get_counties('XX'), ())
+
+    def test_lookups_make_no_queries(self):
+        with self.assertNumQueries(0):
+            county = self.geography.get_county('51059')
+            self.assertEqual(county.state.short, 'VA')
+            self.assertEqual(len(self.geography.get_counties('TX')), 254)
+
+    def test_immutable(self):
+        with self.assertRaises(TypeError):
+            self.geography.counties_by_fips5['99999'] = None
+        with self.assertRaises(AttributeError):
+            self.geography.get_counties('VA').append(None)
+
+    def test_loaded_once(self):
+        geography.reload()
+        with self.assertNumQueries(2):
+            loaded = geography.get_geography()
+        with self.assertNumQueries(0):
+            self.assertIs(geography.get_geography(), loaded)
+
+    def test_reloaded_after_migrate(self):
+        loaded = geography.get_geography()
+        # (sending post_migrate itself would also run every other app's receivers)
+        geography.reload_after_migrate(sender=None)
+        self.assertIsNot(geography.get_geography(), loaded)
+
+    def test_reloaded_after_change(self):
+        loaded = geography.get_geography()
+        state = US_State.objects.create(short='ZZ', full='Test State', fips='99')
+        self.assertIsNot(geography.get_geography(), loaded)
+        US_County.objects.create(fips='001', name='Test County', state=state)
+        self.assertEqual(geography.get_geography().get_county('99001').state.short, 'ZZ')
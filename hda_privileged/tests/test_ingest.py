@@ -0,0 +1,99 @@
+import csv
+import tempfile
+
+from django.test import TestCase
+
+from hda_privileged.models import Health_Indicator, Data_Set, Data_Set_County, Data_Set_State
+from hda_privileged.ingest import batched, ingest_data_file
+from hda_privileged.upload_reading import CHOICE_1FIPS
+
+
+class BatchedTestCase(TestCase):
+
+    def test_even_batches(self):
+        self.assertEqual(list(batched(range(4), 2)), [[0, 1], [2, 3]])
+
+    def test_last_batch_is_short(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_empty(self):
+        self.assertEqual(list(batched([], 3)), [])
+
+
+class IngestDataFileTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.test_data_set = Data_Set.objects.create(indicator=hi, year=2900)
+
+    def ingest(self, rows, **kwargs):
+        with tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='') as fp:
+            csv.writer(fp).writerows(rows)
+            fp.seek(0)
+            return ingest_data_file(fp, CHOICE_1FIPS, self.test_data_set, **kwargs)
+
+    def test_saves_points_and_percentiles(self):
+        rows = [
+            ['FIPS', 'Value'],
+            ['01001', '0.5'],
+            ['01003', '1.5'],
+            ['01005', '2.5'],
+            ['00000', '3.5'],  # is not matched
+            ['01007', ''],  # has no value
+        ]
+        stats = self.ingest(rows, batch_size=2)
+
+        self.assertEqual(stats.rows, 5)
+        self.assertEqual(stats.matched, 3)
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(len(stats.unmatched), 1)
+        self.assertEqual(self.test_data_set.data_points.count(), 3)
+        self.assertEqual(len(self.test_data_set.get_percentile_values()), 999)
+
+    def test_records_counties_and_states(self):
+        rows = [['FIPS', 'Value'], ['01001', '1'], ['01003', '2'], ['02013', '3'], ['01001', '4']]
+        self.ingest(rows)
+
+        counties = Data_Set_County.objects.filter(data_set=self.test_data_set)
+        self.assertEqual(sorted(counties.values_list('county__fips5', flat=True)), ['01001', '01003', '02013'])
+        states = Data_Set_State.objects.filter(data_set=self.test_data_set)
+        self.assertEqual(sorted(states.values_list('state_id', flat=True)), ['AK', 'AL'])
+
+        Data_Set.objects.get(pk=self.test_data_set.pk).delete()
+        self.assertFalse(counties.exists())
+        self.assertFalse(states.exists())
+
+    def test_non_numeric_values_are_skipped(self):
+        rows = [['FIPS', 'Value'], ['01001', '0.5'], ['01003', 'n/a'], ['01005', '2.5']]
+        stats = self.ingest(rows)
+
+        self.assertEqual(stats.matched, 2)
+        self.assertEqual(stats.skipped, 1)
+        self.assertEqual(stats.non_numeric, [(3, 'Value', 'n/a')])
+        self.assertEqual(self.test_data_set.data_points.count(), 2)
+
+    def test_percentiles_read_back_from_database(self):
+        rows = [['FIPS', 'Value']] + [[f'01{c:03d}', str(c)] for c in range(1, 20, 2)]
+        self.ingest(rows)
+
+        data_set = Data_Set.objects.get(pk=self.test_data_set.pk)
+        self.assertEqual(data_set.get_percentile_value(0.001), 1.0)
+        self.assertEqual(data_set.get_percentile_value(0.999), 19.0)
+
+    def test_points_have_ranks(self):
+        rows = [['FIPS', 'Value']] + [[f'01{c:03d}', str(c)] for c in range(1, 20, 2)]
+        self.ingest(rows, batch_size=3)
+
+        ranks = self.test_data_set.data_points.values_list('rank', flat=True)
+        self.assertTrue(all(0 < r <= 1 for r in ranks))
+
+    def test_reports_timing_and_memory(self):
+        stats = self.ingest([['FIPS', 'Value'], ['01001', '0.5']], trace_memory=True)
+        self.assertGreater(stats.seconds, 0)
+        self.assertGreater(stats.rows_per_second, 0)
+        self.assertIsNotNone(stats.peak_memory)
+
+    def test_memory_is_not_traced_by_default(self):
+        stats = self.ingest([['FIPS', 'Value'], ['01001', '0.5']])
+        self.assertIsNone(stats.peak_memory)
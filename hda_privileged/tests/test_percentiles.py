@@ -1,12 +1,22 @@
 from django.test import TestCase
 from hda_privileged.percentile import (
+    PERCENTILE_RANKS,
     PercentileBoundsError,
     rank,
     percentile,
+    percentile_array,
+    percentile_grid,
+    percentile_ranks,
     get_percentile_values,
     get_percentiles_for_points,
-    assign_percentiles_to_points)
+    assign_percentiles_to_points,
+    pack_percentile_values,
+    unpack_percentile_values,
+    percentile_index)
 from functools import reduce
+from itertools import dropwhile
+
+import random
 
 
 class RankCalculationTestCase(TestCase):
@@ -168,6 +178,114 @@ class PercentileValuesTestCase(TestCase):
         self.assertEqual(expected, get_percentile_values(ps, [value]))
 
 
+# the vectorized engine must give *exactly* the same answers as
+# calling `percentile` once for every percentile
+class VectorizedPercentileTestCase(TestCase):
+
+    def assertMatchesScalar(self, values):
+        values = sorted(values)
+        expected = [percentile(p, values) for p in PERCENTILE_RANKS]
+        actual = percentile_array(PERCENTILE_RANKS, values).tolist()
+        # assertEqual, not assertAlmostEqual: the results should be bit-for-bit identical
+        self.assertEqual(actual, expected)
+
+    def test_small_samples(self):
+        rng = random.Random(42)
+        for n in range(1, 40):
+            with self.subTest(n=n):
+                self.assertMatchesScalar([rng.gauss(0.5, 0.1) for _ in range(n)])
+
+    def test_county_sized_sample(self):
+        rng = random.Random(1234)
+        self.assertMatchesScalar([rng.uniform(-1000, 1000) for _ in range(3142)])
+
+    def test_integer_values(self):
+        self.assertMatchesScalar(list(range(100, 3, -4)))
+
+    def test_repeated_values(self):
+        self.assertMatchesScalar([7.5] * 20 + [8.25] * 3)
+
+    def test_empty_values(self):
+        with self.assertRaises(PercentileBoundsError):
+            percentile_array([0.5], [])
+
+    def test_excluded_percentile(self):
+        with self.assertRaises(PercentileBoundsError):
+            percentile_array([0, 0.5], [1, 2, 3])
+
+    def test_grid_sorts_values(self):
+        values = [3.0, 1.0, 2.0, 5.0, 4.0]
+        self.assertEqual(percentile_grid(values).tolist(),
+                         percentile_array(PERCENTILE_RANKS, sorted(values)).tolist())
+
+
+# the rank assignment that percentile_ranks replaced: scans the percentile list for every point
+def dropwhile_ranks(values, percentiles):
+    result = []
+    for value in sorted(values):
+        percentiles = list(dropwhile(lambda pv: pv[1] < value, percentiles))
+        result.append(1 if len(percentiles) == 0 else percentiles[0][0])
+    return result
+
+
+class PercentileRanksTestCase(TestCase):
+
+    def assertMatchesDropwhile(self, values):
+        pvs = get_percentile_values(PERCENTILE_RANKS, sorted(values))
+        ranks = [p for (p, _) in pvs]
+        rank_values = [pv for (_, pv) in pvs]
+
+        expected = dropwhile_ranks(values, pvs)
+        actual = percentile_ranks(sorted(values), ranks, rank_values).tolist()
+        self.assertEqual(actual, expected)
+
+    def test_matches_dropwhile(self):
+        rng = random.Random(99)
+        for n in (1, 2, 5, 10, 100, 3142):
+            with self.subTest(n=n):
+                self.assertMatchesDropwhile([rng.gauss(10, 3) for _ in range(n)])
+
+    def test_repeated_values(self):
+        self.assertMatchesDropwhile([1, 1, 1, 2, 2, 3, 3, 3, 3, 4])
+
+    # values above the 99.9th percentile value do not fit in a bucket; they are ranked 1
+    def test_above_largest_percentile(self):
+        ranks = percentile_ranks([0.5, 10, 11], [0.25, 0.5, 0.75], [1, 2, 3])
+        self.assertEqual(ranks.tolist(), [0.25, 1, 1])
+
+    # the values do not need to be sorted, and ranks come back in the same order
+    def test_keeps_value_order(self):
+        ranks = percentile_ranks([3, 1, 2], [0.25, 0.5, 0.75], [1, 2, 3])
+        self.assertEqual(ranks.tolist(), [0.75, 0.25, 0.5])
+
+
+class PackedPercentilesTestCase(TestCase):
+
+    def test_roundtrip(self):
+        rng = random.Random(7)
+        grid = percentile_grid([rng.gauss(0, 1) for _ in range(500)])
+        packed = pack_percentile_values(grid)
+        self.assertEqual(len(packed), 999 * 8)
+        self.assertEqual(list(unpack_percentile_values(packed)), grid.tolist())
+
+    def test_unpack_memoryview(self):
+        packed = pack_percentile_values(list(range(999)))
+        self.assertEqual(unpack_percentile_values(memoryview(packed))[998], 998.0)
+
+    def test_wrong_size(self):
+        with self.assertRaises(ValueError):
+            pack_percentile_values([1, 2, 3])
+        with self.assertRaises(ValueError):
+            unpack_percentile_values(b'\x00' * 16)
+
+    def test_index(self):
+        self.assertEqual(percentile_index(0.001), 0)
+        self.assertEqual(percentile_index(0.5), 499)
+        self.assertEqual(percentile_index(0.999), 998)
+        with self.assertRaises(PercentileBoundsError):
+            percentile_index(1)
+
+
 # https://stackoverflow.com/a/6192298
 class MockPoint(object):
     def __init__(self, value, *, percentile=None):
@@ -0,0 +1,234 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from hda_privileged import upload_jobs
+from hda_privileged.chr_reading import CHOICE_CHR
+from hda_privileged.ingest import IngestStats
+from hda_privileged.models import Data_Point, Data_Set, Document, Health_Indicator, Upload_Job
+from hda_privileged.upload_jobs import (
+    JobTakenBack,
+    claim_next_job,
+    enqueue_upload,
+    finish_job,
+    requeue_stale_jobs,
+    run_job,
+    save_progress
+)
+from hda_privileged.upload_reading import CHOICE_1FIPS
+
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+# uploaded documents are saved here instead of in the project's media folder
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class UploadJobTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.indicator = Health_Indicator.objects.create(name='Test Indicator')
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='testuser', password='12345')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def make_document(self, contents):
+        doc = Document(source='tests')
+        doc.file.save('upload.csv', ContentFile(contents.encode('utf-8')))
+        return doc
+
+    def queue(self, contents, indicator=None):
+        return enqueue_upload(
+            self.make_document(contents),
+            indicator or self.indicator,
+            2018,
+            CHOICE_1FIPS
+        )
+
+    def test_new_jobs_are_queued(self):
+        job = self.queue('FIPS,Value\n01001,0.5\n')
+        self.assertEqual(job.phase, Upload_Job.QUEUED)
+
+    def test_claim_marks_job_started(self):
+        job = self.queue('FIPS,Value\n01001,0.5\n')
+        claimed = claim_next_job()
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.phase, Upload_Job.READING)
+        self.assertIsNotNone(claimed.started_at)
+
+    def test_claimed_job_is_not_claimed_again(self):
+        self.queue('FIPS,Value\n01001,0.5\n')
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+
+    def test_run_job_creates_data_set(self):
+        self.queue('FIPS,Value\n01001,0.5\n01003,1.5\n00000,2.5\n')
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.phase, Upload_Job.DONE)
+        self.assertEqual(job.rows_read, 3)
+        self.assertEqual(job.rows_matched, 2)
+        self.assertEqual(job.data_set.data_points.count(), 2)
+        self.assertEqual(job.data_set.source_document, job.document)
+
+    def test_non_numeric_values_are_skipped(self):
+        self.queue('FIPS,Value\n01001,not a number\n01003,1.5\n')
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.phase, Upload_Job.DONE)
+        self.assertEqual(job.rows_matched, 1)
+        self.assertEqual(job.rows_skipped, 1)
+
+    def test_failed_job_removes_data_set(self):
+        # no FIPS column
+        self.queue('County,Value\n01001,0.5\n')
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.phase, Upload_Job.FAILED)
+        self.assertNotEqual(job.error, '')
+        self.assertFalse(self.indicator.data_sets.exists())
+
+    def abandon(self, job, seconds_ago):
+        # as if the worker running the job died that long ago, after creating its data set
+        Upload_Job.objects.filter(pk=job.pk).update(
+            heartbeat_at=timezone.now() - timedelta(seconds=seconds_ago))
+        self.indicator.data_sets.create(year=2018, source_document=job.document)
+
+    def test_stale_job_is_queued_again(self):
+        self.queue('FIPS,Value\n01001,0.5\n')
+        job = claim_next_job()
+        self.abandon(job, 120)
+
+        self.assertEqual(requeue_stale_jobs(stale_after=300), [])
+        self.assertEqual([j.id for j in requeue_stale_jobs(stale_after=60)], [job.id])
+        self.assertFalse(self.indicator.data_sets.exists())
+
+        job = run_job(claim_next_job())
+        self.assertEqual(job.phase, Upload_Job.DONE)
+        self.assertEqual(job.attempts, 2)
+        self.assertEqual(self.indicator.data_sets.count(), 1)
+
+    def test_stale_job_fails_after_too_many_attempts(self):
+        self.queue('FIPS,Value\n01001,0.5\n')
+        for _ in range(2):
+            self.abandon(claim_next_job(), 120)
+            [job] = requeue_stale_jobs(stale_after=60, max_attempts=2)
+
+        self.assertEqual(job.phase, Upload_Job.FAILED)
+        self.assertNotEqual(job.error, '')
+        self.assertIsNone(claim_next_job())
+
+    def test_running_job_is_not_taken_back(self):
+        self.queue('FIPS,Value\n01001,0.5\n')
+        claim_next_job()
+        self.assertEqual(requeue_stale_jobs(stale_after=60), [])
+
+    def test_slow_worker_cannot_save_over_a_new_claim(self):
+        self.queue('FIPS,Value\n01001,0.5\n')
+        slow = claim_next_job()
+        self.abandon(slow, 120)
+        requeue_stale_jobs(stale_after=60)
+        claim_next_job()
+
+        with self.assertRaises(JobTakenBack):
+            save_progress(slow, Upload_Job.SAVING, IngestStats())
+        self.assertFalse(finish_job(slow, phase=Upload_Job.DONE))
+        job = Upload_Job.objects.get(pk=slow.pk)
+        self.assertEqual((job.phase, job.attempts), (Upload_Job.READING, 2))
+
+    def take_back_while_saving(self):
+        # as if the job were taken back between two batches of points (here the takeover is made
+        # on the test's own connection, so it is rolled back with the ingest, leaving the job as
+        # it was; the next heartbeat still sees it and stops the ingest)
+        real_save_progress = upload_jobs.save_progress
+
+        def save_progress(job, phase, stats):
+            if phase == Upload_Job.SAVING and Data_Point.objects.exists():
+                requeue_stale_jobs(stale_after=-60)
+            real_save_progress(job, phase, stats)
+
+        return mock.patch('hda_privileged.upload_jobs.save_progress', save_progress)
+
+    def test_job_taken_back_while_saving_keeps_nothing(self):
+        self.queue('FIPS,Value\n01001,0.5\n01003,1.5\n')
+        with self.take_back_while_saving():
+            job = run_job(claim_next_job())
+
+        self.assertIsNone(job.finished_at)
+        self.assertFalse(Data_Set.objects.exists())
+        self.assertFalse(Data_Point.objects.exists())
+
+    def test_chr_job_taken_back_while_saving_keeps_nothing(self):
+        contents = ('FIPS State Code,FIPS County Code,measure_1_value\n'
+                    '01,001,8500\n01,003,7500\n')
+        enqueue_upload(self.make_document(contents), None, 2018, CHOICE_CHR,
+                       measures='1:Premature Death')
+        with self.take_back_while_saving():
+            job = run_job(claim_next_job())
+
+        self.assertIsNone(job.finished_at)
+        self.assertFalse(Data_Set.objects.exists())
+        self.assertFalse(Data_Point.objects.exists())
+
+    def test_run_chr_job(self):
+        contents = ('FIPS State Code,FIPS County Code,measure_1_value,measure_11_value\n'
+                    '01,001,8500,0.33\n01,003,7500,0.31\n')
+        enqueue_upload(self.make_document(contents), None, 2018, CHOICE_CHR,
+                       measures='1:Premature Death\n11:Obesity')
+        job = run_job(claim_next_job())
+
+        self.assertEqual(job.phase, Upload_Job.DONE, job.error)
+        self.assertEqual(job.document.data_sets.count(), 2)
+
+    def test_worker_command_runs_queue(self):
+        self.queue('FIPS,Value\n01001,0.5\n')
+        self.queue('FIPS,Value\n01003,0.5\n')
+        call_command('process_upload_jobs', '--once', stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Upload_Job.objects.exclude(phase=Upload_Job.DONE).exists())
+
+    def test_status_endpoint(self):
+        self.queue('FIPS,Value\n01001,0.5\n00000,2.5\n')
+        job = run_job(claim_next_job())
+
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get(f'/priv/upload/job/{job.id}/')
+        status = response.json()
+
+        self.assertEqual(status['phase'], Upload_Job.DONE)
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['rows_matched'], 1)
+        self.assertEqual(status['unmatched'], {'000': '00'})
+        self.assertEqual(status['data_set_id'], job.data_set_id)
+
+    def test_status_endpoint_unknown_job(self):
+        self.client.login(username='testuser', password='12345')
+        response = self.client.get('/priv/upload/job/999/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_upload_view_returns_queued_job(self):
+        self.client.login(username='testuser', password='12345')
+        upload = ContentFile(b'FIPS,Value\n01001,0.5\n', name='upload.csv')
+        response = self.client.post('/priv/upload/', {
+            'file': upload,
+            'column_format': CHOICE_1FIPS,
+            'indicator': self.indicator.id,
+            'year': 2018,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        job = response.context['job']
+        self.assertEqual(job.phase, Upload_Job.QUEUED)
+        # nothing is read until a worker runs the job
+        self.assertFalse(self.indicator.data_sets.exists())
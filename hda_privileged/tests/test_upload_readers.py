@@ -14,6 +14,7 @@ from hda_privileged.upload_reading import (
     CHOICE_1FIPS,
     CHOICE_2FIPS,
     CHOICE_NAME,
+    CountyResolver,
     get_county_with_1fips,
     get_county_with_2fips,
     get_county_with_name,
@@ -218,3 +219,28 @@ class ReadDataPointsFromFileTestCase(TestCase):
             self.assertIsInstance(unmatched, dict)
 
         self.file_reading_harness(rows, CHOICE_1FIPS, asserts)
+
+    # the resolver uses the in-memory geography, so once that is loaded, reading a file
+    # makes no queries, however many rows it has
+    def test_constant_query_count(self):
+        resolver = CountyResolver()
+        few_rows = [['FIPS', 'Value'], ['01001', '0.5']]
+        many_rows = [['FIPS', 'Value']] + [[fips, '0.5'] for fips in resolver.counties_by_fips5]
+
+        for (label, rows) in [('few', few_rows), ('many', many_rows)]:
+            with self.subTest(rows=label):
+                with self.assertNumQueries(0):
+                    self.file_reading_harness(rows, CHOICE_1FIPS, lambda pts, errs: None)
+
+    def test_resolved_counties_include_state(self):
+        rows = [
+            ['State', 'County', 'Value'],
+            ['Virginia', 'Montgomery', '0.1'],
+        ]
+
+        def asserts(data_points, errors):
+            # the state was attached by the resolver, so following it should not query
+            with self.assertNumQueries(0):
+                self.assertEqual(data_points[0].county.state.short, 'VA')
+
+        self.file_reading_harness(rows, CHOICE_NAME, asserts)
@@ -0,0 +1,119 @@
+import csv
+import io
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from hda_privileged.chr_reading import CHOICE_CHR
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Data_Set, Document, Health_Indicator, Upload_Job
+from hda_privileged.upload_reading import CHOICE_1FIPS, CHOICE_NAME
+from hda_privileged.upload_validation import validate_data_file
+
+
+def csv_file(rows):
+    fp = io.StringIO()
+    csv.writer(fp).writerows(rows)
+    fp.seek(0)
+    return fp
+
+
+class ValidateDataFileTestCase(TestCase):
+
+    def test_valid_file(self):
+        rows = [['FIPS', 'Value'], ['01001', '1'], ['01003', '2'], ['01005', '6']]
+        report = validate_data_file(csv_file(rows), CHOICE_1FIPS)
+
+        self.assertTrue(report.is_valid)
+        self.assertEqual(report.matched, 3)
+        self.assertEqual(report.summaries['Value']['mean'], 3.0)
+        self.assertEqual(report.summaries['Value']['median'], 2.0)
+
+    def test_finds_problems(self):
+        rows = [
+            ['FIPS', 'Value'],
+            ['01001', '1'],
+            ['01001', '2'],  # duplicate county
+            ['01999', '3'],  # not a county
+            ['01005', 'n/a'],  # not a number
+            ['01007', ''],  # blank
+        ]
+        report = validate_data_file(csv_file(rows), CHOICE_1FIPS)
+
+        self.assertFalse(report.is_valid)
+        self.assertEqual(report.rows, 5)
+        self.assertEqual(report.unmatched, {'999': '01'})
+        self.assertEqual(list(report.duplicates.values()), [2])
+        self.assertEqual(report.non_numeric, [(5, 'Value', 'n/a')])
+        self.assertEqual(report.blank, 1)
+
+    def test_chr_measures(self):
+        rows = [
+            ['FIPS State Code', 'FIPS County Code', 'measure_1_value', 'measure_11_value'],
+            ['01', '000', '9000', '0.35'],  # state aggregate
+            ['01', '001', '8500', 'x'],
+            ['01', '003', '7500', '0.3'],
+        ]
+        report = validate_data_file(csv_file(rows), CHOICE_CHR, [1, 11])
+
+        self.assertEqual(report.matched, 2)
+        self.assertEqual(report.summaries['measure_1_value']['count'], 2)
+        self.assertEqual(report.non_numeric, [(3, 'measure_11_value', 'x')])
+
+    def test_missing_column(self):
+        with self.assertRaises(ValueError):
+            validate_data_file(csv_file([['State', 'County']]), CHOICE_NAME)
+
+    def test_writes_nothing(self):
+        rows = [['FIPS', 'Value'], ['01001', '1']]
+        # counties come from the in-memory geography, so nothing is read or written
+        get_geography()
+        with self.assertNumQueries(0):
+            validate_data_file(csv_file(rows), CHOICE_1FIPS)
+
+
+class ValidateDataFileCommandTestCase(TestCase):
+
+    def test_reports_problems(self):
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', newline='',
+                                         suffix='.csv') as fp:
+            csv.writer(fp).writerows([['FIPS', 'Value'], ['01999', '1']])
+            fp.flush()
+            with self.assertRaises(CommandError):
+                call_command('validate_data_file', fp.name, f'--format={CHOICE_1FIPS}', stdout=out)
+        self.assertIn('Unmatched: 999, 01', out.getvalue())
+
+
+class ValidateOnlyUploadTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.indicator = Health_Indicator.objects.create(name='Test Indicator')
+        User = get_user_model()
+        User.objects.create_user(username='testuser', password='12345')
+
+    def test_nothing_is_saved(self):
+        self.client.login(username='testuser', password='12345')
+        upload = ContentFile(b'FIPS,Value\n01001,0.5\n01999,1\n', name='upload.csv')
+        response = self.client.post('/priv/upload/', {
+            'file': upload,
+            'column_format': CHOICE_1FIPS,
+            'indicator': self.indicator.id,
+            'year': 2018,
+            'validate_only': 'on',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        report = response.context['report']
+        self.assertEqual(report.matched, 1)
+        self.assertEqual(report.unmatched, {'999': '01'})
+        self.assertIsNone(response.context['job'])
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(Upload_Job.objects.exists())
+        self.assertFalse(Data_Set.objects.exists())
@@ -0,0 +1,98 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from hda_privileged import geography
+from hda_privileged.models import US_County, US_State
+
+
+class DerivedFieldsTestCase(TestCase):
+
+    def tearDown(self):
+        # these tests add a state, which must not be left in the process's geography
+        geography.reload()
+
+    def test_stored_for_every_county(self):
+        # filled in by the migration
+        self.assertFalse(US_County.objects.filter(fips5='').exists())
+        county = US_County.objects.select_related('state').get(fips5='51059')
+        self.assertEqual(county.state.fips + county.fips, '51059')
+        self.assertEqual(county.search_str, f'{county.name} VA')
+
+    def test_set_on_save(self):
+        state = US_State.objects.create(short='ZZ', full='Test State', fips='99')
+        county = US_County.objects.create(fips='001', name='Test County', state=state)
+        self.assertEqual(US_County.objects.filter(fips5='99001', search_str='Test County ZZ').count(), 1)
+
+        county.name = 'Renamed County'
+        county.save(update_fields=['name'])
+        county.refresh_from_db()
+        self.assertEqual(county.search_str, 'Renamed County ZZ')
+
+    def test_set_when_only_state_id_is_saved(self):
+        state = US_State.objects.create(short='ZZ', full='Test State', fips='99')
+        # (with its old state loaded, which Django doesn't forget when state_id is set)
+        county = US_County.objects.select_related('state').get(fips5='51059')
+        county.state_id = state.short
+        county.save(update_fields=['state_id'])
+        self.assertTrue(US_County.objects.filter(pk=county.pk, fips5='99059',
+                                                 search_str=f'{county.name} ZZ').exists())
+
+    def test_state_change_updates_counties(self):
+        state = US_State.objects.create(short='ZZ', full='Test State', fips='99')
+        US_County.objects.create(fips='001', name='Test County', state=state)
+        state.fips = '98'
+        state.save()
+        self.assertTrue(US_County.objects.filter(fips5='98001').exists())
+
+
+class LookupIndexTestCase(TestCase):
+    # lookups by the stored fields can read an index, without joining counties to their states
+    # (which indexes the planner picks depends on the database and its statistics, so the indexes
+    # themselves are checked rather than query plans)
+
+    def get_indexed_columns(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, US_County._meta.db_table)
+        return {tuple(c['columns']) for c in constraints.values() if c['index'] or c['unique']}
+
+    def test_fips5_is_indexed(self):
+        self.assertIn(('fips5',), self.get_indexed_columns())
+
+    def test_search_str_is_indexed(self):
+        self.assertIn(('search_str',), self.get_indexed_columns())
+
+    def test_lookups_have_no_join(self):
+        queries = [
+            US_County.objects.filter(fips5='51059'),
+            US_County.objects.filter(fips5__in=['51059', '01001']),
+            US_County.objects.filter(search_str='Fairfax County VA'),
+            # a substring search can't use an index, but no longer builds a string for every county
+            US_County.objects.filter(search_str__icontains='fair'),
+        ]
+        for query in queries:
+            with self.subTest(query=str(query.query)):
+                self.assertNotIn('us_state', str(query.query).lower())
+
+
+class GeographyAdminTestCase(TestCase):
+    # every process keeps states and counties in memory, so the admin site can't change them
+
+    def setUp(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', '12345')
+        self.client.force_login(admin)
+
+    def test_state_is_read_only(self):
+        state = US_State.objects.get(short='VA')
+        url = reverse('admin:hda_privileged_us_state_change', args=[state.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {'short': 'VA', 'full': 'Renamed', 'fips': '51'}).status_code, 403)
+        self.assertEqual(US_State.objects.get(short='VA').full, 'Virginia')
+
+    def test_county_cannot_be_added_or_deleted(self):
+        county = US_County.objects.get(fips5='51059')
+        self.assertEqual(self.client.get(reverse('admin:hda_privileged_us_county_add')).status_code, 403)
+        url = reverse('admin:hda_privileged_us_county_delete', args=[county.pk])
+        self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code, 403)
+        self.assertTrue(US_County.objects.filter(pk=county.pk).exists())
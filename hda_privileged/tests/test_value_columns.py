@@ -0,0 +1,104 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from app_api import chart_cache
+from hda_privileged.ingest import ValueColumn, save_value_column
+from hda_privileged.models import Data_Point, Data_Set, Data_Set_Columns, Health_Indicator, US_County
+from hda_privileged.value_columns import pack_fips, prefix_slice, unpack_fips, pack_ints, unpack_ints
+
+
+class PackingTestCase(TestCase):
+
+    def test_fips_roundtrip(self):
+        codes = ['01001', '56045', '11001']
+        self.assertEqual(unpack_fips(pack_fips(codes)), codes)
+
+    def test_fips_width(self):
+        with self.assertRaises(ValueError):
+            pack_fips(['1001'])
+
+    def test_ints_roundtrip(self):
+        self.assertEqual(unpack_ints(pack_ints([3, 1, 2 ** 40])).tolist(), [3, 1, 2 ** 40])
+
+    def test_prefix_slice(self):
+        codes = ['01001', '01003', '02013', '02016', '04001']
+        self.assertEqual(codes[prefix_slice(codes, '02')], ['02013', '02016'])
+        self.assertEqual(codes[prefix_slice(codes, '01003')], ['01003'])
+        self.assertEqual(codes[prefix_slice(codes, '03')], [])
+        self.assertEqual(codes[prefix_slice(codes, '')], codes)
+
+
+class DataSetColumnsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        # counties from two states, deliberately out of FIPS order
+        cls.counties = list(US_County.objects.filter(state__short__in=['AL', 'AK']).order_by('-id')[:40])
+        column = ValueColumn()
+        for (i, county) in enumerate(cls.counties):
+            column.append(county.id, float(i))
+        save_value_column(cls.data_set, column)
+
+    def test_written_with_points(self):
+        columns = Data_Set_Columns.objects.get(data_set=self.data_set)
+        self.assertEqual(len(columns), self.data_set.data_points.count())
+
+    def test_rows_match_points(self):
+        columns = Data_Set_Columns.objects.get(data_set=self.data_set)
+        points = {p.county_id: p for p in self.data_set.data_points.all()}
+        for row in columns.get_rows():
+            self.assertEqual(row.value, points[row.county_id].value)
+            self.assertEqual(row.rank, points[row.county_id].rank)
+
+    def test_rows_for_state(self):
+        columns = Data_Set_Columns.objects.get(data_set=self.data_set)
+        for state in ('01', '02'):
+            with self.subTest(state=state):
+                expected = sorted(c.fips5 for c in self.counties if c.fips5.startswith(state))
+                self.assertEqual([row.fips for row in columns.get_rows(state)], expected)
+
+    def test_rows_for_counties(self):
+        columns = Data_Set_Columns.objects.get(data_set=self.data_set)
+        wanted = [self.counties[3].fips5, self.counties[0].fips5, '99999']
+        rows = columns.get_rows_for_counties(wanted)
+        self.assertEqual([row.county_id for row in rows], [self.counties[3].id, self.counties[0].id])
+
+
+class BuildDataSetColumnsTestCase(TestCase):
+
+    def test_builds_missing_columns(self):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        for (i, county) in enumerate(US_County.objects.all()[:10]):
+            Data_Point.objects.create(county=county, data_set=data_set, value=i, rank=i / 10)
+
+        call_command('build_data_set_columns', stdout=StringIO())
+
+        columns = Data_Set_Columns.objects.get(data_set=data_set)
+        self.assertEqual(sorted(row.value for row in columns.get_rows()), list(range(10)))
+
+    def test_duplicate_county_keeps_first_point(self):
+        hi = Health_Indicator.objects.create(name='Test Indicator')
+        data_set = Data_Set.objects.create(indicator=hi, year=2900)
+        (autauga, baldwin) = US_County.objects.filter(fips5__in=['01001', '01003']).order_by('fips5')
+        for (county, value) in ((baldwin, 1.0), (autauga, 2.0), (baldwin, 3.0)):
+            Data_Point.objects.create(county=county, data_set=data_set, value=value, rank=value / 4)
+
+        call_command('build_data_set_columns', stdout=StringIO())
+
+        columns = Data_Set_Columns.objects.get(data_set=data_set)
+        self.assertEqual([(row.fips, row.value) for row in columns.get_rows()],
+                         [('01001', 2.0), ('01003', 1.0)])
+        self.assertEqual(len(columns), 2)
+
+        # the same points as charting the Data_Points
+        charted = self.client.get(f'/api/chart/points/{data_set.id}', {'state': 'AL'}).json()
+        self.assertEqual(len(charted['config']['data']), 2)
+        Data_Set_Columns.objects.filter(data_set=data_set).delete()
+        chart_cache.get_cache().clear()
+        from_points = self.client.get(f'/api/chart/points/{data_set.id}', {'state': 'AL'}).json()
+        self.assertEqual(charted['config']['data'], from_points['config']['data'])
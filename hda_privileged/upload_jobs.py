@@ -0,0 +1,294 @@
+# A small database-backed job queue for uploads.
+#
+# Reading a large file and saving its data set can take longer than a load balancer will wait
+# for a response, and ties up a web worker the whole time. Instead, the upload view saves the
+# file and queues an Upload_Job (enqueue_upload), and the process_upload_jobs management command
+# runs the queued jobs in a separate process (claim_next_job + run_job). While a job runs it
+# records its phase and row counts, which the upload page polls through a JSON endpoint.
+#
+# Every progress save is also a heartbeat, including one after each batch of points is saved.
+# If a worker dies while running a job, the job stops getting heartbeats, and once it has gone
+# without one for UPLOAD_JOB_STALE_AFTER seconds the next worker to check the queue
+# (requeue_stale_jobs) removes what it had saved and queues it again, up to
+# UPLOAD_JOB_MAX_ATTEMPTS times.
+#
+# A worker that was only slow must not carry on once its job has been taken back, or the
+# document would be read twice. Each claim counts an attempt, and a worker only saves progress
+# (or finishes) with a conditional UPDATE for the attempt it claimed. If that matches nothing,
+# the job was taken back: JobTakenBack is raised from the progress callback, which stops the
+# ingest and rolls back its transaction. The last heartbeat is sent inside that transaction, so
+# the job's row stays locked until it commits, and it can't be taken back in between.
+
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from hda_privileged.chr_reading import CHOICE_CHR, ingest_chr_file, parse_measure_list
+from hda_privileged.ingest import ingest_data_file
+from hda_privileged.models import Data_Set, Upload_Job
+
+# defaults for the UPLOAD_JOB_STALE_AFTER and UPLOAD_JOB_MAX_ATTEMPTS settings
+DEFAULT_STALE_AFTER = 60 * 60
+DEFAULT_MAX_ATTEMPTS = 3
+
+# the phases of a job a worker is running
+RUNNING_PHASES = (Upload_Job.READING, Upload_Job.SAVING)
+
+
+class JobTakenBack(Exception):
+    """
+    Raised when a worker tries to save a job that has been taken back from it
+    """
+
+
+def enqueue_upload(document, indicator, year, column_format, measures=''):
+    """
+    Queues a saved document to be read into a new data set
+
+    :param document: saved Document instance containing the uploaded file
+    :param indicator: Health_Indicator the new data set is for (unused for CHR files)
+    :param year: year the new data set covers
+    :param column_format: one of the choice codes from UPLOAD_FORMAT_CHOICES, or CHOICE_CHR
+    :param measures: for CHR files, 'ID:NAME' measures to load, one per line  (Default value = '')
+    :returns: the new Upload_Job
+
+    """
+    return Upload_Job.objects.create(
+        document=document,
+        indicator=indicator,
+        year=year,
+        column_format=column_format,
+        measures=measures
+    )
+
+
+def claim_next_job():
+    """
+    Takes the oldest queued job, marking it as started. The claim is a single conditional UPDATE,
+    so if several workers are running, only one of them can claim any particular job.
+
+    :returns: the claimed Upload_Job, or None if nothing is queued
+
+    """
+    queued = Upload_Job.objects.filter(phase=Upload_Job.QUEUED).order_by('created_at', 'id')
+    for job_id in queued.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = Upload_Job.objects.filter(pk=job_id, phase=Upload_Job.QUEUED).update(
+            phase=Upload_Job.READING,
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Upload_Job.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs(stale_after=None, max_attempts=None):
+    """
+    Takes back jobs left running by workers that died: any job that has been running without a
+    heartbeat for too long loses the data sets it created, and is queued again (or failed, if it
+    has already been tried too many times). Like claiming, each takeover is a conditional UPDATE.
+
+    :param stale_after: seconds without a heartbeat; by default the UPLOAD_JOB_STALE_AFTER
+        setting  (Default value = None)
+    :param max_attempts: claims before a job is failed; by default the UPLOAD_JOB_MAX_ATTEMPTS
+        setting  (Default value = None)
+    :returns: list of the jobs taken back
+
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'UPLOAD_JOB_STALE_AFTER', DEFAULT_STALE_AFTER)
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'UPLOAD_JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+
+    stale = Upload_Job.objects.filter(phase__in=RUNNING_PHASES, heartbeat_at__lt=cutoff)
+    taken_back = []
+    for job in stale.order_by('id'):
+        # read first, so a data set made by a worker claiming the job afterwards is left alone
+        # (CHR jobs save everything in one transaction, which rolls back once the job is taken)
+        data_set_ids = list(Data_Set.objects.filter(source_document_id=job.document_id)
+                            .values_list('id', flat=True))
+        if job.attempts >= max_attempts:
+            changes = {'phase': Upload_Job.FAILED, 'finished_at': timezone.now(),
+                       'error': f"The worker running this upload stopped {job.attempts} times"}
+        else:
+            changes = {'phase': Upload_Job.QUEUED, 'started_at': None, 'heartbeat_at': None,
+                       'rows_read': 0, 'rows_matched': 0, 'rows_skipped': 0, 'unmatched': '{}'}
+        # (only if no worker has claimed it or saved progress since it was read)
+        unchanged = Upload_Job.objects.filter(pk=job.pk, phase=job.phase,
+                                              heartbeat_at=job.heartbeat_at)
+        taken = unchanged.update(**changes)
+        if taken:
+            # a data file job creates its data set before reading the file
+            Data_Set.objects.filter(pk__in=data_set_ids).delete()
+            taken_back.append(Upload_Job.objects.get(pk=job.pk))
+    return taken_back
+
+
+def claimed(job):
+    """
+    Returns a query for a job, matching it only while it is still running under the claim a
+    worker has (each claim counts another attempt)
+
+    :param job: Upload_Job returned by claim_next_job
+
+    """
+    return Upload_Job.objects.filter(pk=job.pk, attempts=job.attempts, phase__in=RUNNING_PHASES)
+
+
+def save_progress(job, phase, stats):
+    """
+    Copies the progress of an ingest into a job and saves it, so it can be polled
+
+    :param job: Upload_Job being run
+    :param phase: one of the Upload_Job phases
+    :param stats: IngestStats so far
+    :raises JobTakenBack: if the job has been taken back from this worker
+
+    """
+    job.phase = phase
+    job.rows_read = stats.rows
+    job.rows_matched = stats.matched
+    job.rows_skipped = stats.skipped
+    job.unmatched = json.dumps(stats.unmatched)
+    job.heartbeat_at = timezone.now()
+    saved = claimed(job).update(
+        phase=job.phase,
+        rows_read=job.rows_read,
+        rows_matched=job.rows_matched,
+        rows_skipped=job.rows_skipped,
+        unmatched=job.unmatched,
+        heartbeat_at=job.heartbeat_at
+    )
+    if not saved:
+        raise JobTakenBack(f"Upload job {job.pk} was taken back from this worker")
+
+
+def finish_job(job, **changes):
+    """
+    Marks a job as finished (done or failed), unless it has been taken back from this worker
+
+    :param job: Upload_Job being run
+    :param changes: fields to set along with finished_at
+    :returns: whether the job was still this worker's to finish
+
+    """
+    changes['finished_at'] = timezone.now()
+    finished = claimed(job).update(**changes)
+    if finished:
+        for (field, value) in changes.items():
+            setattr(job, field, value)
+    return bool(finished)
+
+
+def run_data_file_job(job, progress):
+    """
+    Reads a job's document into a single data set for the job's indicator
+
+    :param job: Upload_Job being run
+    :param progress: function (phase, IngestStats) -> None
+    :returns: IngestStats
+
+    """
+    if job.indicator is None:
+        raise ValueError("No health indicator was selected for this upload")
+
+    # not one transaction: progress saved while the file is read must be visible to pollers
+    data_set = job.indicator.data_sets.create(year=job.year, source_document=job.document)
+    try:
+        stats = ingest_data_file(job.document.file, job.column_format, data_set,
+                                 progress=progress)
+    except Exception:
+        data_set.delete()
+        raise
+    job.data_set = data_set
+    return stats
+
+
+def run_chr_job(job, progress):
+    """
+    Reads a job's County Health Rankings document into one data set per measure
+
+    :param job: Upload_Job being run
+    :param progress: function (phase, IngestStats) -> None
+    :returns: IngestStats
+
+    """
+    measures = parse_measure_list(job.measures)
+    (stats, _) = ingest_chr_file(job.document.file, measures, job.year,
+                                 document=job.document, progress=progress)
+    return stats
+
+
+def run_job(job):
+    """
+    Reads a claimed job's document into new data set(s). If anything goes wrong, the job is
+    marked as failed (with the reason) and no data sets are kept. If the job is taken back while
+    it runs (see requeue_stale_jobs), it is left as it is, and nothing this run saved is kept.
+
+    :param job: Upload_Job returned by claim_next_job
+    :returns: the Upload_Job, as it is now
+
+    """
+    def progress(phase, stats):
+        save_progress(job, phase, stats)
+
+    runner = run_chr_job if job.column_format == CHOICE_CHR else run_data_file_job
+
+    try:
+        job.document.file.open(mode='rt')
+        try:
+            stats = runner(job, progress)
+        finally:
+            job.document.file.close()
+    except JobTakenBack:
+        # whatever was being saved was rolled back, and the data file's data set deleted
+        finished = False
+    except Exception as exc:
+        finished = finish_job(job, phase=Upload_Job.FAILED,
+                              error=str(exc) or exc.__class__.__name__)
+    else:
+        finished = finish_job(
+            job,
+            phase=Upload_Job.DONE,
+            rows_read=stats.rows,
+            rows_matched=stats.matched,
+            rows_skipped=stats.skipped,
+            unmatched=json.dumps(stats.unmatched),
+            data_set=job.data_set
+        )
+        if not finished and job.data_set is not None:
+            # taken back after its data set was saved; the worker that takes it over makes another
+            Data_Set.objects.filter(pk=job.data_set.pk).delete()
+
+    if not finished:
+        job.refresh_from_db()
+    return job
+
+
+def job_status(job):
+    """
+    Describes a job's progress as a dictionary that can be serialized to JSON
+
+    :param job: Upload_Job
+    :returns: dict
+
+    """
+    return {
+        'id': job.id,
+        'phase': job.phase,
+        'phase_label': job.get_phase_display(),
+        'finished': job.is_finished,
+        'rows_read': job.rows_read,
+        'rows_matched': job.rows_matched,
+        'rows_skipped': job.rows_skipped,
+        'unmatched': json.loads(job.unmatched),
+        'data_set_id': job.data_set_id,
+        'data_set_ids': list(job.document.data_sets.values_list('id', flat=True)),
+        'error': job.error,
+    }
@@ -5,7 +5,8 @@
 
 import csv
 
-from hda_privileged.models import US_State, US_County, Data_Point
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Data_Point
 
 # constants
 
@@ -20,93 +21,138 @@ UPLOAD_FORMAT_CHOICES = [
 ]
 
 
-# Regardless of whether the file was using 5-digit FIPS codes or split ones,
-# the heavy lifting of FIPS code matching is done here: both get_county_2fips
-# and get_county_1fips call this method after extracting the appropriate codes
-# from the CSV rows.
-def get_county_with_fips(state_fips, county_fips):
+class CountyResolver():
     """
+    Finds the county for each row of an uploaded file without another query, using the
+    in-memory geography (see geography.py), which indexes every state and county.
 
-    :param state_fips: eg: '01'
-    :param county_fips: eg: '001'
+    Counties are indexed by their 5-digit FIPS code, and grouped by state so that counties can
+    be matched by name. States are indexed by their 2-digit FIPS code and their full name.
+    Every county has its state instance attached, so reading `county.state` is also free.
 
+    Building a resolver costs no queries once the geography is loaded (and two if it isn't),
+    no matter how many rows are resolved with it.
     """
-    try:
-        state = US_State.objects.get(fips=state_fips)
-        county = state.counties.get(fips=county_fips)
+
+    def __init__(self, geography=None):
+        """
+        :param geography: the Geography to resolve against; by default, the process's
+            (Default value = None)
+
+        """
+        geography = geography or get_geography()
+        self.states_by_fips = geography.states_by_fips
+        self.states_by_name = geography.states_by_name
+        # 5-digit FIPS -> county
+        self.counties_by_fips5 = geography.counties_by_fips5
+        # (state USPS code, county name) -> county
+        self.counties_by_name = geography.counties_by_name
+        # state USPS code -> counties, for partial name matches
+        self.counties_in_state = geography.counties_in_state
+
+    def county_for_fips(self, state_fips, county_fips):
+        """
+        Finds a county from its 2-digit state and 3-digit county FIPS codes
+
+        :param state_fips: eg: '01'
+        :param county_fips: eg: '001'
+        :returns: (US_County, None) or (None, error)
+
+        """
+        county = self.counties_by_fips5.get(state_fips + county_fips, None)
+        if county is None:
+            return (None, {county_fips: state_fips})
         return (county, None)
-    except US_State.DoesNotExist:
-        msg = {county_fips:state_fips}
-        return (None, msg)
-    except US_County.DoesNotExist:
-        msg = {county_fips: state_fips}
-        return (None, msg)
+
+    def county_for_name(self, state_name, county_name):
+        """
+        Finds a county from the full name of its state and the start of its own name
+
+        :param state_name: eg: 'Tennessee'
+        :param county_name: eg: 'Washington' or 'Washington County'
+        :returns: (US_County, None) or (None, error)
+
+        """
+        state = self.states_by_name.get(state_name, None)
+        if state is None:
+            return (None, {county_name: state_name})
+
+        exact = self.counties_by_name.get((state.short, county_name), None)
+        if exact is not None:
+            return (exact, None)
+
+        # can't stop at the first county that starts with the name, because of situations like:
+        # Clay County, GA and Clayton County, GA
+        # a name of 'Clay' would match both of these
+        possible_counties = [c for c in self.counties_in_state[state.short]
+                             if c.name.startswith(county_name)]
+        if len(possible_counties) == 0:
+            return (None, {county_name: state_name})
+        # if we matched a substring of multiple county names, prefer the shortest
+        # as being the most exact
+        return (min(possible_counties, key=lambda c: len(c.name)), None)
+
 
 # Defines functions that can translate a DictReader row into a county model object
 # based on the selected column format. e.g. if 'choice' is 'NAME', we want a
 # function that takes in a DictReader row and uses the state name and county name
-# to query and return a unique US_County instance.
+# to find and return a unique US_County instance.
 # These functions have the signature:
-#     func(row: dict<str, str>): (US_County, None) | (None, String)
+#     func(row: dict<str, str>, resolver: CountyResolver): (US_County, None) | (None, dict)
 # i.e. they return a tuple where either the first member is a county instance,
 # OR the second member is an error message.
+# If no resolver is given, a new one is created - pass one in when reading more than one row!
 
 
-def get_county_with_2fips(row):
+def get_county_with_fips(state_fips, county_fips, resolver=None):
+    """
+
+    :param state_fips: eg: '01'
+    :param county_fips: eg: '001'
+    :param resolver: CountyResolver to look the county up in  (Default value = None)
+
+    """
+    resolver = resolver or CountyResolver()
+    return resolver.county_for_fips(state_fips, county_fips)
+
+
+def get_county_with_2fips(row, resolver=None):
     """
 
     :param row: breaks the combination of state_fips and county_fips into state_fips and county_fips respectively
+    :param resolver: CountyResolver to look the county up in  (Default value = None)
 
     """
     state_fips = row['State']
     county_fips = row['County']
-    return get_county_with_fips(state_fips, county_fips)
+    return get_county_with_fips(state_fips, county_fips, resolver)
 
 
-def get_county_with_1fips(row):
+def get_county_with_1fips(row, resolver=None):
     """
 
     :param row: combination of state_fips and county_fips
+    :param resolver: CountyResolver to look the county up in  (Default value = None)
 
     """
     fips = row['FIPS']
     state_fips = fips[0:2]
     county_fips = fips[2:5]
-    return get_county_with_fips(state_fips, county_fips)
+    return get_county_with_fips(state_fips, county_fips, resolver)
 
 
-def get_county_with_name(row):
+def get_county_with_name(row, resolver=None):
     """
 
     :param row: reads the state and county name
+    :param resolver: CountyResolver to look the county up in  (Default value = None)
 
     """
     state_name = row['State']
     county_name = row['County']
-    try:
-        state = US_State.objects.get(full=state_name)
-    except US_State.DoesNotExist:
-        msg = {county_name: state_name}
-        return (None, msg)
-    # can't use get with startswith for counties, because of situations like:
-    # Clay County, GA and Clayton County, GA
-    # trying to use startswith=Clay will match both of these
-    # county = state.counties.get(name__startswith=county_name)
-    possible_counties = state.counties.filter(name__startswith=county_name)
-    # how do we narrow this down?
-    if possible_counties.count() == 1:
-        return (possible_counties.first(), None)
-    elif possible_counties.count() > 1:
-        # if we matched a substring of multiple  county names, prefer the shortest as being
-        # the most exact; first evaluate the query
-        county_iter = possible_counties.iterator()
-        # sort in ascending order of name length, returning a list
-        shortest_first = sorted(county_iter, key=lambda c: len(c.name))
-        # return the first county (shortest name)
-        return (shortest_first[0], None)
-    else:
-        msg = {county_name: state_name}
-        return (None, msg)
+    resolver = resolver or CountyResolver()
+    return resolver.county_for_name(state_name, county_name)
+
 
 # map choice options to the appropriate function for parsing counties
 UPLOAD_FORMAT_FUNCTIONS = {
@@ -116,7 +162,7 @@ UPLOAD_FORMAT_FUNCTIONS = {
 }
 
 
-def read_data_points_from_file(file, choice, data_set):
+def read_data_points_from_file(file, choice, data_set, resolver=None):
     """Reads all the data points from a CSV file, adding them to the given data set.
 
     :param file: user's selected csv file
@@ -125,6 +171,8 @@ def read_data_points_from_file(file, choice, data_set):
     :param CHOICE_1FIPS: assume there is one column to uniquely identify the county
     :param CHOICE_2FIPS: assume the State and County columns contain 2 FIPS: codes
     :param data_set: a Data_Set model instance
+    :param resolver: CountyResolver to match counties with; one is created if not given
+        (Default value = None)
     :returns: A list of Data_Point model objects, one per row in the CSV file, all pointing to
         the indicated Data_Set instance.
 
@@ -133,13 +181,16 @@ def read_data_points_from_file(file, choice, data_set):
     if not county_getter:
         raise TypeError(f"Choice {choice} did not match to a county parsing function")
 
+    # load every county up front, so reading each row does not need to query the database
+    resolver = resolver or CountyResolver()
+
     unsuccessful_counties_datapoints = {}
     successful_counties_datapoints = []
 
     count = 0
     for row in csv.DictReader(file):
         # read a row
-        (county, error) = county_getter(row)
+        (county, error) = county_getter(row, resolver)
         # handle the results
         if county is not None:
             # if there is no value, do not specify a default here:
@@ -0,0 +1,176 @@
+# Checks an uploaded data file without saving anything.
+#
+# Uploading a file is the only other way to find out that some of its rows don't match a
+# county, and undoing a bad upload means deleting a document, a data set and all of its points.
+# This reads a file the same way an upload would, matching counties in memory with a
+# CountyResolver, and reports every problem it finds (plus some summary statistics for each
+# column of values) without writing to the database.
+
+import csv
+import time
+
+import numpy as np
+
+from hda_privileged.chr_reading import (
+    CHOICE_CHR,
+    INPUT_COUNTY_HEADER,
+    INPUT_STATE_HEADER,
+    is_all_zero,
+    value_header
+)
+from hda_privileged.ingest import MAX_NON_NUMERIC
+from hda_privileged.upload_reading import UPLOAD_FORMAT_FUNCTIONS, CountyResolver
+
+# column holding values in the single-value upload formats
+VALUE_HEADER = 'Value'
+
+
+def summarize(values):
+    """
+    Calculates summary statistics for a column of values
+
+    :param values: sequence of floats
+    :returns: dict of statistic name -> value (empty if there are no values)
+
+    """
+    if len(values) == 0:
+        return dict()
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        'count': int(arr.size),
+        'min': float(arr.min()),
+        'max': float(arr.max()),
+        'mean': float(arr.mean()),
+        'median': float(np.median(arr)),
+        'std': float(arr.std()),
+    }
+
+
+class ValidationReport():
+    """
+    Everything wrong with a data file (and a summary of what is right with it)
+    """
+
+    def __init__(self):
+        # rows read from the file, not counting the header
+        self.rows = 0
+        # rows matched to a county
+        self.matched = 0
+        # rows matched to a county, but without a value in at least one column
+        self.blank = 0
+        # {county: state} for rows that could not be matched to a county
+        self.unmatched = dict()
+        # {'County, ST': number of rows} for counties matched by more than one row
+        self.duplicates = dict()
+        # (line number, column, value) for values that are not numbers
+        self.non_numeric = []
+        # {column: summary statistics} for each column of values
+        self.summaries = dict()
+        # wall-clock time taken
+        self.seconds = 0.0
+
+    @property
+    def is_valid(self):
+        """True if every row can be uploaded as-is"""
+        return not (self.unmatched or self.duplicates or self.non_numeric)
+
+    def as_dict(self):
+        """
+        Returns the report as a dictionary that can be serialized as JSON
+        """
+        return {
+            'valid': self.is_valid,
+            'rows': self.rows,
+            'matched': self.matched,
+            'blank': self.blank,
+            'unmatched': self.unmatched,
+            'duplicates': self.duplicates,
+            'non_numeric': [
+                {'line': line, 'column': column, 'value': value}
+                for (line, column, value) in self.non_numeric
+            ],
+            'summaries': self.summaries,
+            'seconds': self.seconds,
+        }
+
+    def __str__(self):
+        return (f"Checked {self.rows} rows in {self.seconds:.3f}s: {self.matched} matched, "
+                f"{self.blank} with blank values, {len(self.unmatched)} unmatched, "
+                f"{len(self.duplicates)} duplicate counties, "
+                f"{len(self.non_numeric)} non-numeric values")
+
+
+def _check_values(report, line, row, headers, columns):
+    for header in headers:
+        value_str = row.get(header, None)
+        if not value_str:
+            report.blank += 1
+            continue
+        try:
+            columns[header].append(float(value_str))
+        except ValueError:
+            if len(report.non_numeric) < MAX_NON_NUMERIC:
+                report.non_numeric.append((line, header, value_str))
+
+
+def validate_data_file(file, choice, measure_ids=None, resolver=None):
+    """
+    Reads a data file the way an upload would, and reports the rows that could not be saved.
+    Nothing is written to the database.
+
+    :param file: open CSV file (text mode), or any iterable of lines
+    :param choice: one of the choice codes from UPLOAD_FORMAT_CHOICES, or CHOICE_CHR
+    :param measure_ids: for CHR files, the integer measure IDs to check  (Default value = None)
+    :param resolver: CountyResolver to match counties with  (Default value = None)
+    :returns: ValidationReport
+
+    """
+    start = time.perf_counter()
+    report = ValidationReport()
+    resolver = resolver or CountyResolver()
+
+    if choice == CHOICE_CHR:
+        headers = [value_header(mid) for mid in (measure_ids or [])]
+    elif choice in UPLOAD_FORMAT_FUNCTIONS:
+        headers = [VALUE_HEADER]
+        county_getter = UPLOAD_FORMAT_FUNCTIONS[choice]
+    else:
+        raise TypeError(f"Choice {choice} did not match to a county parsing function")
+
+    reader = csv.DictReader(file)
+    missing = [h for h in headers if h not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"File has no column(s): {', '.join(missing)}")
+
+    columns = {header: [] for header in headers}
+    rows_per_county = dict()
+
+    # line 1 is the header
+    for (line, row) in enumerate(reader, start=2):
+        report.rows += 1
+        if choice == CHOICE_CHR:
+            state_fips = row[INPUT_STATE_HEADER]
+            county_fips = row[INPUT_COUNTY_HEADER]
+            # state and national aggregate rows are skipped by an upload too
+            if is_all_zero(state_fips) or is_all_zero(county_fips):
+                continue
+            (county, error) = resolver.county_for_fips(state_fips, county_fips)
+        else:
+            (county, error) = county_getter(row, resolver)
+
+        if county is None:
+            if error is not None:
+                report.unmatched.update(error)
+            continue
+
+        report.matched += 1
+        rows_per_county[county] = rows_per_county.get(county, 0) + 1
+        _check_values(report, line, row, headers, columns)
+
+    report.duplicates = {
+        f"{county.name}, {county.state.short}": count
+        for (county, count) in rows_per_county.items() if count > 1
+    }
+    report.summaries = {header: summarize(values) for (header, values) in columns.items()}
+    report.seconds = time.perf_counter() - start
+    return report
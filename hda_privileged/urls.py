@@ -33,6 +33,10 @@ urlpatterns = [
     path('upload/',
          login_required(views.UploadNewDataView.as_view()),
          name='uploadData'),
+    # upload job progress (JSON, polled by the upload page)
+    path('upload/job/<int:job_id>/',
+         login_required(views.UploadJobStatusView.as_view()),
+         name='uploadJobStatus'),
     # login
     path('login/',
          LoginView.as_view(template_name='hda_privileged/login.html', ),
@@ -0,0 +1,117 @@
+# Columnar storage for the points of a data set.
+#
+# Every Data_Point is a row of its own, so reading a whole state's points (for a chart) means
+# building a model instance per county. A data set's points can also be stored as a few packed
+# arrays (see Data_Set_Columns): the 5-digit FIPS code, county ID, value and rank of every
+# point, in order of FIPS code. Since a state's counties all share the first two digits of
+# their FIPS code, a state's points are one contiguous slice of those arrays, found with a
+# binary search.
+
+from bisect import bisect_left
+from collections import namedtuple
+
+import numpy as np
+
+# width of a packed FIPS code: 2 digits for the state, 3 for the county
+FIPS5_WIDTH = 5
+
+# one point read out of the columns of a data set
+ColumnRow = namedtuple('ColumnRow', ['county_id', 'fips', 'value', 'rank'])
+
+
+def pack_ints(values):
+    """
+    Packs integers (e.g. county IDs) as little-endian int64s
+
+    :param values: sequence of integers
+    :returns: bytes
+
+    """
+    return np.asarray(values, dtype='<i8').tobytes()
+
+
+def pack_floats(values):
+    """
+    Packs floats (e.g. values or ranks) as little-endian float64s
+
+    :param values: sequence of floats
+    :returns: bytes
+
+    """
+    return np.asarray(values, dtype='<f8').tobytes()
+
+
+def unpack_ints(blob):
+    """
+    Reads integers packed by pack_ints, without copying them
+
+    :param blob: bytes (or memoryview, depending on the database driver)
+    :returns: read-only numpy array
+
+    """
+    return np.frombuffer(blob, dtype='<i8')
+
+
+def unpack_floats(blob):
+    """
+    Reads floats packed by pack_floats, without copying them
+
+    :param blob: bytes (or memoryview, depending on the database driver)
+    :returns: read-only numpy array
+
+    """
+    return np.frombuffer(blob, dtype='<f8')
+
+
+def pack_fips(codes):
+    """
+    Packs 5-digit FIPS codes end to end, as ASCII
+
+    :param codes: sequence of 5-character strings
+    :returns: bytes
+    :raises ValueError: if a code is not 5 characters long
+
+    """
+    for code in codes:
+        if len(code) != FIPS5_WIDTH:
+            raise ValueError(f"FIPS code '{code}' should be {FIPS5_WIDTH} characters long")
+    return ''.join(codes).encode('ascii')
+
+
+def unpack_fips(blob):
+    """
+    Reads FIPS codes packed by pack_fips
+
+    :param blob: bytes (or memoryview, depending on the database driver)
+    :returns: list of 5-character strings
+
+    """
+    text = bytes(blob).decode('ascii')
+    return [text[i:i + FIPS5_WIDTH] for i in range(0, len(text), FIPS5_WIDTH)]
+
+
+def fips_order(codes):
+    """
+    Returns the positions of FIPS codes in sorted order: the order columns are stored in
+
+    :param codes: sequence of FIPS codes
+    :returns: list of indices into codes
+
+    """
+    return sorted(range(len(codes)), key=codes.__getitem__)
+
+
+def prefix_slice(codes, prefix):
+    """
+    Finds the (contiguous) range of sorted FIPS codes that start with a prefix,
+    e.g. the 2-digit FIPS code of a state, or a whole 5-digit county code
+
+    :param codes: sorted list of FIPS codes
+    :param prefix: string to search for
+    :returns: a slice
+
+    """
+    start = bisect_left(codes, prefix)
+    # '~' sorts after every digit, so this is the first code past the prefix
+    stop = bisect_left(codes, prefix + '~', lo=start)
+    return slice(start, stop)
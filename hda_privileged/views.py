@@ -3,7 +3,7 @@ from django.contrib.auth import authenticate, login, get_user, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm, SetPasswordForm
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
@@ -15,12 +15,14 @@ from django.db import transaction
 from django.db.models.deletion import ProtectedError
 # wraps import for custom decorator
 from functools import wraps
+import codecs
 import json
 
 from .forms import LoginForm, UploadNewDataForm, HealthIndicatorForm, NewUserForm, ProfileForm
-from .models import Document, Data_Set, Data_Point, Percentile, Health_Indicator, Profile
-from .percentile import get_percentiles_for_points, assign_percentiles_to_points
-from .upload_reading import read_data_points_from_file
+from .models import Document, Data_Set, Health_Indicator, Profile, Upload_Job
+from .chr_reading import parse_measure_list
+from .upload_jobs import enqueue_upload, job_status
+from .upload_validation import validate_data_file
 
 
 # ------------------------------------------------
@@ -430,43 +432,41 @@ class UploadNewDataView(View):
         doc.save()
         messages.success(request, "Document uploaded successfully")
 
-        # Create and save a Data Set here! ##
-        indicator = form.cleaned_data['indicator']
-        year = form.cleaned_data['year']
-
-        data_set = Data_Set(
-            indicator=indicator,
-            year=year,
-            source_document=doc
+        # Queue the file to be read into a new data set; reading a large file takes too long to
+        # do while the user waits, so the process_upload_jobs command does it in the background
+        job = enqueue_upload(
+            document=doc,
+            indicator=form.cleaned_data['indicator'],
+            year=form.cleaned_data['year'],
+            column_format=form.cleaned_data['column_format'],
+            measures=form.cleaned_data['measures']
         )
+        messages.info(request, f"Queued upload job {job.id}")
 
-        data_set.save()
-
-        format_choice = form.cleaned_data['column_format']
-        doc.file.open(mode='rt')
-        # read_data_points_from_file returns two values: successful_datapoints, and unsuccessful datapoints
-        successful_data_points, invalid_counties_and_states = read_data_points_from_file(doc.file, format_choice,
-                                                                                         data_set)
-        doc.file.close()
-
-        # calculate the percentile-values for this data set
-        percentile_values = get_percentiles_for_points(successful_data_points)
+        return job
 
-        # assign a percentile to each data point
-        assign_percentiles_to_points(successful_data_points, percentile_values)
+    def _validate_file(self, request, form):
+        """
+        Checks the uploaded file for problems, without saving a document or data set
 
-        # transform our list of tuples List<(P, PV)> into a list of Percentile model objects
-        percentile_models = [Percentile(rank=p, value=pv, data_set=data_set) for (p, pv) in percentile_values]
+        :param request: 
+        :param form: 
 
-        # save all the data points and percentile values using bulk_create, for speed
-        Data_Point.objects.bulk_create(successful_data_points)
-        Percentile.objects.bulk_create(percentile_models)
-        #
+        """
+        myfile = self._get_uploaded_file(request)
+        measure_ids = [mid for (mid, _) in parse_measure_list(form.cleaned_data['measures'])]
 
-        # This is mostly for debugging, but it's a useful example of using the messages API
-        messages.info(request, f"Indicator was {indicator!s}")
+        # the file is read straight out of the upload; it is never saved to disk
+        lines = codecs.iterdecode(myfile, 'utf-8')
+        try:
+            report = validate_data_file(lines, form.cleaned_data['column_format'], measure_ids)
+        except (ValueError, UnicodeDecodeError) as exc:
+            messages.warning(request, f"Could not check file: {exc}")
+            return None
 
-        return invalid_counties_and_states
+        if report.is_valid:
+            messages.success(request, "No problems found; uncheck 'Only check the file' to upload it")
+        return report
 
     def get(self, request, *args, **kwargs):
         """
@@ -490,13 +490,35 @@ class UploadNewDataView(View):
         """
         # bind the form
         form = self.form_class(request.POST, request.FILES)
+        job = None
+        report = None
 
         if form.is_valid() and self._check_file_ext(request):
             # Is there a Django-y way of adding more validation?
-            invalid_counties_and_states = self._handle_form_submission(request, form)
+            if form.cleaned_data['validate_only']:
+                report = self._validate_file(request, form)
+            else:
+                job = self._handle_form_submission(request, form)
 
-        return render(request, self.template_name,
-                      {'form': form, 'invalid_counties_and_states': invalid_counties_and_states})
+        return render(request, self.template_name, {'form': form, 'job': job, 'report': report})
+
+
+class UploadJobStatusView(View):
+    """
+    Reports the progress of an upload job as JSON, for the upload page to poll
+    """
+
+    def get(self, request, job_id):
+        """
+
+        :param request: 
+        :param job_id: primary key of an Upload_Job
+
+        """
+        job = Upload_Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return JsonResponse({'error': f"There is no upload job with ID {job_id}"}, status=404)
+        return JsonResponse(job_status(job))
 
 
 class HealthIndicator(TemplateView):
@@ -0,0 +1,23 @@
+# Adds a template tag for linking to the current prefetch bundles (see app_api/util/prefetch.py),
+# whose file names change whenever their content does
+
+from django import template
+
+from app_api.util import prefetch
+
+register = template.Library()
+
+@register.simple_tag
+def prefetch_url(name):
+    """
+    A custom Django template tag for the URL of a prefetch bundle.
+    Usage:
+
+        {% load prefetch %}
+        <script>const counties = "{% prefetch_url 'county' %}";</script>
+
+    :param name: 'county' or 'state'
+    :return: the URL of the current bundle, named by the hash of its content
+    :rtype: str
+    """
+    return prefetch.prefetch_url(name)
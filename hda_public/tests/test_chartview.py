@@ -0,0 +1,40 @@
+from django.test import TestCase
+
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Data_Set, Health_Indicator, US_County
+
+
+class ChartViewCountiesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        indicator = Health_Indicator.objects.create(name='Test Indicator')
+        cls.data_set = Data_Set.objects.create(indicator=indicator, year=2018)
+
+    def setUp(self):
+        # states and counties are read once per process, not counted here
+        get_geography()
+
+    def get_chart(self, fips_codes):
+        return self.client.get(f'/chart/{self.data_set.id}', {'county': ','.join(fips_codes)})
+
+    def test_keeps_order_and_reports_unknown_codes(self):
+        response = self.get_chart(['51059', '99999', '01001', '1', '51059', '00000'])
+        self.assertEqual(response.context['counties'], ['51059', '01001', '51059'])
+        self.assertEqual(response.context['unknown_fips'], '99999, 1, 00000')
+        self.assertNotIn('place_name', response.context)
+
+    def test_single_county(self):
+        response = self.get_chart(['51059'])
+        county = US_County.objects.get(fips5='51059')
+        self.assertEqual(response.context['place_name'], f'{county.name}, VA')
+        self.assertEqual(response.context['parent_state'], 'VA')
+        self.assertNotIn('unknown_fips', response.context)
+
+    def test_query_count_does_not_depend_on_counties(self):
+        few = ['51059']
+        many = list(US_County.objects.filter(state='TX').values_list('fips5', flat=True)[:60]) + ['99999']
+        for fips_codes in (few, many):
+            # the data set and its indicator
+            with self.assertNumQueries(2):
+                self.get_chart(fips_codes)
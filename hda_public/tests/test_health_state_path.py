@@ -0,0 +1,56 @@
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from hda_privileged.geography import get_geography
+from hda_privileged.ingest import ValueColumn, save_value_column
+from hda_privileged.models import Data_Set, Health_Indicator, US_County
+from hda_public.views.location_selection import HealthStatePathView, HealthView
+
+
+class HealthStatePathViewTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # two indicators with points in Texas (254 counties) and Delaware (3 counties),
+        # but only in some of their counties
+        for (name, states) in (('Obesity', ['TX', 'DE']), ('Smoking', ['TX', 'DE']), ('Other', ['TX'])):
+            indicator = Health_Indicator.objects.create(name=name)
+            for year in (2017, 2018):
+                column = ValueColumn()
+                for state in states:
+                    for (i, county) in enumerate(US_County.objects.filter(state=state).order_by('fips')[:2]):
+                        column.append(county.id, float(i))
+                save_value_column(Data_Set.objects.create(indicator=indicator, year=year), column)
+
+    def setUp(self):
+        # loaded once per process, not counted here
+        get_geography()
+
+    def render(self, short):
+        request = RequestFactory().get('/')
+        return HealthStatePathView.as_view()(request, short=short).render()
+
+    def get_indicator_names(self, short):
+        return [indicator.name for indicator in self.render(short).context_data['indicators']]
+
+    def test_every_indicator_in_the_state(self):
+        # not just those of the last county in the state
+        self.assertEqual(self.get_indicator_names('tx'), ['Obesity', 'Other', 'Smoking'])
+        self.assertEqual(self.get_indicator_names('DE'), ['Obesity', 'Smoking'])
+        self.assertEqual(self.get_indicator_names('WY'), [])
+
+    def test_query_count_does_not_depend_on_counties(self):
+        # only the indicators; the state and its counties are in memory
+        for short in ('TX', 'DE', 'WY'):
+            with self.assertNumQueries(1):
+                self.render(short)
+
+    def test_unknown_state(self):
+        with self.assertRaises(Http404):
+            self.render('ZZ')
+        self.assertEqual(self.client.get('/select/ZZ').status_code, 404)
+
+    def test_health_view_unknown_county(self):
+        request = RequestFactory().get('/')
+        with self.assertRaises(Http404):
+            HealthView.as_view()(request, short='de', fips='999')
@@ -0,0 +1,64 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from hda_privileged.models import Health_Indicator
+from hda_public.views.location_selection import HealthView
+from hda_public.views.overview import IndicatorOverviewBase
+
+
+class OverviewSeriesTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('load_random_data_set', stdout=StringIO())
+        Health_Indicator.objects.update(important=True)
+
+    def test_links_bundled_series(self):
+        response = self.client.get('/state/AL')
+        self.assertEqual(response.context['overview_series_url'], '/api/chart/overview/?state=AL')
+        self.assertNotContains(response, 'id="overview-series"')
+
+    def test_embeds_bundled_series(self):
+        with mock.patch.object(IndicatorOverviewBase, 'embed_chart_series', True):
+            response = self.client.get('/county/AL/001')
+        charts = response.context['overview_series']['charts']
+        self.assertEqual(len(charts), 1)
+        self.assertEqual(charts[0]['data_set_id'], response.context['important_indicators'][0]['data_set_id'])
+        self.assertContains(response, 'id="overview-series"')
+
+
+class AvailabilityTestCase(TestCase):
+    # pages find the data sets for a place from Data_Set_State and Data_Set_County,
+    # without reading the (large) data point table
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('load_random_data_set', '--count', '100', stdout=StringIO())
+
+    def assertNoDataPointQueries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        self.assertFalse([q['sql'] for q in queries if 'hda_privileged_data_point' in q['sql']])
+        return result
+
+    def test_state_overview(self):
+        response = self.assertNoDataPointQueries(lambda: self.client.get('/state/AL'))
+        self.assertEqual(len(response.context['all_indicators']), 1)
+        # the random data set only covers the first 100 counties
+        response = self.client.get('/state/WY')
+        self.assertEqual(response.context['all_indicators'], [])
+
+    def test_county_overview(self):
+        response = self.assertNoDataPointQueries(lambda: self.client.get('/county/AL/001'))
+        self.assertEqual(len(response.context['all_indicators']), 1)
+
+    def test_health_view(self):
+        view = HealthView.as_view()
+        request = RequestFactory().get('/')
+        response = self.assertNoDataPointQueries(lambda: view(request, short='al', fips='001').render())
+        self.assertEqual(len(response.context_data['indicators']), 1)
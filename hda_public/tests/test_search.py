@@ -0,0 +1,45 @@
+from django.test import RequestFactory, TestCase
+
+from app_api.util import search
+from hda_public.views.searchview import SearchView
+
+
+class SearchViewTestCase(TestCase):
+
+    def setUp(self):
+        # built once per process, not counted here
+        search.get_search_indexes()
+
+    def get_context(self, **query):
+        request = RequestFactory().get('/search/', query)
+        with self.assertNumQueries(0):
+            return SearchView.as_view()(request).render().context_data
+
+    def test_misspelled_county(self):
+        context = self.get_context(query='Montgommery')
+        names = {county.name for county in context['counties']}
+        self.assertEqual(names, {'Montgomery County'})
+        self.assertEqual(len(context['counties']), 18)
+        self.assertIsNone(context['next_page'])
+
+    def test_ranked_by_length(self):
+        counties = self.get_context(query='fairfax va')['counties']
+        self.assertEqual([c.search_str for c in counties], ['Fairfax city VA', 'Fairfax County VA'])
+
+    def test_states(self):
+        states = self.get_context(query='carolina')['states']
+        self.assertEqual([s.short for s in states], ['NC', 'SC'])
+        self.assertEqual([s.short for s in self.get_context(query='va')['states']], ['VA'])
+
+    def test_paging(self):
+        first = self.get_context(query='county')
+        self.assertEqual(len(first['counties']), SearchView.page_size)
+        self.assertEqual(first['next_page'], 2)
+        self.assertIsNone(first['previous_page'])
+
+        second = self.get_context(query='county', page='2')
+        self.assertEqual(second['previous_page'], 1)
+        self.assertFalse(set(first['counties']) & set(second['counties']))
+
+    def test_empty_query(self):
+        self.assertIn('error', self.get_context(query=''))
@@ -6,7 +6,8 @@
 from django.contrib import messages
 from django.views.generic import TemplateView
 
-from hda_privileged.models import US_State, US_County, Data_Set
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Data_Set
 
 
 class ChartView(TemplateView):
@@ -74,31 +75,25 @@ class ChartView(TemplateView):
 
     def try_get_state(self, usps):
         """
-        Attempt to query a specific US_State from the data model, returning None if it is missing
+        Attempt to find a specific US_State (in the in-memory geography), returning None if it is missing
 
         :param usps: ID of the state to retrieve, a 2-letter USPS code
         :type usps: str
         :return: the US_State matching the given USPS code
         :rtype: US_State | None
         """
-        try:
-            return US_State.objects.get(short=usps.upper())
-        except US_State.DoesNotExist:
-            return None
+        return get_geography().get_state(usps)
 
     def try_get_county(self, full_fips):
         """
-        Attempt to query a specific county from the data model, returning None if it is missing
+        Attempt to find a specific county (in the in-memory geography), returning None if it is missing
 
         :param full_fips: a 5-digit FIPS code for a county or county-equivalent
         :type full_fips: str
-        :return: the county matching the given FIPS code
+        :return: the county matching the given FIPS code, with its state attached
         :rtype: US_County | None
         """
-        try:
-            return US_County.objects.get(fips5=full_fips)
-        except US_County.DoesNotExist:
-            return None
+        return get_geography().get_county(full_fips)
 
     def state_request_decorator(self, context):
         """
@@ -143,7 +138,7 @@ class ChartView(TemplateView):
             # all counties chart to county selection page: Kim Hawkins
             context['current_state'] = state.short
             context['counties'] = [
-                county.fips5 for county in state.counties.all().iterator()]
+                county.fips5 for county in get_geography().get_counties(state.short)]
             return (context, True)
 
     def county_request_decorator(self, context):
@@ -153,7 +148,7 @@ class ChartView(TemplateView):
         key 'counties'.
 
         The 'county' query string should be a comma-separated list of 5-digit FIPS codes. This
-        function queries for each of these FIPS codes to determine if that county actual exists
+        function checks all of these FIPS codes at once to determine which counties actually exist
         in the data model. FIPS codes which do not match a county object are concatenated into
         a string which is added to the context under the 'unknown_fips' key, and to the messages
         framework at the 'warning' level.
@@ -182,12 +177,10 @@ class ChartView(TemplateView):
             return (context, True)
 
         fips_list = fips_str.split(',')
-        # list of pairs, (FIPs, County or None)
-        query_results = [(fips, self.try_get_county(fips)) for fips in fips_list]
-        # list of County
-        counties = [county for (_, county) in query_results if county is not None]
-        # list of FIPs that did not match a county
-        missing = [fips for (fips, county) in query_results if county is None]
+        # every code is checked at once against the in-memory geography, rather than with a
+        # query per code: the counties that matched (with their states attached, for the
+        # single county title below), and the codes that did not, both in the requested order
+        (counties, missing) = get_geography().get_counties_for_fips(fips_list)
 
         # include context for invalid/unknown FIPS codes
         if len(missing) > 0:
@@ -1,7 +1,23 @@
+from django.http import Http404
 from django.views.generic import TemplateView, ListView
 
+from hda_privileged.geography import get_geography
 from hda_privileged.models import US_State, US_County, Health_Indicator
 
+
+def get_state_or_404(short):
+    """
+    Looks up a state in the in-memory geography, raising Http404 if there is no such state
+
+    :param short: USPS code of the state, in any case
+
+    """
+    state = get_geography().get_state(short)
+    if state is None:
+        raise Http404(f"No state {short}")
+    return state
+
+
 class StateView(ListView):
     template_name = 'hda_public/state_list.html'
     paginate_by = '15'
@@ -30,7 +46,7 @@ class CountyView(ListView):
         state_short_name = self.kwargs.get('short', None)
 
         if state_short_name is not None:
-            context['state'] = US_State.objects.filter(short=state_short_name).first().full
+            context['state'] = get_state_or_404(state_short_name).full
             context['state_short_name'] = state_short_name
 
         return context
@@ -40,8 +56,9 @@ class CountyView(ListView):
         counties = None
 
         if state_short_name is not None:
-            associated_state = US_State.objects.filter(short=state_short_name).first()
-            counties = associated_state.counties.order_by('name')
+            state = get_state_or_404(state_short_name)
+            counties = sorted(get_geography().get_counties(state.short),
+                              key=lambda county: county.name)
 
         return counties
 
@@ -69,17 +86,17 @@ class HealthView(TemplateView):
 
         if fips is not None and state_short is not None:
             # get the state the user wants
-            state = US_State.objects.get(short=state_short.upper())
+            state = get_state_or_404(state_short)
             # get the county the user wants
-            county = state.counties.get(fips=fips)
-            # make a list of every data set containing a data point connected to this county,
-            # by starting with the county's data points and going backwards.
-            # the 'select_related' does *not* affect the result of the query, only how many database queries are required.
-            available_data_sets = [dp.data_set for dp in county.data_points.all().select_related('data_set')]
-            # several data sets may be for the same indicator (perhaps different datasets for different years).
-            # this extracts the indicator from each dataset into a list, then puts that list into a python set object,
-            # which can remove the duplicates for us.
-            unique_indicators = set([ds.indicator for ds in available_data_sets])
+            county = get_geography().get_county(state.fips + fips)
+            if county is None:
+                raise Http404(f"No county {fips} in {state.short}")
+            # every indicator with a data set that has a point for this county, from the
+            # data sets' recorded counties (see Data_Set_County) rather than their data points
+            unique_indicators = (Health_Indicator.objects
+                                 .filter(data_sets__counties__county=county)
+                                 .distinct()
+                                 .order_by('name'))
             # pack up the context - including whole objects so we can use multiple properties in the template
             context['state'] = state
             context['county'] = county
@@ -103,20 +120,15 @@ class HealthStatePathView(TemplateView):
         # user selected state from dashboard
         if state_short is not None:
             # get the state the user wants
-            chosen_state = US_State.objects.get(short=state_short.upper())
-            counties = US_County.objects.filter(state=chosen_state)
-            for county in counties:
-                dp = county.data_points
-            # make a list of every data set containing a data point connected to counties in this state,
-            # by starting with the county data points and going backwards.
-            # the 'select_related' does *not* affect the result of the query, only how many database queries are required.
-            available_data_sets = [
-                dp.data_set for dp in county.data_points.all().select_related('data_set')]
-            # several data sets may be for the same indicator (perhaps different datasets for different years).
-            # this extracts the indicator from each dataset into a list, then puts that list into a python set object,
-            # which can remove the duplicates for us.
-            unique_indicators = set(
-                [ds.indicator for ds in available_data_sets])
+            chosen_state = get_state_or_404(state_short)
+            counties = get_geography().get_counties(chosen_state.short)
+            # every indicator with a data set that has a point in any of the state's counties,
+            # in one query on the data sets' recorded states (see Data_Set_State), however
+            # many counties the state has
+            unique_indicators = (Health_Indicator.objects
+                                 .filter(data_sets__states__state=chosen_state)
+                                 .distinct()
+                                 .order_by('name'))
             # pack up the context - including whole objects so we can use multiple properties in the template
             context['state'] = chosen_state
             context['county'] = counties
@@ -14,7 +14,9 @@ from django.shortcuts import render, redirect
 from django.urls import reverse, reverse_lazy
 from django.db.models import Count
 
-from hda_privileged.models import US_State, US_County, Health_Indicator, Data_Set, Data_Point
+from app_api.views.overview import OverviewSeries
+from hda_privileged.geography import get_geography
+from hda_privileged.models import Health_Indicator, Data_Set
 
 from util.collections import index_selector, group_by_selector
 
@@ -29,6 +31,10 @@ class IndicatorOverviewBase(View):
     Note that this subclasses View, not TemplateView!
     """
 
+    # put the series for every small chart in the page itself, rather than having the page
+    # request them (in one request, from the overview series endpoint) after it loads
+    embed_chart_series = False
+
     def handle_missing_parameter(self):
         return redirect('unknown_location')
 
@@ -59,6 +65,15 @@ class IndicatorOverviewBase(View):
         """
         pass
 
+    def get_overview_series(self):
+        """
+        Builds the same payload as the overview series endpoint, for embedding in the page
+        :return: the series for every small chart
+        :rtype: dict
+        """
+        (key, _, value) = self.get_chart_location_parameter().partition('=')
+        return OverviewSeries().build_series(**{key: value})
+
     def get(self, request, *args, **kwargs):
         # every data set related to the requested location
         data_set_meta = self.get_related_data_sets().values('id', 'year', 'indicator')
@@ -113,6 +128,9 @@ class IndicatorOverviewBase(View):
         context['important_indicators'] = important_indicator_context
         context['place_name'] = self.get_place_name()
         context['place_query_string'] = self.get_chart_location_parameter()
+        context['overview_series_url'] = f"{reverse('api:chart_overview')}?{context['place_query_string']}"
+        if self.embed_chart_series:
+            context['overview_series'] = self.get_overview_series()
 
         return render(request, 'hda_public/overview.html', context=context)
 
@@ -131,23 +149,19 @@ class IndicatorOverviewCounty(IndicatorOverviewBase):
         return f"{county_name}, {state_name}"
 
     def get_related_data_sets(self):
-        # get all the data points this county is in:
-        dps = self.county.data_points.all()
-        # then get all the data sets that have one of those data points:
-        return Data_Set.objects.filter(data_points__in=dps)
+        # every data set recorded as having a point for this county
+        return Data_Set.objects.filter(counties__county=self.county)
 
     def get(self, request, state=None, county=None):
         if state is None or county is None:
             return self.handle_missing_parameter()
 
-        try:
-            self.state = US_State.objects.get(pk=state.upper())
-        except US_State.DoesNotExist:
+        self.state = get_geography().get_state(state)
+        if self.state is None:
             return self.handle_missing_parameter()
 
-        try:
-            self.county = self.state.counties.get(fips=county)
-        except US_County.DoesNotExist:
+        self.county = get_geography().get_county(self.state.fips + county)
+        if self.county is None:
             return self.handle_missing_parameter()
 
         return super(IndicatorOverviewCounty, self).get(request)
@@ -165,20 +179,16 @@ class IndicatorOverviewState(IndicatorOverviewBase):
         return f"{self.state.full}"
 
     def get_related_data_sets(self):
-        # get all the counties in the state:
-        counties = self.state.counties.all()
-        # get all the data points that point at one of the counties:
-        dps = Data_Point.objects.filter(county__in=counties)
-        # then get all the data sets that have one of those data points:
-        return Data_Set.objects.filter(data_points__in=dps)
+        # every data set recorded as having a point in one of the state's counties
+        # (see Data_Set_State), rather than searching every data point
+        return Data_Set.objects.filter(states__state=self.state)
 
     def get(self, request, state=None):
         if state is None:
             return self.handle_missing_parameter()
 
-        try:
-            self.state = US_State.objects.get(pk=state.upper())
-        except US_State.DoesNotExist:
+        self.state = get_geography().get_state(state)
+        if self.state is None:
             return self.handle_missing_parameter()
 
         return super(IndicatorOverviewState, self).get(request)
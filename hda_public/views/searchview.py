@@ -1,25 +1,29 @@
-
 from django.views.generic import TemplateView
 
-from hda_privileged.models import US_County, US_State
+from app_api.util import search
 
 class SearchView(TemplateView):
     template_name = 'hda_public/search_results.html'
 
-    def find_county_results(self, query):
-        # Orders results first by state, then by name. This does not put the most relevant result
-        # first, but groups results from the same state together, which may make them easier to scan through?
-        matches = US_County.objects.filter(search_str__icontains=query).order_by('state', 'name')
-        # truncate to no more than 100 results!
-        return list(matches.iterator())[:100]
-
-    def find_state_results(self, query):
-        name_matches = US_State.objects.filter(full__istartswith=query)
-        abbrv_matches = US_State.objects.filter(short__istartswith=query)
-        name_set = set(name_matches.iterator())
-        abbrv_set = set(abbrv_matches.iterator())
-        all_set = name_set | abbrv_set  # set union
-        return sorted(all_set, key=lambda s: s.full)
+    # results per page (?page=2 for the next ones)
+    page_size = 100
+
+    def find_county_results(self, query, limit=None, offset=0):
+        # Ranks results by how many typos the query has to have (so "Montgommery" still finds
+        # Montgomery County), then by how little of the county's name the query leaves out.
+        # The index only ranks as many results as the page needs.
+        (counties, _) = search.get_search_indexes()
+        return counties.search(query, limit or self.page_size, offset)
+
+    def find_state_results(self, query, limit=None, offset=0):
+        (_, states) = search.get_search_indexes()
+        return states.search(query, limit or self.page_size, offset)
+
+    def get_page(self):
+        try:
+            return max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            return 1
 
     def get_context_data(self, **kwargs):
         context = super(SearchView, self).get_context_data(**kwargs)
@@ -32,7 +36,16 @@ class SearchView(TemplateView):
 
         context['query'] = query_str
 
-        context['counties'] = self.find_county_results(query_str)
-        context['states'] = self.find_state_results(query_str)
+        # one extra result of each, to tell whether there is a next page
+        page = self.get_page()
+        offset = (page - 1) * self.page_size
+        counties = self.find_county_results(query_str, self.page_size + 1, offset)
+        states = self.find_state_results(query_str, self.page_size + 1, offset)
+
+        context['counties'] = counties[:self.page_size]
+        context['states'] = states[:self.page_size]
+        context['page'] = page
+        context['previous_page'] = page - 1 if page > 1 else None
+        context['next_page'] = page + 1 if max(len(counties), len(states)) > self.page_size else None
 
         return context
@@ -103,6 +103,73 @@ LOGIN_URL = 'priv:login'
 LOGIN_REDIRECT_URL = 'priv:dashboard1'
 
 
+###########################################################
+# Data uploads
+
+# How many data points are inserted per query when saving an uploaded data set
+UPLOAD_BATCH_SIZE = 1000
+
+# How long (in seconds) a running upload job can go without saving its progress before the
+# worker that claimed it is assumed to have died, and the job is queued again. Saving a data set
+# reports no progress until it is done, so this must be longer than the biggest upload takes.
+UPLOAD_JOB_STALE_AFTER = 60 * 60
+
+# How many times an upload job is claimed before it is failed instead of queued again
+UPLOAD_JOB_MAX_ATTEMPTS = 3
+
+
+###########################################################
+# Geography
+
+# Load every state and county into memory when the site starts (see hda_privileged/geography.py),
+# rather than on the first request that needs them. Each process loads its own copy as it loads
+# the app (under mod_wsgi, when a daemon process imports wsgi.py), so no request waits for it.
+GEOGRAPHY_PRELOAD = False
+
+
+###########################################################
+# Chart API
+
+# How long (in seconds) browsers and caches may reuse a chart series response before checking
+# whether it changed. Data sets do not change after they are uploaded, so this can be long.
+CHART_CACHE_MAX_AGE = 60 * 60 * 24
+
+# Built chart series are also cached on the server (see app_api/chart_cache.py), in this cache.
+CHART_CACHE_ALIAS = 'default'
+
+# The cache is kept in files, so every process (each mod_wsgi process and the upload worker)
+# shares one copy without running a cache server. A data set has about 60 cached series (its
+# percentile curves, and the compact points of each state, along with lists of counties), so
+# this has room for several hundred data sets; Django's default of 300 entries would be full
+# after a handful. When it is full, a third of the entries are removed.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/var/tmp/hda_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
+
+# How long (in seconds) built chart series are kept on the server
+CHART_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Whether chart cache hits and misses are counted, for sizing the cache (reported to staff at
+# /api/chart/cache/stats/). Counting costs a cache round trip per request, so turn it on only
+# while sizing the cache. (With a local memory cache, as in development, each process counts
+# only its own requests.)
+CHART_CACHE_COUNT_HITS = False
+
+# Decimal places values are rounded to in compact chart series (?format=compact), unless the
+# request asks for something else with ?digits=
+CHART_COMPACT_DIGITS = 3
+
+# Number of points the percentile curves of small (overview page) charts are drawn with; the
+# full curve has 999, far more than a small chart has pixels
+CHART_SMALL_RESOLUTION = 100
+
+
 STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [str(ROOT_PATH / 'static')]
@@ -34,3 +34,14 @@ STATICFILES_DIRS = [
 # to and  served from a 'media' folder in the project root
 # (so add that to .gitignore!)
 MEDIA_ROOT = str(ROOT_PATH / 'media')
+
+# keep cached chart series in memory while developing (and testing), so they are never left over
+# from an earlier run, with as much room as the deployed cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+        },
+    }
+}
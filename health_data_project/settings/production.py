@@ -28,3 +28,6 @@ DATABASES = {
 # left it here once I got something working
 STATIC_ROOT = str(ROOT_PATH / 'wwwstatic')
 MEDIA_ROOT = str(ROOT_PATH / 'wwwmedia')
+
+# load states and counties as each mod_wsgi process starts, rather than during its first request
+GEOGRAPHY_PRELOAD = True
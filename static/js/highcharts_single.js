@@ -127,6 +127,43 @@ var SingleChart = (function(context, Highcharts) {
         }
     };
 
+    // county prefetch data, by URL, for naming the points of compact series (loaded at most once)
+    const county_lists = {};
+
+    function loadCountyList(url) {
+        if (!(url in county_lists)) {
+            county_lists[url] = context.fetch(url).then(response => response.json());
+        }
+        return county_lists[url];
+    };
+
+    /**
+     * Turns a series in the compact format (?format=compact) back into a normal Highcharts series
+     * object. Compact series have their points in parallel arrays (x, y and, for data points,
+     * county: the position of each point's county in the county prefetch data).
+     * Series that are not compact are returned as they are.
+     * @param {object} config Series object from a chart series endpoint
+     * @returns {Promise} resolves to a Highcharts series object
+     */
+    function expandSeries(config) {
+        if (config.format !== "compact") {
+            return Promise.resolve(config);
+        }
+        var series = Object.assign({}, config.options);
+        if (!config.county) {
+            series.data = config.x.map((x, i) => [x, config.y[i]]);
+            return Promise.resolve(series);
+        }
+        return loadCountyList(config.county_list).then(counties => {
+            series.data = config.x.map((x, i) => ({
+                x: x,
+                y: config.y[i],
+                name: counties[config.county[i]].name
+            }));
+            return series;
+        });
+    };
+
     /**
      * Uses the Fetch API to request a Highchart's chart series object in JSON format.
      * When the series object is received, adds the series to the chart.
@@ -146,8 +183,9 @@ var SingleChart = (function(context, Highcharts) {
                     throw new Error(response.text());
                 }
             })
-            .then(json => {
-                chart.addSeries(json.config);
+            .then(json => expandSeries(json.config))
+            .then(series => {
+                chart.addSeries(series);
             })
             .catch(error => {
                 // TODO: display to our user that something went wrong,
@@ -208,10 +246,53 @@ var SingleChart = (function(context, Highcharts) {
         );
     };
 
+    /**
+     * Creates a group of small charts, then loads the series for all of them at once from the
+     * overview series API endpoint (or from the same payload, embedded in the page).
+     * @param {string} chart_id_prefix Each chart goes in the element with ID prefix + data set ID
+     * @param {number[]} data_set_ids IDs of the data sets to chart
+     * @param {string|object} overview_data URL to load every series from, or the loaded JSON
+     */
+    function init_small_group(chart_id_prefix, data_set_ids, overview_data) {
+        var charts = {};
+        data_set_ids.forEach(data_set_id => {
+            charts[data_set_id] = new Highcharts.chart(chart_id_prefix + data_set_id, base_config_small);
+            charts[data_set_id].showLoading();
+        });
+
+        var request = (typeof overview_data === "string")
+            ? context.fetch(overview_data).then(response => {
+                if (response.ok) {
+                    return response.json();
+                } else {
+                    throw new Error(response.text());
+                }
+            })
+            : Promise.resolve(overview_data);
+
+        request
+            .then(json => {
+                json.charts.forEach(series => {
+                    var chart = charts[series.data_set_id];
+                    if (chart) {
+                        chart.addSeries(series.percentiles);
+                        chart.addSeries(series.points);
+                    }
+                });
+            })
+            .catch(error => {
+                context.console.log(error);
+            })
+            .finally(() => {
+                Object.keys(charts).forEach(data_set_id => charts[data_set_id].hideLoading());
+            });
+    };
+
     // Exports: contains the members that will be made available from this module
     return {
         large: init_large,
-        small: init_small
+        small: init_small,
+        smallGroup: init_small_group
     };
 
 }(this, Highcharts)); // inject our dependencies. 'this' should be 'window'
@@ -9,6 +9,12 @@ var TypeaheadSetup = (function() {
             return datum.id;
         }
 
+        // the county prefetch data is in FIPS code order, so suggestions are put back in
+        // state and name order
+        function compare_counties(a, b) {
+            return a.state.localeCompare(b.state) || a.name.localeCompare(b.name);
+        }
+
         function make_header(title) {
             return "<h3 class='suggestion-category'>" + title + "</h3>";
         }
@@ -25,6 +31,7 @@ var TypeaheadSetup = (function() {
             queryTokenizer: Bloodhound.tokenizers.whitespace,
             datumTokenizer: get_tokens,
             identify: get_id,
+            sorter: compare_counties,
             prefetch: config.prefetch.county,
             remote: {
                 url: config.remote.county,